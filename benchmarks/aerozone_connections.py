@@ -0,0 +1,195 @@
+"""
+Benchmark for the aerozone `/connection/all` listing.
+
+    python benchmarks/aerozone_connections.py [--links 10000] [--repeat 3]
+
+Fills an in-memory SQLite database (or `--url`) with `--links` partner-email
+links (10 per partner), then times the previous listing (joinedload of the
+link objects plus two `session.get()` per link) against the single projected
+SELECT the endpoint uses now (best of `--repeat` runs, each in a fresh
+session). The aerozone models are disabled in database/models.py, so the
+tables are declared here. Exits non-zero if the two listings differ.
+"""
+
+import argparse
+import time
+from enum import Enum
+from typing import Optional
+
+from sqlalchemy.orm import joinedload
+from sqlmodel import (
+    Field,
+    Relationship,
+    Session,
+    SQLModel,
+    case,
+    create_engine,
+    select,
+)
+
+
+class EmailType(str, Enum):
+    to = "to"
+    cc = "cc"
+
+
+class PartnerEmailLink(SQLModel, table=True):
+    __tablename__ = "partner_email_link"
+
+    partner_id: Optional[int] = Field(
+        default=None, foreign_key="partners.id", primary_key=True
+    )
+    email_id: Optional[int] = Field(
+        default=None, foreign_key="partner_emails.id", primary_key=True
+    )
+
+    partner: Optional["Partner"] = Relationship()
+    email: Optional["PartnerEmail"] = Relationship()
+
+
+class Partner(SQLModel, table=True):
+    __tablename__ = "partners"
+
+    id: int | None = Field(default=None, primary_key=True)
+    name: str = Field(max_length=255, nullable=False)
+    tax_number: str = Field(max_length=32, nullable=False, index=True)
+
+
+class PartnerEmail(SQLModel, table=True):
+    __tablename__ = "partner_emails"
+
+    id: int | None = Field(default=None, primary_key=True)
+    email: str = Field(max_length=255, nullable=False)
+    type: EmailType = Field(nullable=False)
+
+
+def populate(engine, links: int):
+    partners = max(1, links // 10)
+    with Session(engine) as session:
+        session.add_all(
+            Partner(id=i, name=f"Partner {i % 997:03d}", tax_number=f"{i:08d}-2-41")
+            for i in range(1, partners + 1)
+        )
+        session.add_all(
+            PartnerEmail(
+                id=i,
+                email=f"szamla{i}@example.com",
+                type=EmailType.to if i % 3 else EmailType.cc,
+            )
+            for i in range(1, links + 1)
+        )
+        session.commit()
+        session.add_all(
+            PartnerEmailLink(partner_id=i % partners + 1, email_id=i)
+            for i in range(1, links + 1)
+        )
+        session.commit()
+
+
+def _type_order():
+    return case((PartnerEmail.type == "to", 0), else_=1)
+
+
+def previous_listing(session: Session):
+    statement = (
+        select(PartnerEmailLink)
+        .options(
+            joinedload(PartnerEmailLink.partner), joinedload(PartnerEmailLink.email)
+        )
+        .join(Partner, PartnerEmailLink.partner_id == Partner.id)
+        .join(PartnerEmail, PartnerEmailLink.email_id == PartnerEmail.id)
+        .order_by(Partner.name, _type_order())
+    )
+    result = []
+    for link in session.exec(statement).all():
+        partner = session.get(Partner, link.partner_id)
+        email = session.get(PartnerEmail, link.email_id)
+        result.append(
+            {
+                "partner_id": link.partner_id,
+                "partner_name": partner.name if partner else None,
+                "email_id": link.email_id,
+                "email": email.email if email else None,
+                "type": email.type if email else None,
+            }
+        )
+    return result
+
+
+def projected_listing(session: Session):
+    statement = (
+        select(
+            PartnerEmailLink.partner_id,
+            Partner.name,
+            PartnerEmailLink.email_id,
+            PartnerEmail.email,
+            PartnerEmail.type,
+        )
+        .join(Partner, PartnerEmailLink.partner_id == Partner.id)
+        .join(PartnerEmail, PartnerEmailLink.email_id == PartnerEmail.id)
+        .order_by(
+            Partner.name,
+            _type_order(),
+            PartnerEmailLink.partner_id,
+            PartnerEmailLink.email_id,
+        )
+    )
+    return [
+        {
+            "partner_id": partner_id,
+            "partner_name": partner_name,
+            "email_id": email_id,
+            "email": email,
+            "type": email_type,
+        }
+        for partner_id, partner_name, email_id, email, email_type in session.exec(
+            statement
+        ).all()
+    ]
+
+
+def best_of(engine, fn, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        with Session(engine) as session:
+            start = time.perf_counter()
+            result = fn(session)
+            timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def _sort_key(row):
+    # A régi lekérdezés a név és típus után nem rendezett: összevetéshez kell
+    return (
+        row["partner_name"],
+        row["type"] != "to",
+        row["partner_id"],
+        row["email_id"],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--links", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--url", default="sqlite://")
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    SQLModel.metadata.create_all(engine)
+    populate(engine, args.links)
+
+    previous_seconds, previous = best_of(engine, previous_listing, args.repeat)
+    projected_seconds, projected = best_of(engine, projected_listing, args.repeat)
+
+    print(f"links:     {args.links}")
+    print(f"previous:  {previous_seconds * 1000:8.1f} ms")
+    print(f"projected: {projected_seconds * 1000:8.1f} ms")
+    print(f"speedup:   {previous_seconds / projected_seconds:8.1f}x")
+
+    if sorted(previous, key=_sort_key) != projected:
+        raise SystemExit("A két lista eltér")
+
+
+if __name__ == "__main__":
+    main()
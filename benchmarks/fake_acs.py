@@ -0,0 +1,157 @@
+"""
+Local stand-in for the ACS Email REST API, for exercising EmailDispatcher.
+
+    python benchmarks/fake_acs.py [--messages 40] [--quota-per-minute 120]
+
+Starts the fake on localhost, points an EmailClient at it and sends
+`--messages` small messages through the dispatcher. The fake answers 429 with
+Retry-After above its quota and reports an operation as Succeeded after
+`--delivery-delay` seconds.
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeAcsState:
+    def __init__(self, quota_per_minute: int, delivery_delay: float):
+        self.window_seconds = 60.0
+        self.quota = quota_per_minute
+        self.delivery_delay = delivery_delay
+        self.accepted_at = []
+        self.operations = {}
+        self.throttled = 0
+        self.status_checks = 0
+        self.lock = threading.Lock()
+
+
+def make_handler(state: FakeAcsState):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _json(self, status: int, body: dict, headers: dict = None):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if not self.path.startswith("/emails:send"):
+                return self._json(404, {"error": {"message": "not found"}})
+            now = time.monotonic()
+            with state.lock:
+                state.accepted_at = [
+                    t for t in state.accepted_at if now - t < state.window_seconds
+                ]
+                if len(state.accepted_at) >= state.quota:
+                    state.throttled += 1
+                    retry_after = state.window_seconds - (now - state.accepted_at[0])
+                    return self._json(
+                        429,
+                        {"error": {"code": "TooManyRequests"}},
+                        {"Retry-After": str(max(int(retry_after) + 1, 1))},
+                    )
+                state.accepted_at.append(now)
+                operation_id = self.headers.get("Operation-Id") or str(uuid.uuid4())
+                state.operations.setdefault(operation_id, now)
+            host = self.headers["Host"]
+            self._json(
+                202,
+                {"id": operation_id, "status": "Running"},
+                {
+                    "Operation-Location": f"http://{host}/emails/operations/"
+                    f"{operation_id}?api-version=2025-09-01"
+                },
+            )
+
+        def do_GET(self):
+            operation_id = self.path.split("?")[0].rsplit("/", 1)[-1]
+            with state.lock:
+                state.status_checks += 1
+                created = state.operations.get(operation_id)
+            if created is None:
+                return self._json(404, {"error": {"message": "unknown operation"}})
+            done = time.monotonic() - created >= state.delivery_delay
+            self._json(
+                200,
+                {"id": operation_id, "status": "Succeeded" if done else "Running"},
+            )
+
+    return Handler
+
+
+def start_fake_acs(quota_per_minute: int = 120, delivery_delay: float = 1.0):
+    state = FakeAcsState(quota_per_minute, delivery_delay)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f"http://127.0.0.1:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=40)
+    parser.add_argument("--quota-per-minute", type=int, default=120)
+    parser.add_argument("--delivery-delay", type=float, default=1.0)
+    parser.add_argument("--rate-per-minute", type=float, default=600)
+    parser.add_argument("--burst", type=float, default=10)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    from azure.communication.email import EmailClient
+    from azure.core.credentials import AzureKeyCredential
+
+    from services.email_service import EmailDispatcher, build_email_message
+    from utils.rate_limit import TokenBucket
+
+    server, state, endpoint = start_fake_acs(
+        args.quota_per_minute, args.delivery_delay
+    )
+    # A connection string mindig https-t adna, ezért közvetlenül a http végpont
+    access_key = base64.b64encode(b"fake-access-key").decode()
+    client = EmailClient(endpoint, AzureKeyCredential(access_key))
+    limiter = TokenBucket(args.rate_per_minute / 60, args.burst)
+
+    start = time.perf_counter()
+    with EmailDispatcher(
+        client=client, limiter=limiter, max_workers=args.workers, poll_interval=0.5
+    ) as dispatcher:
+        for i in range(args.messages):
+            message = build_email_message(
+                [f"partner{i}@example.com"], [], f"Teszt {i}", "<p>x</p>", "x", []
+            )
+            dispatcher.submit(f"partner{i}", message)
+        outcomes = dispatcher.wait()
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    statuses = {}
+    for outcome in outcomes:
+        statuses[outcome["status"]] = statuses.get(outcome["status"], 0) + 1
+    print(f"messages:      {args.messages}")
+    print(f"elapsed:       {elapsed:.2f} s")
+    print(f"statuses:      {statuses}")
+    print(f"429 responses: {state.throttled}")
+    print(f"status checks: {state.status_checks}")
+    failed = [o for o in outcomes if o["status"] != "Succeeded"]
+    for outcome in failed[:10]:
+        print(f"  {outcome['key']}: {outcome['status']} {outcome['error']}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Import-time (cold start) benchmark for the app.
+
+    python benchmarks/import_time.py [--module main] [--runs 5] [--top 15]
+
+Runs `python -X importtime -c "import <module>"` in fresh interpreters, then
+prints the median wall time and the slowest modules of the last run. None of
+the DB/Azure env vars are needed: clients are only built on first use.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Ezeknek a könyvtáraknak csak az első feldolgozó/export kérésnél szabad betöltődni
+HEAVY_MODULES = ("pandas", "pdfplumber", "openpyxl", "azure", "msal")
+
+
+def run_once(module: str):
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise SystemExit(completed.stderr)
+    return elapsed, completed.stderr
+
+
+def parse_importtime(output: str):
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    timings = []
+    output = ""
+    for _ in range(args.runs):
+        elapsed, output = run_once(args.module)
+        timings.append(elapsed)
+
+    rows = parse_importtime(output)
+    print(f"import {args.module}: median {statistics.median(timings) * 1000:.0f} ms")
+    print(f"runs: {', '.join(f'{t * 1000:.0f}' for t in timings)} ms\n")
+
+    print(f"{'cumulative [ms]':>16} {'self [ms]':>10}  module")
+    for cumulative_us, self_us, name in sorted(rows, reverse=True)[: args.top]:
+        print(f"{cumulative_us / 1000:16.1f} {self_us / 1000:10.1f}  {name}")
+
+    loaded = {name.strip().split(".")[0] for _, _, name in rows}
+    eager = sorted(loaded.intersection(HEAVY_MODULES))
+    if eager:
+        print(f"\nFigyelem: nehéz könyvtárak importáláskor betöltődtek: {eager}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
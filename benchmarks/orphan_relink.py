@@ -0,0 +1,135 @@
+"""
+Benchmark for relinking orphan invoices when a partner is created.
+
+    python benchmarks/orphan_relink.py [--orphans 20000] [--noise 100000]
+
+Fills an in-memory SQLite database (or `--url`) with `--orphans` uploaded
+invoices without a partner for one tax number, plus `--noise` invoices of
+other tax numbers, then creates the partner twice (in fresh databases): the
+previous way (commit, load every orphan row, set partner_id one by one,
+commit again) and the current one (flush, one UPDATE ... WHERE partner_id IS
+NULL AND partner_tax_id = ?, one commit). The aerozone models are disabled in
+database/models.py, so the tables are declared here. Exits non-zero if the
+two runs link a different number of invoices.
+"""
+
+import argparse
+import time
+
+from sqlalchemy import update
+from sqlmodel import Field, Session, SQLModel, create_engine, func, select
+
+TAX_NUMBER = "12345678-2-41"
+
+
+class Partner(SQLModel, table=True):
+    __tablename__ = "partners"
+
+    id: int | None = Field(default=None, primary_key=True)
+    name: str = Field(max_length=255, nullable=False)
+    tax_number: str = Field(max_length=32, nullable=False, index=True)
+
+
+class UploadedInvoice(SQLModel, table=True):
+    __tablename__ = "uploaded_invoices"
+
+    id: int | None = Field(default=None, primary_key=True)
+    filename: str = Field(nullable=False)
+    partner_tax_id: str | None = Field(default=None, index=True)
+    partner_id: int | None = Field(default=None, foreign_key="partners.id")
+
+
+def build_engine(url: str, orphans: int, noise: int):
+    engine = create_engine(url)
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.exec(
+            UploadedInvoice.__table__.insert(),
+            params=[
+                {
+                    "filename": f"szamla_{i}.pdf",
+                    "partner_tax_id": (
+                        TAX_NUMBER if i < orphans else f"{i % 5000:08d}-2-41"
+                    ),
+                }
+                for i in range(orphans + noise)
+            ],
+        )
+        session.commit()
+    return engine
+
+
+def previous_create(session: Session):
+    partner = Partner(name="Új partner", tax_number=TAX_NUMBER)
+    session.add(partner)
+    session.commit()
+    session.refresh(partner)
+
+    invoices = session.exec(
+        select(UploadedInvoice).where(
+            UploadedInvoice.partner_id == None,
+            UploadedInvoice.partner_tax_id == partner.tax_number,
+        )
+    ).all()
+    for invoice in invoices:
+        invoice.partner_id = partner.id
+    if invoices:
+        session.commit()
+    return partner.id
+
+
+def bulk_create(session: Session):
+    partner = Partner(name="Új partner", tax_number=TAX_NUMBER)
+    session.add(partner)
+    session.flush()
+    session.exec(
+        update(UploadedInvoice)
+        .where(
+            UploadedInvoice.partner_id == None,
+            UploadedInvoice.partner_tax_id == partner.tax_number,
+        )
+        .values(partner_id=partner.id)
+        .execution_options(synchronize_session=False)
+    )
+    session.commit()
+    return partner.id
+
+
+def timed(args, fn):
+    engine = build_engine(args.url, args.orphans, args.noise)
+    with Session(engine) as session:
+        start = time.perf_counter()
+        partner_id = fn(session)
+        elapsed = time.perf_counter() - start
+        linked = session.exec(
+            select(func.count(UploadedInvoice.id)).where(
+                UploadedInvoice.partner_id == partner_id
+            )
+        ).one()
+    return elapsed, linked
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orphans", type=int, default=20000)
+    parser.add_argument("--noise", type=int, default=100000)
+    parser.add_argument("--url", default="sqlite://")
+    args = parser.parse_args()
+
+    previous_seconds, previous_linked = timed(args, previous_create)
+    bulk_seconds, bulk_linked = timed(args, bulk_create)
+
+    print(f"orphans:  {args.orphans} (+{args.noise} other invoices)")
+    print(f"previous: {previous_seconds * 1000:8.1f} ms")
+    print(f"bulk:     {bulk_seconds * 1000:8.1f} ms")
+    print(f"speedup:  {previous_seconds / bulk_seconds:8.1f}x")
+
+    if previous_linked != bulk_linked or bulk_linked != args.orphans:
+        raise SystemExit(
+            f"Eltérő hozzárendelés: {previous_linked} != {bulk_linked} != {args.orphans}"
+        )
+
+
+if __name__ == "__main__":
+    main()
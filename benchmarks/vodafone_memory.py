@@ -0,0 +1,115 @@
+"""
+Memory benchmark for the Vodafone service-charge pipeline.
+
+    python benchmarks/vodafone_memory.py [--lines 50000] [--stage export]
+
+Feeds synthetic "Kiszámlázott díjak" sections (20 items per subscriber)
+through `parse_vodafone_service_charges`, reports the memory the parsed rows
+retain (tracemalloc). `--stage frame` also builds the enriched
+ServiceCharges frame and the Pivot sheet and reports their memory
+(tracemalloc, retained and peak); `--stage export` runs the whole
+`export_vodafone_to_excel_bytes`. Peak RSS is printed last; run each stage in
+a fresh process so the numbers don't mix.
+"""
+
+import argparse
+import gc
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DESCRIPTIONS = [
+    "Havi előfizetési díj",
+    "Belföldi hívások",
+    "Mobilinternet forgalom",
+    "SMS küldés",
+    "Roaming adat",
+]
+TESZOR_CODES = ["61.20.1", "61.20.3", "61.20.4"]
+
+
+def _amount(value: float) -> str:
+    return f"{value:.2f}".replace(".", ",")
+
+
+def synthetic_sections(lines: int, per_section: int = 20):
+    for section in range(lines // per_section):
+        items = [f"Telefonszám: 3630{section:07d}", "Megnevezés TESZOR Nettó ÁFA"]
+        for j in range(per_section):
+            net = 1000 + (section * 7 + j) % 5000
+            items.append(
+                f"{DESCRIPTIONS[j % 5]} {TESZOR_CODES[j % 3]} {_amount(net)} 27% "
+                f"{_amount(net * 0.27)} {_amount(net * 1.27)}"
+            )
+        items.append("Kiszámlázott díjak összesen 0")
+        yield items
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=50000)
+    parser.add_argument("--stage", choices=["rows", "frame", "export"], default="rows")
+    args = parser.parse_args()
+
+    from services.invoice_processor import parse_vodafone_service_charges
+
+    rows = []
+    tracemalloc.start()
+    start = time.perf_counter()
+    for section in synthetic_sections(args.lines):
+        rows.extend(parse_vodafone_service_charges(section))
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"rows:     {len(rows)}, retained {retained / 2**20:.1f} MiB "
+        f"(parse {time.perf_counter() - start:.2f} s under tracemalloc)"
+    )
+
+    mapping_lookup = {
+        (code, "27%"): {"Title": "Mobil", "VatCode": "27", "LedgerAccount": "5"}
+        for code in TESZOR_CODES
+    }
+
+    if args.stage == "frame":
+        import pandas  # noqa: F401  (az import ne számítson bele)
+
+        from utils.excel_export import vodafone_charges_dataframe, vodafone_pivot
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        df = vodafone_charges_dataframe(
+            rows, {}, {code: "Mobil" for code in TESZOR_CODES}, mapping_lookup
+        )
+        pivot = vodafone_pivot(df)
+        elapsed = time.perf_counter() - start
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            f"frame:    {len(df)} rows, {len(pivot)} pivot rows, retained "
+            f"{retained / 2**20:.1f} MiB, peak {peak / 2**20:.1f} MiB "
+            f"({elapsed:.2f} s under tracemalloc)"
+        )
+
+    if args.stage == "export":
+        from utils.excel_export import export_vodafone_to_excel_bytes
+
+        start = time.perf_counter()
+        export_vodafone_to_excel_bytes(
+            {"invoice_number": "0", "invoice_summary": [], "service_charges": rows},
+            {},
+            {code: "Mobil" for code in TESZOR_CODES},
+            mapping_lookup,
+        )
+        print(f"export:   {time.perf_counter() - start:.2f} s")
+
+    peak_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"peak RSS: {peak_kib / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Pivot-sheet benchmark for the Vodafone export.
+
+    python benchmarks/vodafone_pivot.py [--lines 1000 10000 100000] [--repeat 3]
+
+Builds synthetic service-charge rows (about 20 lines per subscriber, some
+without a phone number, some subscribers booked to "Központi", a few
+unmapped TESZOR/VAT pairs and missing amounts), enriches them with
+`vodafone_charges_dataframe` and times the previous `pd.pivot_table` pass
+(on plain string columns) against `vodafone_pivot` (best of `--repeat`
+runs). Also prints the frame's deep memory with plain string columns and
+with the categorical ones it is built with. Exits non-zero if the two pivot
+results are not identical.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TESZOR_CODES = ["61.20.1", "61.20.3", "61.20.4", "61.10.1", "95.12.1"]
+VAT_RATES = ["27%", "27%", "27%", "TAM", "5%"]
+
+
+def synthetic_charges(lines: int):
+    from services.invoice_processor import VodafoneServiceChargeRow
+
+    subscribers = max(1, lines // 20)
+    phones = [f"3630{i:07d}" for i in range(subscribers)]
+    # Minden 97. tételnél hiányzik a telefonszám (központi díjak)
+    rows = []
+    for i in range(lines):
+        phone = "" if i % 97 == 0 else phones[(i * 7919) % subscribers]
+        net = None if i % 501 == 0 else float(1000 + (i * 31) % 5000)
+        rows.append(
+            VodafoneServiceChargeRow(
+                phone,
+                "Havi díj",
+                TESZOR_CODES[i % 5],
+                net * 1.27 if net is not None else None,
+                net * 0.27 if net is not None else None,
+                VAT_RATES[(i // 5) % 5],
+                net,
+            )
+        )
+
+    phone_user_map = {
+        phone: {
+            "name": "Központi" if i % 40 == 0 else f"Dolgozó {i % 900}",
+            "cost_center": f"CC{i % 25}",
+            "monogram": f"M{i % 900}",
+            "axapta_name": f"AX{i % 900}",
+        }
+        for i, phone in enumerate(phones)
+        if i % 13
+    }
+    phone_user_map[""] = {"name": "Központi", "cost_center": "CC0"}
+    mapping_lookup = {
+        (code, rate): {"Title": f"T {code}", "VatCode": rate, "LedgerAccount": "5"}
+        for code in TESZOR_CODES[:4]
+        for rate in VAT_RATES
+    }
+    teszor_category_map = {code: "Mobil" for code in TESZOR_CODES}
+    return rows, phone_user_map, teszor_category_map, mapping_lookup
+
+
+def plain_columns(df):
+    """The frame as it was before categorical columns: plain string columns."""
+    import pandas as pd
+
+    return pd.DataFrame(
+        {
+            column: (
+                values.astype(values.cat.categories.dtype)
+                if isinstance(values.dtype, pd.CategoricalDtype)
+                else values
+            )
+            for column, values in df.items()
+        }
+    )
+
+
+def frame_mib(df) -> float:
+    return df.memory_usage(deep=True).sum() / 2**20
+
+
+def old_pivot(df):
+    """The previous pass: masked `.loc` rewrites, then `pd.pivot_table`."""
+    import pandas as pd
+
+    df = plain_columns(df)
+    mask = (df["Employee"] == "Központi") & (
+        df["PhoneNumber"].isna()
+        | (df["PhoneNumber"] == "")
+        | (df["PhoneNumber"] == "N/A")
+    )
+    df.loc[mask, "PhoneNumber"] = "Központi"
+    df.loc[df["Employee"] == "Központi", "Axapta Name"] = "N/A"
+    return pd.pivot_table(
+        df,
+        index=[
+            "PhoneNumber",
+            "Employee",
+            "Cost Center",
+            "Axapta Name",
+            "Monogram",
+            "VATRate",
+            "Title",
+            "VatCode",
+            "LedgerAccount",
+        ],
+        values=["NetAmount", "VATAmount"],
+        aggfunc="sum",
+        fill_value=0,
+    ).reset_index()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    import pandas as pd
+
+    from utils.excel_export import vodafone_charges_dataframe, vodafone_pivot
+
+    def best_of(fn, df):
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result = fn(df)
+            timings.append(time.perf_counter() - start)
+        return min(timings), result
+
+    mismatch = False
+    for lines in args.lines:
+        df = vodafone_charges_dataframe(*synthetic_charges(lines))
+        old_seconds, expected = best_of(old_pivot, df)
+        new_seconds, pivot = best_of(vodafone_pivot, df)
+        print(
+            f"{lines:>7} lines, {len(pivot):>6} pivot rows: "
+            f"pivot_table {old_seconds * 1000:8.1f} ms, "
+            f"vodafone_pivot {new_seconds * 1000:8.1f} ms, "
+            f"frame {frame_mib(plain_columns(df)):6.1f} -> {frame_mib(df):5.1f} MiB"
+        )
+        try:
+            pd.testing.assert_frame_equal(pivot, expected, check_exact=True)
+        except AssertionError as e:
+            print(f"MISMATCH at {lines} lines: {e}")
+            mismatch = True
+
+    if mismatch:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
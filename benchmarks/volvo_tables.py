@@ -0,0 +1,128 @@
+"""
+Table-extraction benchmark for Volvo invoices.
+
+    python benchmarks/volvo_tables.py [--pdf invoice.pdf] [--pages 100] [--repeat 3]
+
+Without `--pdf` a synthetic invoice is drawn with reportlab (not a runtime
+dependency: `pip install reportlab`): every page repeats the ruled header
+table and carries a ruled item table, like the real ones. Times the old
+per-page `extract_tables()` pass against `extract_page_tables` and the whole
+`process_volvo` (best of `--repeat` runs), and checks that both passes
+return identical tables. The pdfminer object parsing both table passes
+share is done (and timed) once up front.
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ROWS_PER_PAGE = 24
+
+
+def synthetic_invoice(pages: int) -> bytes:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    output = io.BytesIO()
+    c = canvas.Canvas(output, pagesize=A4)
+    width, height = A4
+
+    def ruled_table(top, row_height, column_edges, rows):
+        bottom = top - row_height * len(rows)
+        for x in column_edges:
+            c.line(x, top, x, bottom)
+        for i in range(len(rows) + 1):
+            y = top - i * row_height
+            c.line(column_edges[0], y, column_edges[-1], y)
+        for i, row in enumerate(rows):
+            for x, cell in zip(column_edges, row):
+                for j, text in enumerate(cell.split("\n")):
+                    c.drawString(x + 3, top - i * row_height - 10 - j * 10, text)
+
+    for page in range(pages):
+        c.setFont("Helvetica", 8)
+        c.drawString(40, height - 40, "Volvo Hungaria Kft. - Invoice")
+        ruled_table(
+            height - 60,
+            16,
+            [40, 160, 280, 400, 520],
+            [
+                ["Invoice number", "Invoice date", "Due date", "Performance date"],
+                ["9123456", "05-02-2025", "20-02-2025", "31-01-2025"],
+            ],
+        )
+        items = [["Description", "Period", "Net amount"]]
+        for i in range(ROWS_PER_PAGE):
+            n = page * ROWS_PER_PAGE + i
+            items.append(
+                [
+                    f"Truck rental\nABC-{n:03d} 01-01-2025 31-01-2025",
+                    "01-01-2025 - 31-01-2025",
+                    f"{100 + n % 900}.{n % 1000:03d},00",
+                ]
+            )
+        ruled_table(height - 120, 24, [40, 240, 400, 520], items)
+        c.showPage()
+    c.save()
+    return output.getvalue()
+
+
+def old_tables(pages):
+    """The previous pass: `extract_tables()` on every page, page 0 twice."""
+    pages[0].extract_tables()
+    return [page.extract_tables() for page in pages]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pdf")
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    from services.invoice_processor import process_volvo
+
+    if args.pdf:
+        with open(args.pdf, "rb") as f:
+            pdf_bytes = f.read()
+    else:
+        pdf_bytes = synthetic_invoice(args.pages)
+
+    def best_of(fn):
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result = fn()
+            timings.append(time.perf_counter() - start)
+        return min(timings), result
+
+    import pdfplumber
+
+    from services.invoice_processor import extract_page_tables
+
+    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+        pages = pdf.pages
+        start = time.perf_counter()
+        for page in pages:
+            page.objects
+        print(f"pdfminer objects (shared):  {time.perf_counter() - start:6.2f} s")
+
+        seconds, expected = best_of(lambda: old_tables(pages))
+        print(f"extract_tables, every page: {seconds:6.2f} s")
+        seconds, tables = best_of(lambda: [extract_page_tables(p) for p in pages])
+        print(f"extract_page_tables:        {seconds:6.2f} s")
+
+    seconds, rows = best_of(lambda: process_volvo(pdf_bytes))
+    print(f"process_volvo, end to end:  {seconds:6.2f} s ({len(rows)} rows)")
+
+    if tables != expected:
+        print("MISMATCH: extract_page_tables differs from extract_tables")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,42 @@
 from typing import Annotated
-from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel import Session, create_engine
 from fastapi import Depends
 from urllib.parse import quote_plus
 
 import os
 
+from services.registry import service_registry
+from utils.metrics import instrument_engine
 
-username = os.getenv("DB_USERNAME")
-password = quote_plus(os.getenv("DB_PASSWORD"))
-server = os.getenv("DB_SERVER")
-database = os.getenv("DB_DATABASE")
 
-connection_string = (
-    f"mssql+pyodbc://{username}:{password}@{server}:1433/{database}"
-    "?driver=ODBC+Driver+18+for+SQL+Server"
-    "&encrypt=yes"
-    "&trustservercertificate=no"
-    "&connection+timeout=30"
-)
+def _build_engine():
+    username = os.getenv("DB_USERNAME")
+    password = quote_plus(os.getenv("DB_PASSWORD"))
+    server = os.getenv("DB_SERVER")
+    database = os.getenv("DB_DATABASE")
 
+    connection_string = (
+        f"mssql+pyodbc://{username}:{password}@{server}:1433/{database}"
+        "?driver=ODBC+Driver+18+for+SQL+Server"
+        "&encrypt=yes"
+        "&trustservercertificate=no"
+        "&connection+timeout=30"
+    )
 
-engine = create_engine(connection_string, echo=True)
+    engine = create_engine(connection_string, echo=os.getenv("DB_ECHO") == "1")
+    instrument_engine(engine)
+    return engine
 
 
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+service_registry.register("db_engine", _build_engine)
+
+
+def get_engine():
+    return service_registry.get("db_engine")
 
 
 def get_session():
-    with Session(engine) as session:
+    with Session(get_engine()) as session:
         yield session
 
 
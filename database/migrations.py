@@ -0,0 +1,205 @@
+"""
+Schema revisions and the migration CLI.
+
+Tables are no longer created on every worker start; run this once per
+deploy instead:
+
+    python -m database.migrations upgrade
+    python -m database.migrations current
+
+The app itself only compares the stored revision with SCHEMA_REVISION, from
+/health/ready (see `check_schema_version`).
+"""
+
+import argparse
+
+import sqlalchemy as sa
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import Session, SQLModel, select
+
+from database.models import SchemaVersion
+
+
+def _create_tables(connection):
+    SQLModel.metadata.create_all(connection)
+
+
+def _add_aerozone_lookup_indexes(connection):
+    # create_all nem módosít létező táblát, ezért az indexeket külön hozzuk létre
+    inspector = inspect(connection)
+    for table, column in [
+        ("partners", "tax_number"),
+        ("uploaded_invoices", "partner_tax_id"),
+    ]:
+        if not inspector.has_table(table):
+            continue
+        index_name = f"ix_{table}_{column}"
+        if index_name not in {index["name"] for index in inspector.get_indexes(table)}:
+            connection.execute(text(f"CREATE INDEX {index_name} ON {table} ({column})"))
+
+
+# A küldési futás táblái a modellektől függetlenül (a modellek kikommentezve
+# is lehetnek): a revízió mindig ugyanazt hozza létre
+_send_run_metadata = sa.MetaData()
+
+sa.Table(
+    "send_runs",
+    _send_run_metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("idempotency_key", sa.String(64), nullable=False),
+    sa.Column("subject", sa.String(), nullable=False),
+    sa.Column("message", sa.String(), nullable=False),
+    sa.Column(
+        "status", sa.Enum("running", "completed", name="sendrunstatus"), nullable=False
+    ),
+    sa.Column("created_at", sa.DateTime(), nullable=False),
+    sa.Column("updated_at", sa.DateTime(), nullable=False),
+    sa.Index("ix_send_runs_idempotency_key", "idempotency_key", unique=True),
+)
+
+sa.Table(
+    "send_run_partners",
+    _send_run_metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("run_id", sa.Integer, sa.ForeignKey("send_runs.id"), nullable=False),
+    sa.Column("partner_id", sa.Integer, nullable=False),
+    sa.Column("invoice_ids", sa.String(), nullable=False),
+    sa.Column(
+        "state",
+        sa.Enum("pending", "claimed", "sent", "failed", name="sendpartnerstate"),
+        nullable=False,
+    ),
+    sa.Column("claimed_by", sa.String(64), nullable=True),
+    sa.Column("claimed_at", sa.DateTime(), nullable=True),
+    sa.Column("attempts", sa.Integer, nullable=False),
+    sa.Column("error", sa.String(), nullable=True),
+    sa.Column("updated_at", sa.DateTime(), nullable=False),
+    sa.UniqueConstraint("run_id", "partner_id"),
+    sa.Index("ix_send_run_partners_run_id", "run_id"),
+    sa.Index("ix_send_run_partners_state", "state"),
+)
+
+sa.Table(
+    "invoice_delete_outbox",
+    _send_run_metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("run_id", sa.Integer, sa.ForeignKey("send_runs.id"), nullable=False),
+    sa.Column("invoice_id", sa.Integer, nullable=False),
+    sa.Column("blob_url", sa.String(), nullable=True),
+    sa.Column("attempts", sa.Integer, nullable=False),
+    sa.Column("error", sa.String(), nullable=True),
+    sa.Column("created_at", sa.DateTime(), nullable=False),
+    sa.Index("ix_invoice_delete_outbox_run_id", "run_id"),
+)
+
+
+_blob_delete_retries = sa.Table(
+    "blob_delete_retries",
+    sa.MetaData(),
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("blob_url", sa.String(), nullable=False),
+    sa.Column("error", sa.String(), nullable=True),
+    sa.Column("attempts", sa.Integer, nullable=False),
+    sa.Column("created_at", sa.DateTime(), nullable=False),
+    sa.Column("last_attempt_at", sa.DateTime(), nullable=False),
+)
+
+
+def _create_blob_delete_retries(connection):
+    _blob_delete_retries.create(connection, checkfirst=True)
+
+
+def _create_send_run_tables(connection):
+    # checkfirst: a már létező táblákat nem bántja
+    _send_run_metadata.create_all(connection, checkfirst=True)
+
+
+MIGRATIONS = [
+    ("0001_initial", _create_tables),
+    ("0002_aerozone_lookup_indexes", _add_aerozone_lookup_indexes),
+    ("0003_send_runs", _create_send_run_tables),
+    ("0004_blob_delete_retries", _create_blob_delete_retries),
+]
+
+SCHEMA_REVISION = MIGRATIONS[-1][0]
+
+
+def get_current_revision(engine):
+    if not inspect(engine).has_table(SchemaVersion.__tablename__):
+        return None
+    with Session(engine) as session:
+        return session.exec(
+            select(SchemaVersion.revision).order_by(SchemaVersion.id.desc()).limit(1)
+        ).first()
+
+
+def check_schema_version(engine):
+    try:
+        with Session(engine) as session:
+            current = session.exec(
+                select(SchemaVersion.revision)
+                .order_by(SchemaVersion.id.desc())
+                .limit(1)
+            ).first()
+    except SQLAlchemyError as e:
+        return {
+            "ready": False,
+            "current": None,
+            "expected": SCHEMA_REVISION,
+            "detail": f"Séma verzió nem olvasható: {e.__class__.__name__}",
+        }
+
+    ready = current == SCHEMA_REVISION
+    return {
+        "ready": ready,
+        "current": current,
+        "expected": SCHEMA_REVISION,
+        "detail": (
+            None
+            if ready
+            else "Az adatbázis séma nem naprakész, futtasd: python -m database.migrations upgrade"
+        ),
+    }
+
+
+def upgrade(engine):
+    revisions = [revision for revision, _ in MIGRATIONS]
+    current = get_current_revision(engine)
+    if current is not None and current not in revisions:
+        raise RuntimeError(f"Ismeretlen séma revízió az adatbázisban: {current}")
+
+    start = revisions.index(current) + 1 if current else 0
+    applied = []
+    for revision, migrate in MIGRATIONS[start:]:
+        with engine.begin() as connection:
+            migrate(connection)
+            connection.execute(
+                SchemaVersion.__table__.insert().values(revision=revision)
+            )
+        applied.append(revision)
+    return applied
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv(override=True)
+
+    from database.connection import get_engine
+
+    parser = argparse.ArgumentParser(prog="python -m database.migrations")
+    parser.add_argument("command", choices=["upgrade", "current"])
+    args = parser.parse_args()
+
+    engine = get_engine()
+    if args.command == "upgrade":
+        applied = upgrade(engine)
+        print(f"Alkalmazott revíziók: {', '.join(applied) if applied else 'nincs'}")
+    print(
+        f"Aktuális revízió: {get_current_revision(engine)} (elvárt: {SCHEMA_REVISION})"
+    )
+
+
+if __name__ == "__main__":
+    main()
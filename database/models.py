@@ -31,6 +31,14 @@ class Employee(SQLModel, table=True):
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
+class SchemaVersion(SQLModel, table=True):
+    __tablename__ = "schema_version"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    revision: str = Field(max_length=64, nullable=False)
+    applied_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
 # class EmailType(str, Enum):
 #     to = "to"
 #     cc = "cc"
@@ -106,7 +114,7 @@ class Employee(SQLModel, table=True):
 
 #     id: int | None = Field(default=None, primary_key=True)
 #     name: str = Field(max_length=255, nullable=False)
-#     tax_number: str = Field(max_length=32, nullable=False)
+#     tax_number: str = Field(max_length=32, nullable=False, index=True)
 #     contact: Optional[str] = Field(default=None, max_length=255, nullable=True)
 
 #     emails: List["PartnerEmail"] = Relationship(
@@ -141,7 +149,7 @@ class Employee(SQLModel, table=True):
 #     id: int | None = Field(default=None, primary_key=True)
 #     filename: str = Field(nullable=False)
 #     own_tax_id: str | None = Field(default=None)
-#     partner_tax_id: str | None = Field(default=None)
+#     partner_tax_id: str | None = Field(default=None, index=True)
 #     partner_id: int | None = Field(default=None, foreign_key="partners.id")
 #     blob_url: str | None = Field(default=None)
 #     status: Status = Field(default=Status.pending, nullable=False)
@@ -150,6 +158,75 @@ class Employee(SQLModel, table=True):
 #     partner: Optional["Partner"] = Relationship(back_populates="invoices")
 
 
+# class BlobDeleteRetry(SQLModel, table=True):
+#     __tablename__ = "blob_delete_retries"
+
+#     id: int | None = Field(default=None, primary_key=True)
+#     blob_url: str = Field(nullable=False)
+#     error: str | None = Field(default=None)
+#     attempts: int = Field(default=1, nullable=False)
+#     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+#     last_attempt_at: datetime = Field(
+#         default_factory=lambda: datetime.now(timezone.utc)
+#     )
+
+
+# class SendRunStatus(str, Enum):
+#     running = "running"
+#     completed = "completed"
+
+
+# class SendPartnerState(str, Enum):
+#     pending = "pending"
+#     claimed = "claimed"
+#     sent = "sent"
+#     failed = "failed"
+
+
+# class SendRun(SQLModel, table=True):
+#     __tablename__ = "send_runs"
+
+#     id: int | None = Field(default=None, primary_key=True)
+#     idempotency_key: str = Field(
+#         max_length=64, nullable=False, unique=True, index=True
+#     )
+#     subject: str = Field(nullable=False)
+#     message: str = Field(nullable=False)
+#     status: SendRunStatus = Field(default=SendRunStatus.running, nullable=False)
+#     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+#     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+# class SendRunPartner(SQLModel, table=True):
+#     __tablename__ = "send_run_partners"
+#     __table_args__ = (sa.UniqueConstraint("run_id", "partner_id"),)
+
+#     id: int | None = Field(default=None, primary_key=True)
+#     run_id: int = Field(foreign_key="send_runs.id", nullable=False, index=True)
+#     partner_id: int = Field(nullable=False)
+#     invoice_ids: str = Field(nullable=False)  # JSON lista, a futás indulásakor
+#     state: SendPartnerState = Field(
+#         default=SendPartnerState.pending, nullable=False, index=True
+#     )
+#     claimed_by: str | None = Field(default=None, max_length=64)
+#     claimed_at: datetime | None = Field(default=None)
+#     attempts: int = Field(default=0, nullable=False)
+#     error: str | None = Field(default=None)
+#     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+# class InvoiceDeleteOutbox(SQLModel, table=True):
+#     __tablename__ = "invoice_delete_outbox"
+
+#     id: int | None = Field(default=None, primary_key=True)
+#     run_id: int = Field(foreign_key="send_runs.id", nullable=False, index=True)
+#     invoice_id: int = Field(nullable=False)
+#     blob_url: str | None = Field(default=None)
+#     attempts: int = Field(default=0, nullable=False)
+#     error: str | None = Field(default=None)
+#     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
 # class PartnerEmailResponse(SQLModel):
 #     id: int
 #     email: str
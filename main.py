@@ -1,18 +1,25 @@
 from dotenv import load_dotenv
 
-
 load_dotenv(override=True)
 
+import os
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from database.connection import create_db_and_tables
+from services.artifact_store import artifact_store
+from services.registry import service_registry
+from middleware.admission import AdmissionControlMiddleware
+from middleware.metrics import MetricsMiddleware
+from middleware.response_cache import ResponseCacheMiddleware
 
 # from routers.auth import authentication
 from routers import nijhof
 from routers import employees
+from routers import health
+from routers import invoices
+from routers import metrics
 
 # from routers import esselte
 # from routers import aerozone
@@ -21,8 +28,16 @@ from routers import employees
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    create_db_and_tables()
+    # Táblák létrehozása/migráció: python -m database.migrations upgrade
+    # (a séma verzióját a /health/ready ellenőrzi)
+    # pl. WARM_UP_SERVICES=blob_container,email_client az első kérés gyorsításához
+    warm_up = os.getenv("WARM_UP_SERVICES", "")
+    service_registry.warm_up(
+        *[name.strip() for name in warm_up.split(",") if name.strip()]
+    )
+    artifact_store.sweep(force=True)
     yield
+    service_registry.close_all()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -36,18 +51,61 @@ origins = [
     "https://playground.kraliknorbert.com",
 ]
 
+# A CORS alatt, hogy a 429-es válaszok is kapjanak CORS fejléceket
+app.add_middleware(
+    AdmissionControlMiddleware,
+    routes={
+        "/api/v1/nijhof/upload/": "parse",
+        "/api/v1/esselte/upload/": "parse",
+        "/api/v1/aerozone/upload/": "parse",
+        "/api/v1/invoices/convert": "parse",
+        "/api/v1/esselte/send/": "send",
+        "/api/v1/aerozone/invoices/send": "send",
+    },
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-    expose_headers=["Content-Disposition"],
+    expose_headers=[
+        "Accept-Ranges",
+        "Content-Disposition",
+        "Content-Range",
+        "ETag",
+        "Location",
+        "Retry-After",
+        "Server-Timing",
+        "X-Artifact-Id",
+        "X-Invoice-Vendor",
+        "X-Parse-Profile-Id",
+        "X-Workbook-Id",
+    ],
+)
+
+app.add_middleware(
+    ResponseCacheMiddleware,
+    cached_routes={
+        "/api/v1/employees/all": "/api/v1/employees",
+        # A lentiek routerei még nincsenek felcsatolva (lásd include_router)
+        "/api/v1/reports/income-expense-summary": "/api/v1/reports",
+        "/api/v1/reports/partners": "/api/v1/reports",
+        "/api/v1/esselte/teszor-mapping": "/api/v1/esselte",
+        "/api/v1/aerozone/partners/all": "/api/v1/aerozone",
+        "/api/v1/aerozone/emails/all": "/api/v1/aerozone",
+    },
+)
+app.add_middleware(
+    MetricsMiddleware, exclude_paths=("/metrics", "/health/live", "/health/ready")
 )
 
 # app.include_router(authentication.router, prefix="/api/v1")
 app.include_router(nijhof.router, prefix="/api/v1")
 app.include_router(employees.router, prefix="/api/v1")
+app.include_router(invoices.router, prefix="/api/v1")
+app.include_router(health.router)
+app.include_router(metrics.router)
 # app.include_router(esselte.router, prefix="/api/v1")
 # app.include_router(aerozone.router, prefix="/api/v1")
 # app.include_router(reports.router, prefix="/api/v1")
@@ -0,0 +1,300 @@
+import asyncio
+import ipaddress
+import json
+import math
+import os
+import time
+from collections import deque
+
+from jose import JWTError, jwt
+from starlette.datastructures import Headers
+
+from utils.metrics import registry
+
+admission_in_flight = registry.gauge(
+    "app_admission_in_flight",
+    "Requests holding an admission slot, by pool.",
+    ["pool"],
+)
+admission_queue_depth = registry.gauge(
+    "app_admission_queue_depth",
+    "Requests waiting for an admission slot, by pool.",
+    ["pool"],
+)
+admission_wait = registry.histogram(
+    "app_admission_wait_seconds",
+    "Time admitted requests waited for a slot, by pool.",
+    ["pool"],
+)
+admission_rejected = registry.counter(
+    "app_admission_rejected_total",
+    "Requests answered with 429, by pool and reason "
+    "(queue_full, tenant_queue_full, timeout).",
+    ["pool", "reason"],
+)
+
+_SECRET_KEY = os.getenv("SECRET_KEY")
+_ALGORITHM = os.getenv("ALGORITHM")
+# Ezektől a címektől (a reverse proxy) jövő X-Forwarded-For-t fogadjuk el
+ADMISSION_TRUSTED_PROXIES = os.getenv(
+    "ADMISSION_TRUSTED_PROXIES",
+    "127.0.0.0/8,::1/128,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16,fc00::/7",
+)
+_trusted_proxies = [
+    ipaddress.ip_network(network.strip(), strict=False)
+    for network in ADMISSION_TRUSTED_PROXIES.split(",")
+    if network.strip()
+]
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionPool:
+    """
+    Concurrency cap for one class of heavy endpoints, per process.
+
+    At most `limit` requests run at once, at most `tenant_limit` of them for
+    the same tenant. The rest wait in FIFO order (a tenant at its cap is
+    skipped, not blocking the others) for at most `queue_timeout` seconds;
+    beyond `max_queue` waiters (or `tenant_queue` for one tenant) the request
+    is rejected right away. Only used from the event loop, so no locking.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limit: int,
+        tenant_limit: int,
+        max_queue: int,
+        tenant_queue: int,
+        queue_timeout: float,
+    ):
+        self.name = name
+        self.limit = limit
+        self.tenant_limit = tenant_limit
+        self.max_queue = max_queue
+        self.tenant_queue = tenant_queue
+        self.queue_timeout = queue_timeout
+        self._active = 0
+        self._tenant_active = {}
+        self._waiters = deque()
+        # Egy kérés átlagos futásideje, a Retry-After becsléséhez
+        self._service_seconds = 5.0
+
+    def _can_run(self, tenant: str) -> bool:
+        return (
+            self._active < self.limit
+            and self._tenant_active.get(tenant, 0) < self.tenant_limit
+        )
+
+    def _start(self, tenant: str):
+        self._active += 1
+        self._tenant_active[tenant] = self._tenant_active.get(tenant, 0) + 1
+        admission_in_flight.inc(pool=self.name)
+
+    def retry_after(self) -> int:
+        rounds = (len(self._waiters) + self._active) / self.limit
+        return max(1, math.ceil(rounds * self._service_seconds))
+
+    async def acquire(self, tenant: str):
+        # A várakozók mind a saját tenant-korlátjukon állnak, így ha ennek a
+        # tenantnak van helye, nem előz meg senkit
+        if self._can_run(tenant):
+            self._start(tenant)
+            admission_wait.observe(0.0, pool=self.name)
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            reason = "queue_full"
+        elif sum(1 for t, _ in self._waiters if t == tenant) >= self.tenant_queue:
+            reason = "tenant_queue_full"
+        else:
+            reason = None
+        if reason:
+            admission_rejected.inc(pool=self.name, reason=reason)
+            raise AdmissionRejected(reason, self.retry_after())
+
+        waiter = (tenant, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        admission_queue_depth.inc(pool=self.name)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter[1]), self.queue_timeout)
+        except asyncio.TimeoutError:
+            # Az időtúllépéssel egy időben kapott slot érvényes
+            if not waiter[1].done():
+                self._leave_queue(waiter)
+                admission_rejected.inc(pool=self.name, reason="timeout")
+                raise AdmissionRejected("timeout", self.retry_after())
+        except asyncio.CancelledError:
+            # A kliens bontott várakozás közben
+            if waiter[1].done():
+                self.release(tenant)
+            else:
+                self._leave_queue(waiter)
+            raise
+        admission_wait.observe(time.perf_counter() - start, pool=self.name)
+
+    def _leave_queue(self, waiter):
+        self._waiters.remove(waiter)
+        admission_queue_depth.dec(pool=self.name)
+
+    def release(self, tenant: str, elapsed: float | None = None):
+        self._active -= 1
+        self._tenant_active[tenant] -= 1
+        if not self._tenant_active[tenant]:
+            del self._tenant_active[tenant]
+        admission_in_flight.dec(pool=self.name)
+        if elapsed is not None:
+            self._service_seconds = 0.8 * self._service_seconds + 0.2 * elapsed
+
+        for waiter in list(self._waiters):
+            if self._active >= self.limit:
+                break
+            waiting_tenant, future = waiter
+            if self._can_run(waiting_tenant):
+                self._leave_queue(waiter)
+                self._start(waiting_tenant)
+                future.set_result(None)
+
+
+def _pool_from_env(name: str, limit: int, tenant_limit: int) -> AdmissionPool:
+    prefix = f"ADMISSION_{name.upper()}"
+    return AdmissionPool(
+        name,
+        limit=int(os.getenv(f"{prefix}_LIMIT", limit)),
+        tenant_limit=int(os.getenv(f"{prefix}_TENANT_LIMIT", tenant_limit)),
+        max_queue=int(os.getenv(f"{prefix}_MAX_QUEUE", 4 * limit)),
+        tenant_queue=int(os.getenv(f"{prefix}_TENANT_QUEUE", tenant_limit)),
+        queue_timeout=float(os.getenv(f"{prefix}_QUEUE_TIMEOUT_SECONDS", 30)),
+    )
+
+
+# A korlátok workerprocesszenként értendők (uvicorn --workers)
+admission_pools = {
+    "parse": _pool_from_env("parse", limit=4, tenant_limit=2),
+    "send": _pool_from_env("send", limit=4, tenant_limit=1),
+}
+
+
+def tenant_key(scope) -> str:
+    """
+    The token's user when it verifies, otherwise the client address (taken
+    from X-Forwarded-For when the peer is in ADMISSION_TRUSTED_PROXIES).
+    """
+    headers = Headers(scope=scope)
+    token = None
+    for cookie in headers.get("cookie", "").split(";"):
+        name, _, value = cookie.strip().partition("=")
+        if name == "access_token":
+            token = value
+    authorization = headers.get("authorization", "")
+    if token is None and authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+
+    if token and _SECRET_KEY and _ALGORITHM:
+        try:
+            username = jwt.decode(token, _SECRET_KEY, algorithms=[_ALGORITHM]).get(
+                "sub"
+            )
+        except JWTError:
+            username = None
+        if username:
+            return f"user:{username}"
+    client = scope.get("client")
+    return f"ip:{client_address(client[0] if client else None, headers)}"
+
+
+def _is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in _trusted_proxies)
+
+
+def client_address(peer: str | None, headers: Headers) -> str:
+    """
+    The peer address, or behind trusted proxies the right-most
+    X-Forwarded-For entry that is not one of them.
+    """
+    address = peer or "unknown"
+    if peer is None or not _is_trusted_proxy(peer):
+        return address
+    # Jobbról balra: a bal oldali elemeket a kliens maga is írhatja
+    forwarded = ",".join(headers.getlist("x-forwarded-for"))
+    for hop in reversed([hop.strip() for hop in forwarded.split(",") if hop.strip()]):
+        address = hop
+        if not _is_trusted_proxy(hop):
+            break
+    return address
+
+
+class AdmissionControlMiddleware:
+    """
+    Admission control for the parse/export and send endpoints.
+
+    `routes` maps a path prefix to a pool name in `admission_pools`; matching
+    POST requests hold a slot until the whole response (including a streamed
+    body) is sent, and get 429 with Retry-After when the pool is saturated.
+    The request body is only read once a slot is granted.
+    """
+
+    def __init__(self, app, routes: dict[str, str], pools: dict = None):
+        self.app = app
+        self.pools = pools or admission_pools
+        self.routes = sorted(
+            ((prefix, self.pools[name]) for prefix, name in routes.items()),
+            key=lambda item: len(item[0]),
+            reverse=True,
+        )
+
+    def _pool_for(self, scope) -> AdmissionPool | None:
+        if scope["type"] != "http" or scope["method"] != "POST":
+            return None
+        for prefix, pool in self.routes:
+            if scope["path"].startswith(prefix):
+                return pool
+        return None
+
+    async def __call__(self, scope, receive, send):
+        pool = self._pool_for(scope)
+        if pool is None:
+            await self.app(scope, receive, send)
+            return
+
+        tenant = tenant_key(scope)
+        try:
+            await pool.acquire(tenant)
+        except AdmissionRejected as e:
+            await self._reject(send, e)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            pool.release(tenant, time.perf_counter() - start)
+
+    async def _reject(self, send, rejection: AdmissionRejected):
+        body = json.dumps(
+            {"detail": "A szerver most túlterhelt, próbáld újra később."},
+            ensure_ascii=False,
+        ).encode("utf-8")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(rejection.retry_after).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,64 @@
+import time
+
+from utils.metrics import begin_request_stages, end_request_stages, registry
+
+request_duration = registry.histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route.",
+    ["method", "route", "status"],
+)
+requests_in_flight = registry.gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being served.",
+    ["method"],
+)
+request_stage_duration = registry.histogram(
+    "http_request_stage_seconds",
+    "Per-request time spent in each instrumented stage, by route.",
+    ["route", "stage"],
+)
+
+
+def _route_template(scope) -> str:
+    route = scope.get("route")
+    # Csak a route sablon kerül címkébe, így a path paraméterek nem robbantják a számosságot
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Records per-route latency, in-flight requests and per-stage time."""
+
+    def __init__(self, app, exclude_paths=("/metrics",)):
+        self.app = app
+        self.exclude_paths = set(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        requests_in_flight.inc(method=method)
+        stages, token = begin_request_stages()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            end_request_stages(token)
+            requests_in_flight.dec(method=method)
+
+            route = _route_template(scope)
+            request_duration.observe(
+                elapsed, method=method, route=route, status=status_code
+            )
+            for stage, stage_elapsed in stages.items():
+                request_stage_duration.observe(stage_elapsed, route=route, stage=stage)
@@ -0,0 +1,234 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from starlette.datastructures import Headers, MutableHeaders
+
+# Az invalidálás generációszámlálói: minden uvicorn worker (és egy közös
+# köteten minden példány) ugyanezt a könyvtárat látja
+RESPONSE_CACHE_STATE_DIR = os.getenv(
+    "RESPONSE_CACHE_STATE_DIR",
+    os.path.join(tempfile.gettempdir(), "response_cache_state"),
+)
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache of rendered GET response bodies, keyed by ETag.
+
+    Bodies live in each process, but invalidation does not: every prefix has
+    a generation token in `state_dir` that a mutation in any worker replaces,
+    and cached bodies are only served under the generation they were built in.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl_seconds: float = 300,
+        state_dir: str = RESPONSE_CACHE_STATE_DIR,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.state_dir = state_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _generation_path(self, prefix: str) -> str:
+        name = hashlib.sha256(prefix.encode()).hexdigest()[:32]
+        return os.path.join(self.state_dir, name)
+
+    def generation(self, prefix: str) -> str:
+        try:
+            with open(self._generation_path(prefix), encoding="ascii") as f:
+                return f.read()
+        except FileNotFoundError:
+            return ""
+
+    def _bump_generation(self, prefix: str):
+        os.makedirs(self.state_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.state_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="ascii") as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(tmp_path, self._generation_path(prefix))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry["expires_at"] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, etag: str, body: bytes, headers: list):
+        with self._lock:
+            self._entries[key] = {
+                "etag": etag,
+                "body": body,
+                "headers": headers,
+                "expires_at": time.monotonic() + self.ttl_seconds,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, prefix: str):
+        self._bump_generation(prefix)
+        with self._lock:
+            for key in [k for k in self._entries if k[0].startswith(prefix)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = ResponseCache()
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in [tag.strip() for tag in if_none_match.split(",")]
+
+
+def _credential_fingerprint(headers: Headers) -> str:
+    # A cache entry only ever answers the same token that produced it, so the
+    # auth dependency of the route has already accepted this credential.
+    credential = headers.get("authorization", "")
+    for cookie in headers.get("cookie", "").split(";"):
+        name, _, value = cookie.strip().partition("=")
+        if name == "access_token":
+            credential += value
+    return hashlib.sha256(credential.encode()).hexdigest()
+
+
+class ResponseCacheMiddleware:
+    """
+    Serves read-mostly GET endpoints from `response_cache` with strong ETags.
+
+    `cached_routes` maps a cached path to its invalidation prefix: any
+    successful non-GET request under that prefix drops the cached bodies.
+    """
+
+    def __init__(self, app, cached_routes: dict[str, str], cache: ResponseCache = None):
+        self.app = app
+        self.cached_routes = cached_routes
+        self.invalidation_prefixes = set(cached_routes.values())
+        self.cache = cache or response_cache
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        method = scope["method"]
+
+        if method == "GET" and path in self.cached_routes:
+            await self._handle_cached(scope, receive, send)
+        elif method in ("POST", "PUT", "PATCH", "DELETE") and any(
+            path.startswith(prefix) for prefix in self.invalidation_prefixes
+        ):
+            await self._handle_mutation(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+    async def _handle_cached(self, scope, receive, send):
+        request_headers = Headers(scope=scope)
+        query = "&".join(sorted(scope["query_string"].decode("latin-1").split("&")))
+        prefix = self.cached_routes[scope["path"]]
+        key = (
+            prefix,
+            # Egy másik worker módosítása új generációt ad: a régi test nem talál
+            self.cache.generation(prefix),
+            scope["path"],
+            query,
+            _credential_fingerprint(request_headers),
+        )
+        if_none_match = request_headers.get("if-none-match")
+
+        entry = self.cache.get(key)
+        if entry is not None:
+            await self._send_entry(send, entry, if_none_match)
+            return
+
+        start_message = None
+        chunks = []
+
+        async def capture(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, capture)
+
+        if start_message is None:
+            # Nem jött válasz: a szerver maga ad rá hibát
+            return
+        body = b"".join(chunks)
+        if start_message["status"] != 200:
+            await send(start_message)
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        headers = [
+            (name, value)
+            for name, value in start_message["headers"]
+            if name.lower() not in (b"content-length", b"etag")
+        ]
+        etag = make_etag(body)
+        self.cache.set(key, etag, body, headers)
+        await self._send_entry(
+            send, {"etag": etag, "body": body, "headers": headers}, if_none_match
+        )
+
+    async def _send_entry(self, send, entry, if_none_match):
+        headers = MutableHeaders(raw=list(entry["headers"]))
+        headers["ETag"] = entry["etag"]
+        headers["Cache-Control"] = "private, no-cache"
+
+        if etag_matches(if_none_match, entry["etag"]):
+            del headers["content-type"]
+            await send(
+                {"type": "http.response.start", "status": 304, "headers": headers.raw}
+            )
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        headers["Content-Length"] = str(len(entry["body"]))
+        await send(
+            {"type": "http.response.start", "status": 200, "headers": headers.raw}
+        )
+        await send({"type": "http.response.body", "body": entry["body"]})
+
+    async def _handle_mutation(self, scope, receive, send):
+        status_code = None
+
+        async def track(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, track)
+        finally:
+            if status_code is None or status_code < 400:
+                for prefix in self.invalidation_prefixes:
+                    if scope["path"].startswith(prefix):
+                        self.cache.invalidate(prefix)
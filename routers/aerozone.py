@@ -1,14 +1,27 @@
-import base64
-from typing import List
-from urllib.parse import unquote
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status, Form
-from sqlmodel import select, case
+import uuid
+from typing import List, Optional
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    Form,
+    Header,
+    HTTPException,
+    Query,
+    UploadFile,
+    status,
+)
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, update
+from sqlmodel import case, func, select
 from sqlalchemy.orm import joinedload
 from collections import defaultdict
+from datetime import datetime, timezone
 
 
 from database.connection import SessionDep
 from database.models import (
+    BlobDeleteRetry,
     Partner,
     PartnerCreate,
     PartnerEmail,
@@ -24,13 +37,35 @@ from database.models import (
 )
 from routers.auth.oauth2 import get_current_user
 from services.blob_service import (
-    delete_blob_from_url,
-    download_pdf_from_blob,
+    delete_blobs_from_urls,
+    open_pdf_from_blob,
     upload_pdf_to_blob,
 )
-from services.email_service import send_email_with_attachment
+from services.email_service import (
+    AttachmentBatcher,
+    AttachmentTooLargeError,
+    EmailDispatcher,
+    build_email_message,
+    encode_attachment,
+    message_overhead,
+)
 from services.invoice_processor import extract_tax_ids_from_pdf
-from services.partner_service import get_partner_by_tax_number
+from services.partner_service import (
+    get_partner_by_tax_number,
+    link_orphan_invoices,
+    partners_with_to_email,
+)
+from services.send_run_service import (
+    claim_partners,
+    drain_outbox,
+    finish_partner,
+    get_or_create_run,
+    operation_id_for,
+    record_delivered,
+    refresh_run_status,
+    unsent_invoices,
+)
+from utils.sql_helpers import chunked
 
 router = APIRouter(prefix="/aerozone", tags=["aerozone"])
 
@@ -39,73 +74,130 @@ OWN_TAX_ID = "25892941-2-41"
 
 @router.get("/invoices/all")
 def get_uploaded_invoices(
-    session: SessionDep, current_user: PlayerRead = Depends(get_current_user)
+    session: SessionDep,
+    invoice_status: Optional[Status] = Query(default=None, alias="status"),
+    summary: bool = False,
+    limit: Optional[int] = Query(default=None, ge=1),
+    offset: int = Query(default=0, ge=0),
+    current_user: PlayerRead = Depends(get_current_user),
 ):
-    statement = select(UploadedInvoice).options(
-        joinedload(UploadedInvoice.partner).joinedload(Partner.emails)
+    to_partners = partners_with_to_email()
+    is_complete = case((to_partners.c.partner_id != None, 1), else_=0).label(
+        "is_complete"
     )
-    invoices = session.exec(statement).unique().all()
 
-    incomplete = []
-
-    partner_invoice_map = defaultdict(lambda: {"partner_data": None, "invoices": []})
-
-    for invoice in invoices:
-        # Partner és annak emailcímei előkészítve frontendnek
-        partner_data = None
-        if invoice.partner:
-            emails = [email.model_dump() for email in invoice.partner.emails]
-            partner_data = invoice.partner.model_dump()
-            partner_data["emails"] = emails
-
-            to_emails = [email for email in emails if email["type"] == "to"]
-
-            if to_emails:  # van partner ÉS van legalább 1 "to" típusú email
-                partner_id = invoice.partner.id
-                # Itt csak egyszer állítod be az emails-t (többszörös hozzáadás esetén sincs gond)
-                if not partner_invoice_map[partner_id]["partner_data"]:
-                    partner_invoice_map[partner_id]["partner_data"] = partner_data
-                partner_invoice_map[partner_id]["invoices"].append(
-                    {
-                        "id": invoice.id,
-                        "filename": invoice.filename,
-                        "own_tax_id": invoice.own_tax_id,
-                        "partner_tax_id": invoice.partner_tax_id,
-                        "blob_url": invoice.blob_url,
-                        "status": invoice.status,
-                        "uploaded_at": invoice.uploaded_at,
-                    }
-                )
-            else:  # van partner, de nincs emailcím
-                incomplete.append(
-                    {
-                        "id": invoice.id,
-                        "filename": invoice.filename,
-                        "own_tax_id": invoice.own_tax_id,
-                        "partner_tax_id": invoice.partner_tax_id,
-                        "blob_url": invoice.blob_url,
-                        "status": invoice.status,
-                        "uploaded_at": invoice.uploaded_at,
-                        "partner_data": partner_data,
-                    }
-                )
-        else:  # nincs partner
-            incomplete.append(
+    if summary:
+        statement = (
+            select(
+                UploadedInvoice.partner_id,
+                Partner.name,
+                is_complete,
+                func.count(UploadedInvoice.id),
+            )
+            .outerjoin(Partner, UploadedInvoice.partner_id == Partner.id)
+            .outerjoin(
+                to_partners, UploadedInvoice.partner_id == to_partners.c.partner_id
+            )
+            .group_by(
+                UploadedInvoice.partner_id, Partner.name, to_partners.c.partner_id
+            )
+            .order_by(Partner.name, UploadedInvoice.partner_id)
+        )
+        if invoice_status:
+            statement = statement.where(UploadedInvoice.status == invoice_status)
+
+        result = {"complete": [], "incomplete": []}
+        for partner_id, partner_name, complete, invoice_count in session.exec(
+            statement
+        ).all():
+            result["complete" if complete else "incomplete"].append(
                 {
-                    "id": invoice.id,
-                    "filename": invoice.filename,
-                    "own_tax_id": invoice.own_tax_id,
-                    "partner_tax_id": invoice.partner_tax_id,
-                    "blob_url": invoice.blob_url,
-                    "status": invoice.status,
-                    "uploaded_at": invoice.uploaded_at,
-                    "partner_data": None,
+                    "partner_id": partner_id,
+                    "partner_name": partner_name,
+                    "invoice_count": invoice_count,
                 }
             )
+        return result
+
+    statement = (
+        select(
+            UploadedInvoice.id,
+            UploadedInvoice.filename,
+            UploadedInvoice.own_tax_id,
+            UploadedInvoice.partner_tax_id,
+            UploadedInvoice.blob_url,
+            UploadedInvoice.status,
+            UploadedInvoice.uploaded_at,
+            UploadedInvoice.partner_id,
+            is_complete,
+        )
+        .outerjoin(to_partners, UploadedInvoice.partner_id == to_partners.c.partner_id)
+        .order_by(UploadedInvoice.partner_id, UploadedInvoice.id)
+        .offset(offset)
+    )
+    if invoice_status:
+        statement = statement.where(UploadedInvoice.status == invoice_status)
+    if limit is not None:
+        statement = statement.limit(limit)
+
+    rows = session.exec(statement).all()
+
+    # Partner és annak emailcímei előkészítve frontendnek, partnerenként egyszer
+    partner_ids = {row.partner_id for row in rows if row.partner_id is not None}
+    partner_data_map = {}
+    for ids in chunked(partner_ids):
+        for partner_id, name, tax_number, contact in session.exec(
+            select(Partner.id, Partner.name, Partner.tax_number, Partner.contact).where(
+                Partner.id.in_(ids)
+            )
+        ).all():
+            partner_data_map[partner_id] = {
+                "id": partner_id,
+                "name": name,
+                "tax_number": tax_number,
+                "contact": contact,
+                "emails": [],
+            }
+        for partner_id, email_id, email, email_type in session.exec(
+            select(
+                PartnerEmailLink.partner_id,
+                PartnerEmail.id,
+                PartnerEmail.email,
+                PartnerEmail.type,
+            )
+            .join(PartnerEmail, PartnerEmailLink.email_id == PartnerEmail.id)
+            .where(PartnerEmailLink.partner_id.in_(ids))
+        ).all():
+            partner_data_map[partner_id]["emails"].append(
+                {"id": email_id, "email": email, "type": email_type}
+            )
+
+    incomplete = []
+    complete_grouped = {}
+
+    for row in rows:
+        invoice_data = {
+            "id": row.id,
+            "filename": row.filename,
+            "own_tax_id": row.own_tax_id,
+            "partner_tax_id": row.partner_tax_id,
+            "blob_url": row.blob_url,
+            "status": row.status,
+            "uploaded_at": row.uploaded_at,
+        }
+        partner_data = partner_data_map.get(row.partner_id)
+
+        if row.is_complete:  # van partner ÉS van legalább 1 "to" típusú email
+            group = complete_grouped.setdefault(
+                row.partner_id, {"partner_data": partner_data, "invoices": []}
+            )
+            group["invoices"].append(invoice_data)
+        else:  # nincs partner, vagy van partner, de nincs emailcím
+            invoice_data["partner_data"] = partner_data
+            incomplete.append(invoice_data)
 
-    complete_grouped = list(partner_invoice_map.values())
     return {
-        "complete": complete_grouped,
+        "complete": list(complete_grouped.values()),
         "incomplete": incomplete,
     }
 
@@ -133,8 +225,9 @@ async def upload_invoice(
         try:
 
             file_bytes = await file.read()
-            own_tax_id, partner_tax_id = extract_tax_ids_from_pdf(
-                file_bytes, OWN_TAX_ID
+            # Szkennelt PDF-nél OCR is futhat: ne az event loopot fogja
+            own_tax_id, partner_tax_id = await run_in_threadpool(
+                extract_tax_ids_from_pdf, file_bytes, OWN_TAX_ID
             )
 
             partner = (
@@ -182,110 +275,165 @@ def send_complete_invoices(
     session: SessionDep,
     subject: str = Form(...),
     message: str = Form(...),
+    idempotency_key: Optional[str] = Header(default=None, max_length=64),
+    max_partners: Optional[int] = Query(default=None, ge=1),
     current_user: PlayerRead = Depends(get_current_user),
 ):
-    statement = select(UploadedInvoice).options(
-        joinedload(UploadedInvoice.partner).joinedload(Partner.emails)
-    )
-    invoices = session.exec(statement).unique().all()
-
-    partner_invoice_map = defaultdict(
-        lambda: {"partner": None, "to_emails": [], "cc_emails": [], "invoices": []}
+    # Ugyanazzal az Idempotency-Key-jel megismételt kérés folytatja a futást: a
+    # már kiküldött partnereket kihagyja. max_partners-szel a futás több
+    # workerre/kérésre bontható.
+    # Kulcs nélkül mindig új pillanatkép készül; a már kézbesített (outboxban
+    # lévő) számlák abból is kimaradnak
+    run, created = get_or_create_run(
+        session, idempotency_key or uuid.uuid4().hex, subject, message
     )
-    for invoice in invoices:
-        partner = invoice.partner
-        if not partner:
-            continue
-
-        to_emails = [e for e in partner.emails if e.type == "to"]
-        cc_emails = [e for e in partner.emails if e.type == "cc"]
-        if not to_emails:
-            continue
+    if not created and (run.subject, run.message) != (subject, message):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Ez az Idempotency-Key már egy másik tárgyú/szövegű küldéshez tartozik.",
+        )
 
-        partner_id = partner.id
-        if not partner_invoice_map[partner_id]["partner"]:
-            partner_invoice_map[partner_id]["partner"] = partner
-            partner_invoice_map[partner_id]["to_emails"] = to_emails
-            partner_invoice_map[partner_id]["cc_emails"] = cc_emails
-        partner_invoice_map[partner_id]["invoices"].append(invoice)
+    worker_id = uuid.uuid4().hex
+    claims = [
+        (claim.id, claim.partner_id, claim)
+        for claim in claim_partners(session, run, worker_id, max_partners)
+    ]
+    partners = {
+        partner.id: partner
+        for ids in chunked(partner_id for _, partner_id, _ in claims)
+        for partner in session.exec(
+            select(Partner)
+            .where(Partner.id.in_(ids))
+            .options(joinedload(Partner.emails))
+        )
+        .unique()
+        .all()
+    }
 
     sent = []
     failed = []
+    partner_errors = defaultdict(list)
+
+    html = f"<p>{message.replace('\r\n', '<br>').replace('\n', '<br>').replace('\r', '<br>')}</p>"
+
+    # A levelek párhuzamosan, a közös ACS rate limit alatt mennek ki; a számlák
+    # csak a kézbesítés visszaigazolása után kerülnek a törlési outboxba
+    with EmailDispatcher() as dispatcher:
+        for claim_id, partner_id, claim in claims:
+            partner = partners.get(partner_id)
+            to_email_addresses = [
+                e.email for e in (partner.emails if partner else []) if e.type == "to"
+            ]
+            cc_email_addresses = [
+                e.email for e in (partner.emails if partner else []) if e.type == "cc"
+            ]
+            partner_name = partner.name if partner else str(partner_id)
+            if not to_email_addresses:
+                partner_errors[claim_id].append("Nincs címzett e-mail cím.")
+                continue
 
-    for p in partner_invoice_map.values():
-        to_email_addresses = [e.email for e in p["to_emails"]]
-        cc_email_addresses = [e.email for e in p["cc_emails"]]
-        partner_name = p["partner"].name
-        attachments = []
-
-        for invoice in p["invoices"]:
-            try:
-                print("BLOBOK LEKÉRDEZÉSE START")
-                pdf_bytes = download_pdf_from_blob(invoice.blob_url)
-            except Exception as e:
-                failed.append(
-                    {
-                        "partner": partner_name,
-                        "error": f"Nem sikerült a PDF-et letölteni: {invoice.filename} ({str(e)})",
-                    }
+            # A túl nagy partnerköteg több e-mailre bomlik; minden levél a
+            # méretkorlát alatt marad, és kiküldés után felszabadul
+            batcher = AttachmentBatcher(
+                reserved_bytes=message_overhead(
+                    to_email_addresses,
+                    cc_email_addresses,
+                    f"{subject} (folytatás 99)",
+                    html,
+                    message,
                 )
-                continue
-            print("VAN CSATOLMÁNY")
-            attachments.append(
-                {
-                    "name": invoice.filename,
-                    "contentType": "application/pdf",
-                    "contentInBase64": base64.b64encode(pdf_bytes).decode(),
-                }
-            )
-        if not attachments:
-            failed.append(
-                {"partner": partner_name, "error": "Nincs letölthető számla."}
             )
-            continue
-
-        try:
-
-            html = f"<p>{message.replace('\r\n', '<br>').replace('\n', '<br>').replace('\r', '<br>')}</p>"
+            batch_invoices = []
+            part = 0
+
+            def submit_batch(attachments, invoices):
+                nonlocal part
+                part += 1
+                dispatcher.submit(
+                    (
+                        claim_id,
+                        partner_name,
+                        to_email_addresses,
+                        invoices,
+                        [a["name"] for a in attachments],
+                    ),
+                    build_email_message(
+                        to_email_addresses,
+                        cc_email_addresses,
+                        subject if part == 1 else f"{subject} (folytatás {part})",
+                        html,
+                        message,
+                        attachments,
+                    ),
+                    operation_id=operation_id_for(
+                        run, partner_id, [invoice.id for invoice in invoices]
+                    ),
+                )
 
-            send_email_with_attachment(
-                to_emails=to_email_addresses,
-                cc_emails=cc_email_addresses,
-                subject=subject,
-                html=html,
-                plainText=message,
-                attachments=attachments,
-            )
+            for invoice in unsent_invoices(session, claim):
+                try:
+                    download = open_pdf_from_blob(invoice.blob_url)
+                    attachment = encode_attachment(
+                        invoice.filename,
+                        "application/pdf",
+                        download.chunks(),
+                        size=download.size,
+                        max_bytes=batcher.capacity,
+                    )
+                    ready = batcher.add(attachment)
+                except AttachmentTooLargeError as e:
+                    partner_errors[claim_id].append(str(e))
+                    failed.append({"partner": partner_name, "error": str(e)})
+                    continue
+                except Exception as e:
+                    error = f"Nem sikerült a PDF-et letölteni: {invoice.filename} ({str(e)})"
+                    partner_errors[claim_id].append(error)
+                    failed.append({"partner": partner_name, "error": error})
+                    continue
+                if ready:
+                    submit_batch(ready, batch_invoices)
+                    batch_invoices = []
+                batch_invoices.append(invoice)
+
+            ready = batcher.flush()
+            if ready:
+                submit_batch(ready, batch_invoices)
+
+        outcomes = dispatcher.wait()
+
+    for outcome in outcomes:
+        claim_id, partner_name, to_email_addresses, invoices, attachment_names = (
+            outcome["key"]
+        )
+        if outcome["status"] != "Succeeded":
+            error = f"E-mail küldési hiba: {outcome['error'] or outcome['status']}"
+            partner_errors[claim_id].append(error)
+            failed.append({"partner": partner_name, "error": error})
+            continue
 
-            print("EMAIL KÜLDÉS HÍVÁS end")
-            for invoice in p["invoices"]:
-                print("ITT LESZ MÉG HIBA: ", invoice.blob_url)
-                print("Blob törlés START")
-                delete_blob_from_url(unquote(invoice.blob_url))
-                print("Blob törlés sikeres")
+        record_delivered(session, run, invoices)
+        sent.append(
+            {
+                "partner": partner_name,
+                "emails": to_email_addresses,
+                "invoices": attachment_names,
+            }
+        )
 
-            for invoice in p["invoices"]:
-                session.delete(invoice)
+    for claim_id, _, _ in claims:
+        errors = partner_errors.get(claim_id)
+        finish_partner(
+            session, claim_id, worker_id, "; ".join(errors) if errors else None
+        )
 
-            session.commit()
+    drain_outbox(session, run.id)
 
-            sent.append(
-                {
-                    "partner": partner_name,
-                    "emails": to_email_addresses,
-                    "invoices": [a["name"] for a in attachments],
-                }
-            )
-        except Exception as e:
-            session.rollback()
-            failed.append(
-                {"partner": partner_name, "error": f"E-mail küldési hiba: {str(e)}"}
-            )
     return {
         "success": len(failed) == 0,
         "sent": sent,
         "failed": failed,
         "message": f"{len(sent)} email elküldve, {len(failed)} hibás.",
+        "run": refresh_run_status(session, run),
     }
 
 
@@ -293,25 +441,56 @@ def send_complete_invoices(
 def delete_invoices(
     session: SessionDep, current_user: PlayerRead = Depends(get_current_user)
 ):
-    invoices = session.exec(select(UploadedInvoice)).all()
-    errors = []
-
-    for invoice in invoices:
-        try:
-            if invoice.blob_url:
-                delete_blob_from_url(unquote(invoice.blob_url))
-        except Exception as e:
-            errors.append({"filename": invoice.filename, "error": str(e)})
-
-        session.delete(invoice)
+    invoices = session.exec(
+        select(UploadedInvoice.id, UploadedInvoice.filename, UploadedInvoice.blob_url)
+    ).all()
+    filenames_by_url = {
+        invoice.blob_url: invoice.filename for invoice in invoices if invoice.blob_url
+    }
 
+    # Előbb a sorok törlése és a blobok előjegyzése egy tranzakcióban; a blob
+    # csak ezután törlődik, így sosem marad sor hiányzó blobra mutatva
+    try:
+        if invoices:
+            # csak a lekérdezéskor meglévő számlák, a közben feltöltöttek maradnak
+            max_id = max(invoice.id for invoice in invoices)
+            session.exec(delete(UploadedInvoice).where(UploadedInvoice.id <= max_id))
+        retries = [
+            BlobDeleteRetry(blob_url=blob_url, attempts=0)
+            for blob_url in filenames_by_url
+        ]
+        session.add_all(retries)
+        session.flush()
+        retry_ids = {retry.blob_url: retry.id for retry in retries}
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+    failures = delete_blobs_from_urls(list(filenames_by_url))
+
+    failed_urls = dict(failures)
+    now = datetime.now(timezone.utc)
+    for blob_url, error in failures:
+        session.exec(
+            update(BlobDeleteRetry)
+            .where(BlobDeleteRetry.id == retry_ids[blob_url])
+            .values(attempts=1, error=error, last_attempt_at=now)
+        )
+    for ids in chunked(
+        retry_id for url, retry_id in retry_ids.items() if url not in failed_urls
+    ):
+        session.exec(delete(BlobDeleteRetry).where(BlobDeleteRetry.id.in_(ids)))
     session.commit()
 
-    if errors:
+    if failures:
         return {
             "success": False,
-            "message": f"{len(errors)} számla blob törlése sikertelen volt.",
-            "errors": errors,
+            "message": f"{len(failures)} számla blob törlése sikertelen volt, újrapróbálásra előjegyezve.",
+            "errors": [
+                {"filename": filenames_by_url[blob_url], "error": error}
+                for blob_url, error in failures
+            ],
         }
     else:
         return {
@@ -320,6 +499,35 @@ def delete_invoices(
         }
 
 
+@router.post("/blobs/retry-delete")
+def retry_blob_deletes(
+    session: SessionDep, current_user: PlayerRead = Depends(get_current_user)
+):
+    retries = session.exec(select(BlobDeleteRetry)).all()
+    failures = dict(delete_blobs_from_urls([retry.blob_url for retry in retries]))
+
+    now = datetime.now(timezone.utc)
+    for retry in retries:
+        if retry.blob_url in failures:
+            retry.attempts += 1
+            retry.error = failures[retry.blob_url]
+            retry.last_attempt_at = now
+        else:
+            session.delete(retry)
+    session.commit()
+
+    # A kiküldött számlák outboxában maradt törlések is itt futnak újra
+    outbox_deleted, outbox_failed = drain_outbox(session)
+
+    return {
+        "success": not failures and not outbox_failed,
+        "deleted": len(retries) - len(failures),
+        "failed": len(failures),
+        "outbox_deleted": outbox_deleted,
+        "outbox_failed": outbox_failed,
+    }
+
+
 @router.post(
     "/partner/create", status_code=status.HTTP_201_CREATED, response_model=PartnerRead
 )
@@ -333,19 +541,10 @@ def create_partner(
         name=partner.name, tax_number=partner.tax_number, contact=partner.contact
     )
     session.add(db_partner)
-    session.commit()
-    session.refresh(db_partner)
-
-    statement = select(UploadedInvoice).where(
-        UploadedInvoice.partner_id == None,
-        UploadedInvoice.partner_tax_id == db_partner.tax_number,
-    )
-    invoices_to_update = session.exec(statement).all()
+    session.flush()
 
-    for inv in invoices_to_update:
-        inv.partner_id = db_partner.id
-    if invoices_to_update:
-        session.commit()
+    link_orphan_invoices(session, db_partner)
+    session.commit()
 
     session.refresh(db_partner)
     return db_partner
@@ -366,20 +565,12 @@ def update_partner(
         setattr(partner, key, value)
 
     session.add(partner)
+    session.flush()
+
+    link_orphan_invoices(session, partner)
     session.commit()
     session.refresh(partner)
 
-    statement = select(UploadedInvoice).where(
-        UploadedInvoice.partner_id == None,
-        UploadedInvoice.partner_tax_id == partner.tax_number,
-    )
-    invoices_to_update = session.exec(statement).all()
-
-    for inv in invoices_to_update:
-        inv.partner_id = partner.id
-    if invoices_to_update:
-        session.commit()
-
     return partner
 
 
@@ -390,18 +581,19 @@ def delete_partner(
     current_user: PlayerRead = Depends(get_current_user),
 ):
 
-    statement = select(PartnerEmailLink).where(
-        PartnerEmailLink.partner_id == partner_id
+    session.exec(
+        delete(PartnerEmailLink).where(PartnerEmailLink.partner_id == partner_id)
     )
-    links = session.exec(statement).all()
-    for link in links:
-        session.delete(link)
-    session.commit()
-
-    partner = session.get(Partner, partner_id)
-    if not partner:
+    # A számlák megmaradnak partner nélkül, egy új partner újra magához köti őket
+    session.exec(
+        update(UploadedInvoice)
+        .where(UploadedInvoice.partner_id == partner_id)
+        .values(partner_id=None)
+    )
+    result = session.exec(delete(Partner).where(Partner.id == partner_id))
+    if result.rowcount == 0:
+        session.rollback()
         raise HTTPException(status_code=404, detail="Partner not found")
-    session.delete(partner)
     session.commit()
     return {"success": "true"}
 
@@ -462,16 +654,11 @@ def delete_partner(
     current_user: PlayerRead = Depends(get_current_user),
 ):
 
-    statement = select(PartnerEmailLink).where(PartnerEmailLink.email_id == email_id)
-    links = session.exec(statement).all()
-    for link in links:
-        session.delete(link)
-    session.commit()
-
-    email = session.get(PartnerEmail, email_id)
-    if not email:
+    session.exec(delete(PartnerEmailLink).where(PartnerEmailLink.email_id == email_id))
+    result = session.exec(delete(PartnerEmail).where(PartnerEmail.id == email_id))
+    if result.rowcount == 0:
+        session.rollback()
         raise HTTPException(status_code=404, detail="Email not found")
-    session.delete(email)
     session.commit()
     return {"success": "true"}
 
@@ -511,36 +698,46 @@ def get_available_to_emails(
 
 @router.get("/connection/all")
 def get_connections(
-    session: SessionDep, current_user: PlayerRead = Depends(get_current_user)
+    session: SessionDep,
+    limit: Optional[int] = Query(default=None, ge=1),
+    offset: int = Query(default=0, ge=0),
+    current_user: PlayerRead = Depends(get_current_user),
 ):
 
     type_order = case((PartnerEmail.type == "to", 0), else_=1)
 
     statement = (
-        select(PartnerEmailLink)
-        .options(
-            joinedload(PartnerEmailLink.partner), joinedload(PartnerEmailLink.email)
+        select(
+            PartnerEmailLink.partner_id,
+            Partner.name,
+            PartnerEmailLink.email_id,
+            PartnerEmail.email,
+            PartnerEmail.type,
         )
         .join(Partner, PartnerEmailLink.partner_id == Partner.id)
         .join(PartnerEmail, PartnerEmailLink.email_id == PartnerEmail.id)
-        .order_by(Partner.name, type_order)
-    )
-
-    links = session.exec(statement).all()
-    result = []
-    for link in links:
-        partner = session.get(Partner, link.partner_id)
-        email = session.get(PartnerEmail, link.email_id)
-        result.append(
-            {
-                "partner_id": link.partner_id,
-                "partner_name": partner.name if partner else None,
-                "email_id": link.email_id,
-                "email": email.email if email else None,
-                "type": email.type if email else None,
-            }
+        .order_by(
+            Partner.name,
+            type_order,
+            PartnerEmailLink.partner_id,
+            PartnerEmailLink.email_id,
         )
-    return result
+        .offset(offset)
+    )
+    if limit is not None:
+        statement = statement.limit(limit)
+
+    rows = session.exec(statement).all()
+    return [
+        {
+            "partner_id": partner_id,
+            "partner_name": partner_name,
+            "email_id": email_id,
+            "email": email,
+            "type": email_type,
+        }
+        for partner_id, partner_name, email_id, email, email_type in rows
+    ]
 
 
 @router.post("/connection/create")
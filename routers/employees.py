@@ -1,6 +1,5 @@
 from fastapi import APIRouter
 import os
-import msal
 import requests
 from sqlmodel import select
 
@@ -20,6 +19,8 @@ def get_access_token():
             "Hiányzik valamelyik env: AZURE_TENANT_ID / AZURE_CLIENT_ID / AZURE_CLIENT_SECRET"
         )
 
+    import msal
+
     app = msal.ConfidentialClientApplication(
         CLIENT_ID,
         authority=f"https://login.microsoftonline.com/{TENANT_ID}",
@@ -1,7 +1,17 @@
+from contextlib import nullcontext
 from typing import List
-import base64
-from fastapi import APIRouter, Depends, Form, UploadFile, File, HTTPException, status
-from fastapi.responses import StreamingResponse
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    Form,
+    Header,
+    HTTPException,
+    Query,
+    UploadFile,
+    status,
+)
+from fastapi.concurrency import run_in_threadpool
 from sqlmodel import select
 from sqlalchemy.orm import joinedload
 
@@ -14,10 +24,35 @@ from database.models import (
     TeszorVatLedgerMapRead,
 )
 from routers.auth.oauth2 import get_current_user
-from services.email_service import send_email_with_attachment
-from services.invoice_processor import process_vodafone
+from services.artifact_store import (
+    artifact_id_for,
+    artifact_store,
+    mapping_version,
+    workbook_cache,
+    workbook_key,
+)
+from services.email_service import (
+    AttachmentTooLargeError,
+    encode_attachment,
+    send_email_with_attachment,
+)
+from services.invoice_processor import (
+    ParseProfiler,
+    collect_vodafone,
+    iter_vodafone,
+    process_vodafone,
+    vodafone_result_from_json,
+    vodafone_result_to_json,
+)
 from utils.excel_export import export_vodafone_to_excel_bytes
 from utils.mapping_helpers import get_phone_user_map, get_teszor_mapping_lookup
+from utils.row_export import (
+    negotiate_format,
+    records_response,
+    vodafone_event_records,
+    vodafone_records,
+    workbook_response,
+)
 
 router = APIRouter(prefix="/esselte", tags=["esselte"])
 
@@ -60,10 +95,106 @@ def get_teszor_mappings(
     return result
 
 
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _vodafone_filename(invoice_number: str | None) -> str:
+    return (
+        f"vodafone_{invoice_number}.xlsx"
+        if invoice_number
+        else "vodafone_invoice_data.xlsx"
+    )
+
+
+def _parse_vodafone_artifact(pdf_bytes: bytes, filename: str, profiler=None):
+    """Returns (artifact_id, result), parsing the PDF only if no live artifact exists."""
+    artifact_id = artifact_id_for("vodafone", pdf_bytes)
+    if artifact_store.get_meta(artifact_id) is not None:
+        result = artifact_store.get_result(artifact_id)
+        if result is not None:
+            # Ugyanaz a PDF más néven: a meta az utolsó feltöltést tükrözze
+            artifact_store.refresh_meta(artifact_id, filename=filename)
+            return artifact_id, vodafone_result_from_json(result)
+
+    with profiler or nullcontext():
+        result = process_vodafone(pdf_bytes)
+
+    if not result["invoice_summary"] and not result["service_charges"]:
+        raise _no_invoice_data_error()
+
+    _store_vodafone_artifact(artifact_id, pdf_bytes, filename, result)
+    return artifact_id, result
+
+
+def _no_invoice_data_error() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Csak olyan PDF fájl tölthető fel, amely releváns számlaadatokat tartalmaz.",
+    )
+
+
+def _store_vodafone_artifact(artifact_id: str, pdf_bytes: bytes, filename, result):
+    artifact_store.put(
+        artifact_id,
+        pdf_bytes,
+        vodafone_result_to_json(result),
+        filename=filename,
+        invoice_number=result["invoice_number"],
+    )
+
+
+def _stream_vodafone_events(pdf_bytes: bytes, filename: str, artifact_id: str):
+    """
+    `iter_vodafone` events for a response that is written while later pages
+    are still being parsed. The PDF is read up to its first row before
+    returning, so an irrelevant PDF still gets a 400; the artifact is stored
+    once the last page is done.
+    """
+    result = {"invoice_number": "", "invoice_summary": [], "service_charges": []}
+    events = collect_vodafone(iter_vodafone(pdf_bytes), result)
+    head = []
+    for event in events:
+        head.append(event)
+        if event[0] != "invoice_number":
+            break
+    if not result["invoice_summary"] and not result["service_charges"]:
+        raise _no_invoice_data_error()
+
+    def stream():
+        yield from head
+        yield from events
+        _store_vodafone_artifact(artifact_id, pdf_bytes, filename, result)
+
+    return stream()
+
+
+def _render_vodafone_workbook(session, artifact_id: str, pdf_bytes: bytes, result):
+    """
+    The workbook cache entry for the invoice with the current mapping tables,
+    rendered only if missing; also stored with the artifact for sending.
+    """
+    mappings = (get_phone_user_map(session), *get_teszor_mapping_lookup(session))
+    key = workbook_key("vodafone", pdf_bytes, mapping_version(*mappings))
+    workbook = workbook_cache.get(key)
+    if workbook is None:
+        content = export_vodafone_to_excel_bytes(result, *mappings).getvalue()
+        workbook = workbook_cache.put(
+            key, content, _vodafone_filename(result["invoice_number"])
+        )
+    else:
+        with open(workbook["path"], "rb") as f:
+            content = f.read()
+    artifact_store.put_workbook(artifact_id, content)
+    return workbook, content
+
+
 @router.post("/upload/invoice/vodafone")
 async def upload_vodafone(
     session: SessionDep,
     file: UploadFile = File(...),
+    output_format: str | None = Query(default=None, alias="format"),
+    accept: str | None = Header(default=None),
+    x_debug_profile: str | None = Header(default=None),
     current_user: PlayerRead = Depends(get_current_user),
 ):
 
@@ -73,31 +204,46 @@ async def upload_vodafone(
             detail="Csak PDF fájl feltöltése engedélyezett.",
         )
 
+    fmt = negotiate_format(accept, output_format)
     pdf_bytes = await file.read()
-    result = process_vodafone(pdf_bytes)
+    profiler = ParseProfiler.from_debug_header(x_debug_profile)
 
-    if not result["invoice_summary"] and not result["service_charges"]:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Csak olyan PDF fájl tölthető fel, amely releváns számlaadatokat tartalmaz.",
-        )
+    if fmt == "ndjson" and not profiler.enabled:
+        # Nincs még artifact: a sorok oldalanként mennek ki, nem a végén
+        artifact_id = artifact_id_for("vodafone", pdf_bytes)
+        if artifact_store.get_meta(artifact_id) is None:
+            events = await run_in_threadpool(
+                _stream_vodafone_events, pdf_bytes, file.filename, artifact_id
+            )
+            return records_response(
+                fmt,
+                vodafone_event_records(events),
+                "vodafone_invoice_data",
+                {"X-Artifact-Id": artifact_id},
+            )
 
-    try:
-        phone_user_map = get_phone_user_map(session)
-        teszor_category_map, mapping_lookup = get_teszor_mapping_lookup(session)
-        excel_buffer = export_vodafone_to_excel_bytes(
-            result, phone_user_map, teszor_category_map, mapping_lookup
+    # Szkennelt számlánál oldalanként OCR is futhat: ne az event loopot fogja
+    artifact_id, result = await run_in_threadpool(
+        _parse_vodafone_artifact, pdf_bytes, file.filename, profiler
+    )
+    headers = {"X-Artifact-Id": artifact_id, **profiler.response_headers()}
+
+    if fmt != "xlsx":
+        return records_response(
+            fmt,
+            vodafone_records(result),
+            f"vodafone_{result['invoice_number'] or 'invoice_data'}",
+            headers,
         )
 
-        filename = (
-            f"vodafone_{result["invoice_number"]}.xlsx"
-            if result["invoice_number"]
-            else "vodafone_invoice_data.xlsx"
+    try:
+        # Az előnézet mindig a friss mappingekkel készül; a küldés ezt a
+        # munkafüzetet csatolja, újrafeldolgozás nélkül
+        workbook, _ = await run_in_threadpool(
+            _render_vodafone_workbook, session, artifact_id, pdf_bytes, result
         )
-        return StreamingResponse(
-            excel_buffer,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        return workbook_response(
+            workbook, headers, filename=_vodafone_filename(result["invoice_number"])
         )
 
     except Exception as e:
@@ -108,58 +254,64 @@ async def upload_vodafone(
 
 
 @router.post("/send/vodafone")
-async def upload_vodafone(
+async def send_vodafone(
     session: SessionDep,
     recipient: str = Form(...),
     subject: str = Form(...),
     message: str = Form(...),
-    attachment: UploadFile = File(...),
+    artifact_id: str | None = Form(default=None),
+    attachment: UploadFile | None = File(default=None),
     current_user: PlayerRead = Depends(get_current_user),
 ):
 
     html = f"<p>{message.replace('\r\n', '<br>').replace('\n', '<br>').replace('\r', '<br>')}</p>"
 
-    if attachment.content_type != "application/pdf":
-        raise HTTPException(
-            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
-            detail="Csak PDF fájl feltöltése engedélyezett.",
+    if artifact_id:
+        meta = artifact_store.get_meta(artifact_id)
+        pdf_bytes = artifact_store.get_source(artifact_id) if meta else None
+        result = artifact_store.get_result(artifact_id) if meta else None
+        if pdf_bytes is None or result is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="A feldolgozott számla lejárt vagy nem létezik, töltsd fel újra a PDF-et.",
+            )
+        result = vodafone_result_from_json(result)
+        pdf_filename = meta["filename"]
+    elif attachment is not None:
+        if attachment.content_type != "application/pdf":
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail="Csak PDF fájl feltöltése engedélyezett.",
+            )
+        pdf_bytes = await attachment.read()
+        artifact_id, result = await run_in_threadpool(
+            _parse_vodafone_artifact, pdf_bytes, attachment.filename
         )
-
-    pdf_bytes = await attachment.read()
-    result = process_vodafone(pdf_bytes)
-
-    if not result["invoice_summary"] and not result["service_charges"]:
+        pdf_filename = attachment.filename
+    else:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Csak olyan PDF fájl tölthető fel, amely releváns számlaadatokat tartalmaz.",
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Adj meg egy artifact_id-t vagy csatolj PDF fájlt.",
         )
 
     try:
-        phone_user_map = get_phone_user_map(session)
-        teszor_category_map, mapping_lookup = get_teszor_mapping_lookup(session)
-        excel_buffer = export_vodafone_to_excel_bytes(
-            result, phone_user_map, teszor_category_map, mapping_lookup
-        )
+        workbook = artifact_store.get_workbook(artifact_id)
+        if workbook is None:
+            _, workbook = await run_in_threadpool(
+                _render_vodafone_workbook, session, artifact_id, pdf_bytes, result
+            )
 
-        filename = (
-            f"vodafone_{result["invoice_number"]}.xlsx"
-            if result["invoice_number"]
-            else "vodafone_invoice_data.xlsx"
-        )
         attachments = [
-            {
-                "name": attachment.filename,
-                "contentType": "application/pdf",
-                "contentInBase64": base64.b64encode(pdf_bytes).decode(),
-            },
-            {
-                "name": filename,
-                "contentType": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                "contentInBase64": base64.b64encode(excel_buffer.getvalue()).decode(),
-            },
+            encode_attachment(pdf_filename, "application/pdf", pdf_bytes),
+            encode_attachment(
+                _vodafone_filename(result["invoice_number"]),
+                XLSX_MEDIA_TYPE,
+                workbook,
+            ),
         ]
         to_list = [recipient]
-        result = send_email_with_attachment(
+        result = await run_in_threadpool(
+            send_email_with_attachment,
             to_emails=to_list,
             cc_emails=["kraaliknorbert@gmail.com"],
             subject=subject,
@@ -170,8 +322,13 @@ async def upload_vodafone(
 
         return result
 
+    except HTTPException:
+        raise
+    except AttachmentTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e)
+        )
     except Exception as e:
-        print("ez küldöm vissza")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Váratlan hiba történt: {e}",
@@ -0,0 +1,58 @@
+import asyncio
+import os
+import time
+
+from fastapi import APIRouter, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+
+from database.connection import get_engine
+from database.migrations import SCHEMA_REVISION, check_schema_version
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+READINESS_CACHE_SECONDS = float(os.getenv("READINESS_CACHE_SECONDS", 10))
+READINESS_TIMEOUT_SECONDS = float(os.getenv("READINESS_TIMEOUT_SECONDS", 3))
+
+_schema = None
+_checked_at = 0.0
+_check_lock = asyncio.Lock()
+
+
+async def _schema_status():
+    global _schema, _checked_at
+    # Egyszerre egy ellenőrzés fut, a többi próba a friss eredményt kapja
+    async with _check_lock:
+        if _schema is None or time.monotonic() - _checked_at >= READINESS_CACHE_SECONDS:
+            try:
+                _schema = await asyncio.wait_for(
+                    run_in_threadpool(lambda: check_schema_version(get_engine())),
+                    READINESS_TIMEOUT_SECONDS,
+                )
+            except Exception as e:
+                _schema = {
+                    "ready": False,
+                    "current": None,
+                    "expected": SCHEMA_REVISION,
+                    "detail": f"Séma ellenőrzés sikertelen: {e.__class__.__name__}",
+                }
+            _checked_at = time.monotonic()
+        return _schema
+
+
+@router.get("/live")
+def live():
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+async def ready():
+    # A séma verziót legfeljebb READINESS_CACHE_SECONDS-onként kérdezi le, így a
+    # deploy közben futtatott migráció után a worker újraindítás nélkül kész lesz
+    schema = await _schema_status()
+    if not schema["ready"]:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": "not_ready", "schema": schema},
+        )
+    return {"status": "ready", "schema": schema}
@@ -0,0 +1,203 @@
+from fastapi import (
+    APIRouter,
+    File,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    UploadFile,
+    status,
+)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse
+
+from database.connection import SessionDep
+from services.artifact_store import workbook_cache
+from services.invoice_convert import (
+    OUTPUTS,
+    InvoiceConversionError,
+    cached_workbook,
+    check_output,
+    invoice_filename_base,
+    parse_invoice,
+)
+from services.invoice_processor import ParseProfiler
+from services.job_queue import job_queue
+from utils.row_export import negotiate_format, records_response, workbook_response
+
+router = APIRouter(prefix="/invoices", tags=["invoices"])
+
+JOB_POLL_AFTER_SECONDS = 2
+
+
+def _check_pdf(file: UploadFile):
+    if file.content_type != "application/pdf":
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Csak PDF fájl feltöltése engedélyezett.",
+        )
+
+
+@router.post("/convert")
+async def convert_invoice(
+    session: SessionDep,
+    file: UploadFile = File(...),
+    vendor: str | None = Query(default=None),
+    output_format: str | None = Query(default=None, alias="format"),
+    accept: str | None = Header(default=None),
+    x_debug_profile: str | None = Header(default=None),
+):
+    """
+    Converts any supported invoice PDF. The vendor is detected from the first
+    page unless `?vendor=` is given; the detected one is returned in
+    `X-Invoice-Vendor`. Workbooks come from the workbook cache when the same
+    PDF was already converted with the current mappings; `X-Workbook-Id`
+    names it for conditional/range downloads from `/invoices/workbooks/{id}`.
+    """
+
+    _check_pdf(file)
+    fmt = negotiate_format(accept, output_format)
+    pdf_bytes = await file.read()
+
+    profiler = ParseProfiler.from_debug_header(x_debug_profile)
+    try:
+        # A felismerés és a feldolgozás OCR-re is várhat: threadpoolban fut
+        if fmt == "xlsx":
+            vendor, workbook = await run_in_threadpool(
+                profiler.run, cached_workbook, pdf_bytes, vendor, session
+            )
+        else:
+            vendor, data = await run_in_threadpool(
+                profiler.run, parse_invoice, pdf_bytes, vendor
+            )
+    except InvoiceConversionError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    headers = {"X-Invoice-Vendor": vendor, **profiler.response_headers()}
+    if fmt == "xlsx":
+        return workbook_response(workbook, headers)
+    return records_response(
+        fmt,
+        OUTPUTS[vendor]["records"](data),
+        invoice_filename_base(vendor, data),
+        headers,
+    )
+
+
+@router.get("/workbooks/{workbook_id}")
+def download_workbook(
+    workbook_id: str, if_none_match: str | None = Header(default=None)
+):
+    """A converted workbook again, with ETag (304) and Range support."""
+    workbook = workbook_cache.get(workbook_id)
+    if workbook is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="A munkafüzet lejárt vagy nem létezik, konvertáld újra a PDF-et.",
+        )
+    return workbook_response(workbook, if_none_match=if_none_match)
+
+
+def _job_view(request: Request, job: dict) -> dict:
+    view = {
+        "id": job["id"],
+        "status": job["status"],
+        "format": job["params"]["format"],
+        "vendor": (job["result"] or {}).get("vendor") or job["params"].get("vendor"),
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+    if job["status"] == "queued":
+        view["queue_position"] = job_queue.position(job["id"])
+    if job["status"] == "done":
+        view["filename"] = job["result"]["filename"]
+        view["result_url"] = str(
+            request.url_for("download_convert_job", job_id=job["id"])
+        )
+    return view
+
+
+def _get_job(job_id: str) -> dict:
+    try:
+        job = job_queue.get(job_id)
+    except KeyError:
+        job = None
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="A feladat nem létezik vagy már törölve lett.",
+        )
+    return job
+
+
+@router.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_convert_job(
+    request: Request,
+    file: UploadFile = File(...),
+    vendor: str | None = Query(default=None),
+    output_format: str | None = Query(default=None, alias="format"),
+    accept: str | None = Header(default=None),
+):
+    """
+    Queues a conversion for the worker processes (`python worker.py`) and
+    returns immediately; poll the `Location` URL, then download the result.
+    """
+
+    _check_pdf(file)
+    fmt = negotiate_format(accept, output_format)
+    try:
+        check_output(vendor, fmt)
+    except InvoiceConversionError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    pdf_bytes = await file.read()
+
+    job_id = await run_in_threadpool(
+        job_queue.submit,
+        "convert",
+        {"vendor": vendor, "format": fmt, "filename": file.filename},
+        pdf_bytes,
+    )
+    job = await run_in_threadpool(job_queue.get, job_id)
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=_job_view(request, job),
+        headers={
+            "Location": str(request.url_for("get_convert_job", job_id=job_id)),
+            "Retry-After": str(JOB_POLL_AFTER_SECONDS),
+        },
+    )
+
+
+@router.get("/jobs/{job_id}")
+def get_convert_job(job_id: str, request: Request):
+    job = _get_job(job_id)
+    headers = {}
+    if job["status"] in ("queued", "running"):
+        headers["Retry-After"] = str(JOB_POLL_AFTER_SECONDS)
+    return JSONResponse(content=_job_view(request, job), headers=headers)
+
+
+@router.get("/jobs/{job_id}/result")
+def download_convert_job(job_id: str):
+    job = _get_job(job_id)
+    if job["status"] == "failed":
+        raise HTTPException(
+            status_code=(job["result"] or {}).get(
+                "status_code", status.HTTP_422_UNPROCESSABLE_ENTITY
+            ),
+            detail=job["error"],
+        )
+    if job["status"] != "done":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A feladat még nem készült el.",
+            headers={"Retry-After": str(JOB_POLL_AFTER_SECONDS)},
+        )
+    result = job["result"]
+    return FileResponse(
+        job_queue.result_path(job_id),
+        media_type=result["media_type"],
+        filename=result["filename"],
+        headers={"X-Invoice-Vendor": result["vendor"]},
+    )
@@ -1,10 +1,30 @@
 import base64
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, status
+import shutil
+from typing import List, Literal
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    Header,
+    HTTPException,
+    Query,
+    UploadFile,
+    status,
+)
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
 
+from services.artifact_store import workbook_cache, workbook_key
+
 # from database.models import PlayerRead
 # from routers.auth.oauth2 import get_current_user
+from services.batch_processor import (
+    build_batch_workbook,
+    stage_uploads,
+    stream_batch_zip,
+)
 from services.invoice_processor import (
+    ParseProfiler,
     process_multialarm,
     process_volvo,
 )
@@ -12,7 +32,13 @@ from utils.excel_export import (
     export_multialarm_to_excel_bytes,
     export_volvo_to_excel_bytes,
 )
-
+from utils.row_export import (
+    multialarm_records,
+    negotiate_format,
+    records_response,
+    volvo_records,
+    workbook_response,
+)
 
 router = APIRouter(prefix="/nijhof", tags=["nijhof"])
 
@@ -22,6 +48,9 @@ OWN_TAX_ID = "25892941-2-41"
 @router.post("/upload/invoice/volvo")
 async def upload_volvo(
     file: UploadFile = File(...),
+    output_format: str | None = Query(default=None, alias="format"),
+    accept: str | None = Header(default=None),
+    x_debug_profile: str | None = Header(default=None),
     # file: UploadFile = File(...), current_user: PlayerRead = Depends(get_current_user)
 ):
 
@@ -31,42 +60,62 @@ async def upload_volvo(
             detail="Csak PDF fájl feltöltése engedélyezett.",
         )
 
+    fmt = negotiate_format(accept, output_format)
     pdf_bytes = await file.read()
 
+    # Ugyanaz a PDF ugyanazt a munkafüzetet adja: feldolgozás nélkül kiszolgálható
+    cache_key = workbook_key("volvo", pdf_bytes)
+    if fmt == "xlsx":
+        workbook = workbook_cache.get(cache_key)
+        if workbook is not None:
+            return workbook_response(workbook)
+
+    profiler = ParseProfiler.from_debug_header(x_debug_profile)
     try:
-        data = process_volvo(pdf_bytes)
+        # Szkennelt PDF-nél OCR is futhat: ne az event loopot fogja
+        data = await run_in_threadpool(profiler.run, process_volvo, pdf_bytes)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail=f"Nem sikerült a PDF-et feldolgozni: {str(e)}",
         )
 
+    invoice_number = (
+        data[0]["invoice_number"]
+        if data and "invoice_number" in data[0]
+        else "unknown_invoice_number"
+    )
+
+    if fmt != "xlsx":
+        return records_response(
+            fmt,
+            volvo_records(data),
+            f"volvo_invoice_{invoice_number}",
+            profiler.response_headers(),
+        )
+
     try:
-        excel_bytes = export_volvo_to_excel_bytes(data)
+        excel_bytes = await run_in_threadpool(export_volvo_to_excel_bytes, data)
+        workbook = workbook_cache.put(
+            cache_key,
+            excel_bytes.getvalue(),
+            f"volvo_invoice_{invoice_number}.xlsx",
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Nem sikerült az Excel fájlt létrehozni: {str(e)}",
         )
 
-    invoice_number = (
-        data[0]["invoice_number"]
-        if data and "invoice_number" in data[0]
-        else "unknown_invoice_number"
-    )
-
-    return StreamingResponse(
-        excel_bytes,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={
-            "Content-Disposition": f'attachment; filename="volvo_invoice_{invoice_number}.xlsx"'
-        },
-    )
+    return workbook_response(workbook, profiler.response_headers())
 
 
 @router.post("/upload/invoice/multialarm")
 async def upload_multialarm(
     file: UploadFile = File(...),
+    output_format: str | None = Query(default=None, alias="format"),
+    accept: str | None = Header(default=None),
+    x_debug_profile: str | None = Header(default=None),
     # file: UploadFile = File(...), current_user: PlayerRead = Depends(get_current_user)
 ):
 
@@ -76,10 +125,20 @@ async def upload_multialarm(
             detail="Csak PDF fájl feltöltése engedélyezett.",
         )
 
+    fmt = negotiate_format(accept, output_format)
     pdf_bytes = await file.read()
 
+    # Ugyanaz a PDF ugyanazt a munkafüzetet adja: feldolgozás nélkül kiszolgálható
+    cache_key = workbook_key("multialarm", pdf_bytes)
+    if fmt == "xlsx":
+        workbook = workbook_cache.get(cache_key)
+        if workbook is not None:
+            return workbook_response(workbook)
+
+    profiler = ParseProfiler.from_debug_header(x_debug_profile)
     try:
-        data = process_multialarm(pdf_bytes)
+        # Szkennelt PDF-nél OCR is futhat: ne az event loopot fogja
+        data = await run_in_threadpool(profiler.run, process_multialarm, pdf_bytes)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
@@ -92,8 +151,22 @@ async def upload_multialarm(
             detail="Nem található feldolgozható adat a PDF-ben.",
         )
 
+    invoice_number = (
+        data[0]["invoice_number"]
+        if data and "invoice_number" in data[0]
+        else "unknown_invoice_number"
+    )
+
+    if fmt != "xlsx":
+        return records_response(
+            fmt,
+            multialarm_records(data),
+            f"multialarm_invoice_{invoice_number}",
+            profiler.response_headers(),
+        )
+
     try:
-        excel_bytes = export_multialarm_to_excel_bytes(data)
+        excel_bytes = await run_in_threadpool(export_multialarm_to_excel_bytes, data)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -107,16 +180,65 @@ async def upload_multialarm(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
             detail="Nem sikerült Excel fájlt generálni a feldolgozott adatokból.",
         )
-    invoice_number = (
-        data[0]["invoice_number"]
-        if data and "invoice_number" in data[0]
-        else "unknown_invoice_number"
+
+    workbook = workbook_cache.put(
+        cache_key,
+        excel_bytes.getvalue(),
+        f"multialarm_invoice_{invoice_number}.xlsx",
     )
+    return workbook_response(workbook, profiler.response_headers())
+
+
+@router.post("/upload/invoices/{vendor}/batch")
+async def upload_invoice_batch(
+    vendor: Literal["volvo", "multialarm"],
+    files: List[UploadFile] = File(...),
+    output: Literal["workbook", "sheets", "zip"] = "workbook",
+    # file: UploadFile = File(...), current_user: PlayerRead = Depends(get_current_user)
+):
+
+    invalid = [
+        file.filename for file in files if file.content_type != "application/pdf"
+    ]
+    if invalid:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Csak PDF fájl feltöltése engedélyezett: {', '.join(invalid)}",
+        )
+
+    # A feltöltött fájlokat a FastAPI a válasz streamelése előtt lezárja
+    directory, staged = await run_in_threadpool(stage_uploads, files)
+
+    if output == "zip":
+        return StreamingResponse(
+            stream_batch_zip(vendor, directory, staged),
+            media_type="application/zip",
+            headers={
+                "Content-Disposition": f'attachment; filename="{vendor}_invoices.zip"'
+            },
+        )
+
+    try:
+        excel_bytes, parsed_count, errors = await build_batch_workbook(
+            vendor, staged, sheet_per_invoice=output == "sheets"
+        )
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if not parsed_count:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=[
+                {"filename": filename, "error": error} for filename, error in errors
+            ],
+        )
 
     return StreamingResponse(
         excel_bytes,
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         headers={
-            "Content-Disposition": f'attachment; filename="multialarm_invoice_{invoice_number}.xlsx"'
+            "Content-Disposition": f'attachment; filename="{vendor}_invoices.xlsx"',
+            "X-Batch-Parsed": str(parsed_count),
+            "X-Batch-Failed": str(len(errors)),
         },
     )
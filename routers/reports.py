@@ -76,5 +76,4 @@ def get_overdue_by_partner(
         .group_by(InvoiceStatusSummary.partner_name)
     )
     results = session.exec(query).all()
-    print(results)
     return [{"partner": row[0], "overdue": row[1]} for row in results]
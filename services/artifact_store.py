@@ -0,0 +1,259 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from middleware.response_cache import make_etag
+from utils.metrics import registry
+
+ARTIFACT_DIR = os.getenv(
+    "ARTIFACT_DIR", os.path.join(tempfile.gettempdir(), "parse_artifacts")
+)
+ARTIFACT_TTL_SECONDS = int(os.getenv("ARTIFACT_TTL_SECONDS", 3600))
+_SWEEP_INTERVAL_SECONDS = 300
+WORKBOOK_CACHE_DIR = os.getenv(
+    "WORKBOOK_CACHE_DIR", os.path.join(tempfile.gettempdir(), "workbook_cache")
+)
+WORKBOOK_CACHE_MAX_BYTES = int(os.getenv("WORKBOOK_CACHE_MAX_BYTES", 2 * 2**30))
+
+workbook_cache_requests = registry.counter(
+    "app_workbook_cache_total",
+    "Rendered workbook cache lookups and evictions, by kind and outcome "
+    "(hit, miss, evicted).",
+    ["kind", "outcome"],
+)
+
+
+def artifact_id_for(kind: str, source: bytes) -> str:
+    return f"{kind}-{hashlib.sha256(source).hexdigest()}"
+
+
+def _write_atomic(path: str, data: bytes):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _check_id(artifact_id: str):
+    if not artifact_id or not all(c.isalnum() or c == "-" for c in artifact_id):
+        raise KeyError(artifact_id)
+
+
+class ArtifactStore:
+    """
+    Parse artifacts on the local disk, keyed by the hash of the source PDF.
+
+    An artifact is a directory with the source file, the parsed result as JSON,
+    optionally the rendered workbook, and a `meta.json`. Files are written via
+    rename, so concurrent workers never read a half-written artifact. Anything
+    older than `ttl_seconds` is treated as missing and swept on later writes.
+    """
+
+    def __init__(
+        self, root: str = ARTIFACT_DIR, ttl_seconds: int = ARTIFACT_TTL_SECONDS
+    ):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self._last_sweep = 0.0
+        self._lock = threading.Lock()
+
+    def _path(self, artifact_id: str, name: str = "") -> str:
+        _check_id(artifact_id)
+        return os.path.join(self.root, artifact_id, name)
+
+    def _write(self, path: str, data: bytes):
+        _write_atomic(path, data)
+
+    def _read(self, artifact_id: str, name: str) -> bytes | None:
+        try:
+            with open(self._path(artifact_id, name), "rb") as f:
+                return f.read()
+        except (FileNotFoundError, KeyError):
+            return None
+
+    def get_meta(self, artifact_id: str) -> dict | None:
+        raw = self._read(artifact_id, "meta.json")
+        if raw is None:
+            return None
+        meta = json.loads(raw)
+        if meta["created_at"] + self.ttl_seconds < time.time():
+            return None
+        return meta
+
+    def put(self, artifact_id: str, source: bytes, result, **meta) -> dict:
+        self.sweep()
+        os.makedirs(self._path(artifact_id), exist_ok=True)
+        self._write(self._path(artifact_id, "source"), source)
+        self._write(
+            self._path(artifact_id, "result.json"),
+            json.dumps(result, ensure_ascii=False).encode("utf-8"),
+        )
+        meta = {**meta, "id": artifact_id, "created_at": time.time()}
+        self._write(
+            self._path(artifact_id, "meta.json"),
+            json.dumps(meta, ensure_ascii=False).encode("utf-8"),
+        )
+        return meta
+
+    def refresh_meta(self, artifact_id: str, **meta) -> dict:
+        """Updates the meta of an existing artifact and restarts its TTL."""
+        meta = {
+            **json.loads(self._read(artifact_id, "meta.json")),
+            **meta,
+            "created_at": time.time(),
+        }
+        self._write(
+            self._path(artifact_id, "meta.json"),
+            json.dumps(meta, ensure_ascii=False).encode("utf-8"),
+        )
+        return meta
+
+    def put_workbook(self, artifact_id: str, workbook: bytes):
+        self._write(self._path(artifact_id, "workbook.xlsx"), workbook)
+
+    def get_source(self, artifact_id: str) -> bytes | None:
+        return self._read(artifact_id, "source")
+
+    def get_result(self, artifact_id: str):
+        raw = self._read(artifact_id, "result.json")
+        return json.loads(raw) if raw is not None else None
+
+    def get_workbook(self, artifact_id: str) -> bytes | None:
+        return self._read(artifact_id, "workbook.xlsx")
+
+    def sweep(self, force: bool = False):
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_sweep < _SWEEP_INTERVAL_SECONDS:
+                return
+            self._last_sweep = now
+        if not os.path.isdir(self.root):
+            return
+        for artifact_id in os.listdir(self.root):
+            directory = os.path.join(self.root, artifact_id)
+            meta_path = os.path.join(directory, "meta.json")
+            # Félbehagyott írásnál nincs meta.json: a könyvtár kora dönt
+            path = meta_path if os.path.exists(meta_path) else directory
+            try:
+                expired = os.path.getmtime(path) + self.ttl_seconds < now
+            except FileNotFoundError:
+                continue
+            if expired:
+                shutil.rmtree(directory, ignore_errors=True)
+
+
+artifact_store = ArtifactStore()
+
+
+def mapping_version(*mappings) -> str:
+    """Fingerprint of the mapping tables a workbook was rendered with ("" for none)."""
+    if not mappings:
+        return ""
+    payload = json.dumps(
+        [
+            sorted(mapping.items(), key=lambda item: repr(item[0]))
+            for mapping in mappings
+        ],
+        ensure_ascii=False,
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def workbook_key(kind: str, source: bytes, mappings_version: str = "") -> str:
+    """Cache key of a rendered workbook: source PDF, exporter and mapping version."""
+    from utils.excel_export import EXCEL_EXPORT_VERSION
+
+    digest = hashlib.sha256(f"{EXCEL_EXPORT_VERSION}:{mappings_version}:".encode())
+    digest.update(source)
+    return f"{kind}-{digest.hexdigest()}"
+
+
+class WorkbookCache:
+    """
+    Rendered workbooks on the local disk, keyed by `workbook_key`.
+
+    The same PDF with the same exporter and mapping tables always renders the
+    same workbook, so entries never expire by age; instead a hit refreshes
+    the file's mtime and every write evicts the least recently used entries
+    beyond `max_bytes`. Each entry is `<key>.xlsx` plus `<key>.json` with the
+    download name, size and a strong ETag of the content.
+    """
+
+    def __init__(
+        self, root: str = WORKBOOK_CACHE_DIR, max_bytes: int = WORKBOOK_CACHE_MAX_BYTES
+    ):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def _path(self, key: str, suffix: str) -> str:
+        _check_id(key)
+        return os.path.join(self.root, key + suffix)
+
+    def get(self, key: str) -> dict | None:
+        kind, _, digest = key.partition("-")
+        if not kind.isalpha() or len(digest) != 64:
+            # Kliens által megadott azonosító: ne kerüljön metrikacímkébe
+            return None
+        try:
+            with open(self._path(key, ".json"), "rb") as f:
+                meta = json.loads(f.read())
+            path = self._path(key, ".xlsx")
+            os.utime(path)
+        except (FileNotFoundError, KeyError, ValueError):
+            workbook_cache_requests.inc(kind=kind, outcome="miss")
+            return None
+        workbook_cache_requests.inc(kind=kind, outcome="hit")
+        return {**meta, "path": path}
+
+    def put(self, key: str, workbook: bytes, filename: str) -> dict:
+        os.makedirs(self.root, exist_ok=True)
+        meta = {
+            "key": key,
+            "filename": filename,
+            "size": len(workbook),
+            "etag": make_etag(workbook),
+            "created_at": time.time(),
+        }
+        path = self._path(key, ".xlsx")
+        # Előbb a munkafüzet, utána a meta: meta csak kész fájlhoz létezik
+        _write_atomic(path, workbook)
+        _write_atomic(
+            self._path(key, ".json"),
+            json.dumps(meta, ensure_ascii=False).encode("utf-8"),
+        )
+        self.evict(keep=key)
+        return {**meta, "path": path}
+
+    def evict(self, keep: str | None = None):
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith(".xlsx"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.root, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name[: -len(".xlsx")]))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            for suffix in (".json", ".xlsx"):
+                try:
+                    os.remove(os.path.join(self.root, key + suffix))
+                except FileNotFoundError:
+                    pass
+            total -= size
+            workbook_cache_requests.inc(kind=key.split("-", 1)[0], outcome="evicted")
+
+
+workbook_cache = WorkbookCache()
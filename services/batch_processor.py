@@ -0,0 +1,209 @@
+import asyncio
+import io
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from services.invoice_processor import process_multialarm, process_volvo
+from services.ocr_service import use_inline_ocr
+from services.registry import service_registry
+from utils.excel_export import (
+    export_multialarm_to_excel_bytes,
+    export_sheets_to_excel_bytes,
+    export_volvo_to_excel_bytes,
+    multialarm_to_dataframe,
+    volvo_to_dataframe,
+)
+
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", os.cpu_count() or 2))
+
+VENDORS = {
+    "volvo": {
+        "parser": process_volvo,
+        "to_dataframe": volvo_to_dataframe,
+        "exporter": export_volvo_to_excel_bytes,
+    },
+    "multialarm": {
+        "parser": process_multialarm,
+        "to_dataframe": multialarm_to_dataframe,
+        "exporter": export_multialarm_to_excel_bytes,
+    },
+}
+
+
+def _build_parse_pool():
+    # A parse pool már korlátos: a workerek nem indítanak saját OCR poolt
+    return ProcessPoolExecutor(max_workers=PARSE_WORKERS, initializer=use_inline_ocr)
+
+
+service_registry.register(
+    "parse_pool", _build_parse_pool, close=lambda pool: pool.shutdown(wait=False)
+)
+
+
+def _run_job(vendor: str, path: str, export: bool):
+    # A worker processzben fut: a PDF-et maga olvassa be, így a bájtok nem utaznak
+    with open(path, "rb") as f:
+        pdf_bytes = f.read()
+    data = VENDORS[vendor]["parser"](pdf_bytes)
+    if not data:
+        raise ValueError("Nem található feldolgozható adat a PDF-ben.")
+    if not export:
+        return data, None
+    return data, VENDORS[vendor]["exporter"](data).getvalue()
+
+
+def stage_uploads(files):
+    """Copies the uploaded PDFs to a private temp dir that outlives the request."""
+    directory = tempfile.mkdtemp(prefix="invoice_batch_")
+    staged = []
+    for index, file in enumerate(files):
+        path = os.path.join(directory, f"{index:04d}.pdf")
+        file.file.seek(0)
+        with open(path, "wb") as f:
+            shutil.copyfileobj(file.file, f)
+        staged.append((file.filename, path))
+    return directory, staged
+
+
+async def parse_staged(vendor: str, staged, export: bool = False):
+    """
+    Parses staged PDFs in the process pool and yields (index, filename, data,
+    workbook_bytes, error) as each one finishes. At most PARSE_WORKERS jobs
+    are in flight, so finished results never pile up in memory.
+    """
+    loop = asyncio.get_running_loop()
+    pool = service_registry.get("parse_pool")
+    jobs = {}
+    pending = set()
+
+    def collect(done):
+        for future in done:
+            index, filename = jobs.pop(future)
+            try:
+                data, workbook = future.result()
+                yield index, filename, data, workbook, None
+            except Exception as e:
+                yield index, filename, None, None, str(e)
+
+    for index, (filename, path) in enumerate(staged):
+        if len(pending) >= PARSE_WORKERS:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for result in collect(done):
+                yield result
+        future = loop.run_in_executor(pool, _run_job, vendor, path, export)
+        jobs[future] = (index, filename)
+        pending.add(future)
+
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for result in collect(done):
+            yield result
+
+
+def _unique_name(name: str, used: set, max_length: int = None, suffix: str = ""):
+    base = re.sub(r"[\[\]:*?/\\]", "_", name)
+    if max_length:
+        base = base[: max_length - len(suffix)]
+    candidate = f"{base}{suffix}"
+    counter = 2
+    while candidate.lower() in used:
+        tag = f"_{counter}"
+        trimmed = base[: max_length - len(suffix) - len(tag)] if max_length else base
+        candidate = f"{trimmed}{tag}{suffix}"
+        counter += 1
+    used.add(candidate.lower())
+    return candidate
+
+
+def _errors_dataframe(errors):
+    import pandas as pd
+
+    return pd.DataFrame(errors, columns=["filename", "error"])
+
+
+async def build_batch_workbook(vendor: str, staged, sheet_per_invoice: bool):
+    """Collects every parsed invoice into one workbook (one sheet or one per invoice)."""
+    to_dataframe = VENDORS[vendor]["to_dataframe"]
+    parsed = []
+    errors = []
+    async for index, filename, data, _, error in parse_staged(vendor, staged):
+        if error:
+            errors.append((filename, error))
+        else:
+            parsed.append((index, filename, data))
+
+    # Feltöltési sorrend, nem befejezési sorrend
+    parsed.sort(key=lambda item: item[0])
+
+    def render():
+        import pandas as pd
+
+        sheets = []
+        if sheet_per_invoice:
+            used = set()
+            for _, filename, data in parsed:
+                name = data[0].get("invoice_number") or os.path.splitext(filename)[0]
+                sheets.append(
+                    (_unique_name(name, used, max_length=31), to_dataframe(data))
+                )
+        elif parsed:
+            rows = [row for _, _, data in parsed for row in data]
+            sheets.append(("Invoices", to_dataframe(rows)))
+        if errors:
+            sheets.append(("Hibák", _errors_dataframe(errors)))
+        if not sheets:
+            sheets.append(("Invoices", pd.DataFrame()))
+        return export_sheets_to_excel_bytes(sheets)
+
+    workbook = await asyncio.to_thread(render)
+    return workbook, len(parsed), errors
+
+
+class _ChunkBuffer(io.RawIOBase):
+    # Nem kereshető írható stream: a zipfile így data descriptorokat használ
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def stream_batch_zip(vendor: str, directory: str, staged):
+    """Streams a ZIP with one workbook per invoice, each written as soon as it is ready."""
+    buffer = _ChunkBuffer()
+    used = set()
+    errors = []
+    try:
+        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            async for _, filename, data, workbook, error in parse_staged(
+                vendor, staged, export=True
+            ):
+                if error:
+                    errors.append(f"{filename}: {error}")
+                    continue
+                name = data[0].get("invoice_number") or os.path.splitext(filename)[0]
+                archive.writestr(
+                    _unique_name(f"{vendor}_invoice_{name}", used, suffix=".xlsx"),
+                    workbook,
+                )
+                yield buffer.drain()
+            if errors:
+                archive.writestr("hibak.txt", "\n".join(errors))
+        yield buffer.drain()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
@@ -1,51 +1,114 @@
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import unquote
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from azure.identity import ClientSecretCredential
-from azure.storage.blob import BlobServiceClient, BlobClient
 import os
 
+from services.registry import service_registry
+from utils.metrics import span
+
 tenant_id = os.getenv("AZURE_TENANT_ID")
 client_id = os.getenv("AZURE_CLIENT_ID")
 client_secret = os.getenv("AZURE_CLIENT_SECRET")
 account_url = os.getenv("AZURE_STORAGE_ACCOUNT_URL")
 container_name = os.getenv("AZURE_STORAGE_CONTAINER_NAME", "invoices")
 
-credential = ClientSecretCredential(
-    tenant_id=tenant_id,
-    client_id=client_id,
-    client_secret=client_secret,
-)
-blob_service_client = BlobServiceClient(account_url=account_url, credential=credential)
-container_client = blob_service_client.get_container_client(container_name)
+
+def _build_container_client():
+    from azure.identity import ClientSecretCredential
+    from azure.storage.blob import BlobServiceClient
+
+    credential = ClientSecretCredential(
+        tenant_id=tenant_id,
+        client_id=client_id,
+        client_secret=client_secret,
+    )
+    blob_service_client = BlobServiceClient(
+        account_url=account_url, credential=credential
+    )
+    return blob_service_client.get_container_client(container_name)
+
+
+service_registry.register("blob_container", _build_container_client)
+
+
+def get_container_client():
+    return service_registry.get("blob_container")
 
 
 def upload_pdf_to_blob(file_bytes: bytes, filename: str):
-    blob_client = container_client.get_blob_client(filename)
-    blob_client.upload_blob(file_bytes, overwrite=True)
+    blob_client = get_container_client().get_blob_client(filename)
+    with span("blob"):
+        blob_client.upload_blob(file_bytes, overwrite=True)
     # Blob URL visszaadása
     return blob_client.url
 
 
 def download_pdf_from_blob(blob_url):
     blob_name = unquote(blob_url.split("/")[-1])
-    print("THE BLOB NAME IN THE download_pdf_from_blob:", blob_name)
-    blob_client = container_client.get_blob_client(blob_name)
-    print("before stream")
-    stream = blob_client.download_blob()
-    print("after stream")
-    return stream.readall()
+    blob_client = get_container_client().get_blob_client(blob_name)
+    with span("blob"):
+        stream = blob_client.download_blob()
+        return stream.readall()
+
+
+def open_pdf_from_blob(blob_url):
+    """Starts a download; the result has `.size` and streams via `.chunks()`."""
+    blob_name = unquote(blob_url.split("/")[-1])
+    blob_client = get_container_client().get_blob_client(blob_name)
+    with span("blob"):
+        return blob_client.download_blob()
 
 
 def delete_blob_from_url(blob_url: str):
     blob_name = blob_url.split("/")[-1]
-    blob_client = container_client.get_blob_client(blob_name)
-    blob_client.delete_blob()
+    blob_client = get_container_client().get_blob_client(blob_name)
+    with span("blob"):
+        blob_client.delete_blob()
+
+
+BLOB_BATCH_SIZE = 256  # Blob Batch API maximum subrequests per batch
+
+
+def _delete_blob_batch(blob_urls):
+    blob_names = [unquote(url).split("/")[-1] for url in blob_urls]
+    failures = []
+    try:
+        responses = get_container_client().delete_blobs(
+            *blob_names, raise_on_any_failure=False
+        )
+        for blob_url, response in zip(blob_urls, responses):
+            # 404: a blob már nincs meg, a törlés célja teljesült
+            if response.status_code not in (200, 202, 404):
+                failures.append(
+                    (blob_url, f"{response.status_code} {response.reason}")
+                )
+    except Exception as e:
+        failures.extend((blob_url, str(e)) for blob_url in blob_urls)
+    return failures
+
+
+def delete_blobs_from_urls(blob_urls, max_workers: int = 4):
+    """Deletes blobs in parallel Blob Batch API calls; returns (url, error) failures."""
+    blob_urls = [url for url in blob_urls if url]
+    batches = [
+        blob_urls[i : i + BLOB_BATCH_SIZE]
+        for i in range(0, len(blob_urls), BLOB_BATCH_SIZE)
+    ]
+    if not batches:
+        return []
+    with span("blob"), ThreadPoolExecutor(
+        max_workers=min(max_workers, len(batches))
+    ) as executor:
+        results = list(executor.map(_delete_blob_batch, batches))
+    return [failure for batch_failures in results for failure in batch_failures]
 
 
 def test_blob_connection():
+    from azure.identity import ClientSecretCredential
+    from azure.storage.blob import BlobServiceClient
 
     print("tenant_id:", tenant_id)
     print("client_id:", client_id)
@@ -1,21 +1,154 @@
-from azure.communication.email import EmailClient
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import HTTPException
+import base64
+import json
 import os
+import threading
+import time
 
-connection_string = os.getenv("AZURE_EMAIL_CONNECTION_STRING")
+from services.registry import service_registry
+from utils.metrics import span
+from utils.rate_limit import TokenBucket, parse_retry_after
 
-email_client = EmailClient.from_connection_string(connection_string)
 
+def _build_email_client():
+    from azure.communication.email import EmailClient
 
-def send_email_with_attachment(
-    to_emails, cc_emails, subject, html, plainText, attachments
-):
+    connection_string = os.getenv("AZURE_EMAIL_CONNECTION_STRING")
+    return EmailClient.from_connection_string(connection_string)
+
+
+service_registry.register("email_client", _build_email_client)
+
+
+def get_email_client():
+    return service_registry.get("email_client")
+
+
+# ACS: a teljes kérés (base64 csatolmányokkal együtt) legfeljebb 10 MB
+ACS_MAX_MESSAGE_BYTES = int(os.getenv("ACS_MAX_MESSAGE_BYTES", 10 * 1024 * 1024))
+SENDER_ADDRESS = "DoNotReply@playground.kraliknorbert.com"
+
+_ENCODE_CHUNK_BYTES = 3 * 256 * 1024  # 3 többszöröse: a darabok külön kódolhatók
+_ATTACHMENT_OVERHEAD_BYTES = 96  # JSON kulcsok, idézőjelek, elválasztók
+
+
+class AttachmentTooLargeError(ValueError):
+    pass
+
+
+def encoded_size(raw_size: int) -> int:
+    return 4 * ((raw_size + 2) // 3)
+
+
+def _aligned_chunks(chunks):
+    # Tetszőleges méretű darabokból 3-mal osztható hosszúakat csinál
+    remainder = b""
+    for chunk in chunks:
+        data = remainder + chunk if remainder else chunk
+        cut = len(data) - len(data) % 3
+        view = memoryview(data)
+        for start in range(0, cut, _ENCODE_CHUNK_BYTES):
+            yield view[start : min(start + _ENCODE_CHUNK_BYTES, cut)]
+        remainder = bytes(view[cut:])
+    if remainder:
+        yield remainder
+
+
+def encode_attachment(
+    name: str,
+    content_type: str,
+    content,
+    size: int | None = None,
+    max_bytes: int = ACS_MAX_MESSAGE_BYTES,
+) -> dict:
+    """
+    Builds an ACS attachment dict, base64-encoding `content` (bytes, a
+    memoryview or an iterable of byte chunks) piece by piece, so the raw file
+    never has to be held next to its full base64 copy.
+
+    If `size` is known the limit is checked before anything is read.
+    """
+    if size is not None and encoded_size(size) > max_bytes:
+        raise AttachmentTooLargeError(
+            f"A csatolmány túl nagy az e-mailhez: {name} ({size} bájt)"
+        )
+
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        content = (content,)
+
+    parts = []
+    total = 0
+    for chunk in _aligned_chunks(content):
+        encoded = base64.b64encode(chunk).decode("ascii")
+        total += len(encoded)
+        if total > max_bytes:
+            raise AttachmentTooLargeError(f"A csatolmány túl nagy az e-mailhez: {name}")
+        parts.append(encoded)
+
+    return {
+        "name": name,
+        "contentType": content_type,
+        "contentInBase64": "".join(parts),
+    }
+
+
+def attachment_size(attachment: dict) -> int:
+    return (
+        len(attachment["contentInBase64"])
+        + len(attachment["name"].encode("utf-8"))
+        + len(attachment["contentType"])
+        + _ATTACHMENT_OVERHEAD_BYTES
+    )
+
+
+def message_overhead(to_emails, cc_emails, subject, html, plainText) -> int:
+    """Serialized size of the message without its attachments."""
+    return len(
+        json.dumps(
+            build_email_message(to_emails, cc_emails, subject, html, plainText, [])
+        ).encode("utf-8")
+    )
+
+
+class AttachmentBatcher:
+    """
+    Packs attachments into messages that stay under the ACS size limit.
+
+    `add()` returns the previous batch once the new attachment no longer fits
+    next to it, so the caller can send it and drop it before reading more
+    files; `flush()` returns what is left.
+    """
+
+    def __init__(self, reserved_bytes: int = 0, max_bytes: int = ACS_MAX_MESSAGE_BYTES):
+        self.capacity = max_bytes - reserved_bytes
+        self._batch = []
+        self._size = 0
+
+    def add(self, attachment: dict) -> list[dict] | None:
+        size = attachment_size(attachment)
+        if size > self.capacity:
+            raise AttachmentTooLargeError(
+                f"A csatolmány túl nagy az e-mailhez: {attachment['name']}"
+            )
+        ready = None
+        if self._batch and self._size + size > self.capacity:
+            ready = self.flush()
+        self._batch.append(attachment)
+        self._size += size
+        return ready
+
+    def flush(self) -> list[dict] | None:
+        batch, self._batch, self._size = self._batch or None, [], 0
+        return batch
 
+
+def build_email_message(to_emails, cc_emails, subject, html, plainText, attachments):
     to_list = [{"address": email} for email in to_emails] if to_emails else []
     cc_list = [{"address": email} for email in cc_emails] if cc_emails else []
 
-    message = {
-        "senderAddress": "DoNotReply@playground.kraliknorbert.com",
+    return {
+        "senderAddress": SENDER_ADDRESS,
         "recipients": {
             "to": to_list,
             "cc": cc_list,
@@ -28,9 +161,27 @@ def send_email_with_attachment(
         "attachments": attachments,
     }
 
+
+def send_email_with_attachment(
+    to_emails, cc_emails, subject, html, plainText, attachments
+):
+
+    message = build_email_message(
+        to_emails, cc_emails, subject, html, plainText, attachments
+    )
+    size = message_overhead(to_emails, cc_emails, subject, html, plainText) + sum(
+        attachment_size(attachment) for attachment in attachments
+    )
+    if size > ACS_MAX_MESSAGE_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Az e-mail mérete ({size} bájt) meghaladja a {ACS_MAX_MESSAGE_BYTES} bájtos korlátot.",
+        )
+
     try:
-        poller = email_client.begin_send(message)
-        result = poller.result()
+        with span("email"):
+            poller = get_email_client().begin_send(message)
+            result = poller.result()
         if result.get("status") == "Succeeded":
             print("Email sikeresen elküldve.")
             return {
@@ -50,3 +201,173 @@ def send_email_with_attachment(
     except Exception as ex:
         print(f"Email küldési hiba (kivétel): {ex}")
         raise HTTPException(status_code=500, detail=f"Email küldési hiba: {ex}")
+
+
+EMAIL_RATE_PER_MINUTE = float(os.getenv("EMAIL_RATE_PER_MINUTE", 30))
+EMAIL_RATE_BURST = float(os.getenv("EMAIL_RATE_BURST", 5))
+EMAIL_SEND_CONCURRENCY = int(os.getenv("EMAIL_SEND_CONCURRENCY", 4))
+EMAIL_POLL_INTERVAL_SECONDS = float(os.getenv("EMAIL_POLL_INTERVAL_SECONDS", 2))
+EMAIL_POLL_TIMEOUT_SECONDS = float(os.getenv("EMAIL_POLL_TIMEOUT_SECONDS", 300))
+_MAX_SEND_ATTEMPTS = 5
+_FINAL_STATUSES = ("Succeeded", "Failed", "Canceled")
+
+
+def _build_email_rate_limiter():
+    # Az ACS kvóta erőforrásonként közös, ezért a limiter is folyamatszintű
+    return TokenBucket(EMAIL_RATE_PER_MINUTE / 60, EMAIL_RATE_BURST)
+
+
+service_registry.register("email_rate_limiter", _build_email_rate_limiter)
+
+
+def _throttled_for(response) -> float | None:
+    if response is None or response.status_code != 429:
+        return None
+    return parse_retry_after(response.headers.get("Retry-After"), default=60)
+
+
+class EmailDispatcher:
+    """
+    Sends many messages concurrently under the shared ACS rate limit.
+
+    `submit()` hands a message to a worker that waits for a token and starts
+    the send without polling. A 429 pauses the whole bucket for the
+    Retry-After period and the send is retried. `wait()` polls every started
+    operation in rounds and returns one outcome per message, in submit order:
+    {"key", "operation_id", "status", "error"}.
+    """
+
+    def __init__(
+        self,
+        client=None,
+        limiter: TokenBucket = None,
+        max_workers: int = EMAIL_SEND_CONCURRENCY,
+        poll_interval: float = EMAIL_POLL_INTERVAL_SECONDS,
+        timeout: float = EMAIL_POLL_TIMEOUT_SECONDS,
+    ):
+        self.client = client or get_email_client()
+        self.limiter = limiter or service_registry.get("email_rate_limiter")
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        # Visszanyomás: a hívó nem épít előre több levelet, mint amennyi elmegy
+        self._slots = threading.BoundedSemaphore(max_workers * 2)
+        self._jobs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._pool.shutdown(wait=True)
+        return False
+
+    def submit(self, key, message: dict, operation_id: str | None = None):
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(self._start, message, operation_id)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        self._jobs.append((key, future))
+
+    def _start(self, message: dict, operation_id: str | None) -> dict:
+        from azure.core.exceptions import HttpResponseError
+
+        for attempt in range(1, _MAX_SEND_ATTEMPTS + 1):
+            self.limiter.acquire()
+            try:
+                with span("email"):
+                    poller = self.client.begin_send(
+                        message,
+                        operation_id=operation_id,
+                        polling=False,
+                        retry_total=0,
+                        cls=lambda _, body, headers: (body or {}, headers),
+                    )
+                    body, headers = poller.result()
+            except HttpResponseError as e:
+                wait = _throttled_for(e.response)
+                if wait is None or attempt == _MAX_SEND_ATTEMPTS:
+                    raise
+                self.limiter.pause(wait)
+                continue
+            return {
+                "operation_id": body.get("id") or operation_id,
+                "status": body.get("status") or "Running",
+                "status_url": headers.get("Operation-Location"),
+                "error": None,
+            }
+
+    def _check(self, outcome: dict) -> float:
+        from azure.core.rest import HttpRequest
+
+        # Egy levél lekérdezési hibája csak azt a levelet zárja le, a többit nem
+        try:
+            with span("email"):
+                response = self.client.send_request(
+                    HttpRequest("GET", outcome["status_url"]), retry_total=0
+                )
+            wait = _throttled_for(response)
+            if wait is not None:
+                return wait
+            if response.status_code != 200:
+                outcome["error"] = (
+                    f"Állapotlekérdezés sikertelen: {response.status_code}"
+                )
+                return 0.0
+            body = response.json()
+        except Exception as e:
+            outcome["error"] = f"Állapotlekérdezés sikertelen: {e}"
+            return 0.0
+        outcome["status"] = body.get("status", outcome["status"])
+        if outcome["status"] in ("Failed", "Canceled"):
+            error = body.get("error") or {}
+            outcome["error"] = error.get("message") or outcome["status"]
+        return 0.0
+
+    def wait(self) -> list[dict]:
+        outcomes = []
+        for key, future in self._jobs:
+            try:
+                outcome = future.result()
+            except Exception as e:
+                outcome = {"operation_id": None, "status": "Failed", "error": str(e)}
+                outcome["status_url"] = None
+            outcomes.append({"key": key, **outcome})
+        self._jobs = []
+
+        deadline = time.monotonic() + self.timeout
+        pending = [o for o in outcomes if o["status"] not in _FINAL_STATUSES]
+        for outcome in pending:
+            if not outcome["status_url"]:
+                outcome["status"], outcome["error"] = (
+                    "Unknown",
+                    "Nincs Operation-Location",
+                )
+        pending = [o for o in pending if o["status_url"]]
+
+        while pending:
+            waits = list(self._pool.map(self._check, pending))
+            pending = [
+                o
+                for o in pending
+                if o["status"] not in _FINAL_STATUSES and not o["error"]
+            ]
+            if not pending:
+                break
+            if time.monotonic() >= deadline:
+                for outcome in pending:
+                    outcome["error"] = "Időtúllépés a kézbesítési állapotra várva"
+                break
+            time.sleep(max([self.poll_interval, *waits]))
+
+        return [
+            {
+                "key": o["key"],
+                "operation_id": o["operation_id"],
+                "status": o["status"],
+                "error": o["error"],
+            }
+            for o in outcomes
+        ]
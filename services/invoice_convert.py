@@ -0,0 +1,206 @@
+from services.artifact_store import mapping_version, workbook_cache, workbook_key
+from services.invoice_processor import INVOICE_PARSERS, detect_vendor
+from utils.excel_export import (
+    export_multialarm_to_excel_bytes,
+    export_volvo_to_excel_bytes,
+    export_vodafone_to_excel_bytes,
+)
+from utils.row_export import (
+    FORMATS,
+    multialarm_records,
+    records_to_bytes,
+    vodafone_records,
+    volvo_records,
+)
+
+
+class InvoiceConversionError(ValueError):
+    """A conversion failure the client caused or should see, with its HTTP status."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _first_invoice_number(data):
+    return data[0].get("invoice_number") if data else None
+
+
+def _vodafone_mapping_helpers():
+    # A telefonkönyv és a TESZOR-táblák modelljei (database/models.py) még ki
+    # vannak kommentezve: addig Vodafone munkafüzet nem készíthető
+    try:
+        from utils import mapping_helpers
+    except ImportError:
+        raise InvoiceConversionError(
+            501,
+            "A Vodafone munkafüzethez szükséges hozzárendelési táblák ebben a"
+            " telepítésben nem érhetők el; kérj JSON, NDJSON vagy Parquet"
+            " kimenetet.",
+        )
+    return mapping_helpers
+
+
+def _vodafone_mappings(session):
+    from sqlmodel import Session
+
+    from database.connection import get_engine
+
+    mapping_helpers = _vodafone_mapping_helpers()
+    if session is None:
+        # A worker processzben nincs kérés-szintű session
+        with Session(get_engine()) as own_session:
+            return _vodafone_mappings(own_session)
+
+    phone_user_map = mapping_helpers.get_phone_user_map(session)
+    teszor_category_map, mapping_lookup = mapping_helpers.get_teszor_mapping_lookup(
+        session
+    )
+    return phone_user_map, teszor_category_map, mapping_lookup
+
+
+def _no_mappings(session):
+    return ()
+
+
+# Kimenet szállítónként; a parser és a felismerés az INVOICE_PARSERS-ben van.
+# A "workbook" a feldolgozott adatot és a "mappings" táblákat kapja; a
+# "check_workbook" feldolgozás előtt jelzi, ha a munkafüzet nem készíthető el.
+OUTPUTS = {
+    "volvo": {
+        "has_data": bool,
+        "invoice_number": _first_invoice_number,
+        "records": volvo_records,
+        "mappings": _no_mappings,
+        "check_workbook": lambda: None,
+        "workbook": export_volvo_to_excel_bytes,
+    },
+    "multialarm": {
+        "has_data": bool,
+        "invoice_number": _first_invoice_number,
+        "records": multialarm_records,
+        "mappings": _no_mappings,
+        "check_workbook": lambda: None,
+        "workbook": export_multialarm_to_excel_bytes,
+    },
+    "vodafone": {
+        "has_data": lambda result: bool(
+            result["invoice_summary"] or result["service_charges"]
+        ),
+        "invoice_number": lambda result: result["invoice_number"],
+        "records": vodafone_records,
+        "mappings": _vodafone_mappings,
+        "check_workbook": _vodafone_mapping_helpers,
+        "workbook": export_vodafone_to_excel_bytes,
+    },
+}
+
+
+def check_vendor(vendor: str | None):
+    if vendor is not None and vendor not in OUTPUTS:
+        raise InvoiceConversionError(
+            422, f"Ismeretlen szállító: {vendor}. Támogatott: {', '.join(OUTPUTS)}"
+        )
+
+
+def check_output(vendor: str | None, fmt: str):
+    """Rejects a vendor/format pair this deployment cannot produce, before parsing."""
+    check_vendor(vendor)
+    if vendor is not None and fmt == "xlsx":
+        OUTPUTS[vendor]["check_workbook"]()
+
+
+def resolve_vendor(pdf_bytes: bytes, vendor: str | None = None) -> str:
+    """The given vendor, or the one detected from the first page."""
+    check_vendor(vendor)
+    if vendor is not None:
+        return vendor
+    try:
+        vendor = detect_vendor(pdf_bytes)
+    except Exception as e:
+        raise InvoiceConversionError(
+            422, f"Nem sikerült a PDF-et feldolgozni: {str(e)}"
+        )
+    if vendor not in OUTPUTS:
+        raise InvoiceConversionError(
+            422,
+            f"Nem sikerült felismerni a számla típusát. Támogatott: {', '.join(OUTPUTS)}",
+        )
+    return vendor
+
+
+def parse_invoice(pdf_bytes: bytes, vendor: str | None = None):
+    """Detects the vendor (unless given) and parses the PDF: (vendor, data)."""
+    vendor = resolve_vendor(pdf_bytes, vendor)
+    try:
+        data = INVOICE_PARSERS[vendor]["parser"](pdf_bytes)
+    except Exception as e:
+        raise InvoiceConversionError(
+            422, f"Nem sikerült a PDF-et feldolgozni: {str(e)}"
+        )
+    if not OUTPUTS[vendor]["has_data"](data):
+        raise InvoiceConversionError(422, "Nem található feldolgozható adat a PDF-ben.")
+    return vendor, data
+
+
+def invoice_filename_base(vendor: str, data) -> str:
+    invoice_number = OUTPUTS[vendor]["invoice_number"](data) or "unknown_invoice_number"
+    return f"{vendor}_invoice_{invoice_number}"
+
+
+def load_mappings(vendor: str, session=None) -> tuple:
+    try:
+        return OUTPUTS[vendor]["mappings"](session)
+    except InvoiceConversionError:
+        raise
+    except Exception as e:
+        raise InvoiceConversionError(
+            500, f"Nem sikerült a hozzárendeléseket betölteni: {str(e)}"
+        )
+
+
+def render_workbook(vendor: str, data, session=None, mappings: tuple = None):
+    if mappings is None:
+        mappings = load_mappings(vendor, session)
+    try:
+        return OUTPUTS[vendor]["workbook"](data, *mappings)
+    except Exception as e:
+        raise InvoiceConversionError(
+            500, f"Nem sikerült az Excel fájlt létrehozni: {str(e)}"
+        )
+
+
+def cached_workbook(pdf_bytes: bytes, vendor: str | None = None, session=None):
+    """
+    (vendor, workbook cache entry) for the PDF. The PDF is only parsed and
+    rendered when no workbook exists for it with the current exporter and
+    mapping tables.
+    """
+    vendor = resolve_vendor(pdf_bytes, vendor)
+    mappings = load_mappings(vendor, session)
+    key = workbook_key(vendor, pdf_bytes, mapping_version(*mappings))
+    workbook = workbook_cache.get(key)
+    if workbook is None:
+        vendor, data = parse_invoice(pdf_bytes, vendor)
+        content = render_workbook(vendor, data, mappings=mappings).getvalue()
+        workbook = workbook_cache.put(
+            key, content, f"{invoice_filename_base(vendor, data)}.xlsx"
+        )
+    return vendor, workbook
+
+
+def convert_invoice(pdf_bytes: bytes, vendor: str | None, fmt: str, session=None):
+    """
+    The whole conversion in one call, for the job worker:
+    returns (vendor, filename, media_type, content_bytes).
+    """
+    if fmt == "xlsx":
+        vendor, workbook = cached_workbook(pdf_bytes, vendor, session)
+        with open(workbook["path"], "rb") as f:
+            content = f.read()
+        return vendor, workbook["filename"], FORMATS[fmt], content
+
+    vendor, data = parse_invoice(pdf_bytes, vendor)
+    content = records_to_bytes(fmt, OUTPUTS[vendor]["records"](data))
+    return vendor, f"{invoice_filename_base(vendor, data)}.{fmt}", FORMATS[fmt], content
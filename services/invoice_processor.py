@@ -1,17 +1,217 @@
-import pdfplumber
+import cProfile
 import io
+import json
+import os
 import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from services.ocr_service import pdfium_lock, text_or_ocr
+from utils.metrics import span
+
+PARSE_PROFILE_DIR = os.getenv(
+    "PARSE_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "parse_profiles")
+)
+PARSE_PROFILE_TTL_SECONDS = int(os.getenv("PARSE_PROFILE_TTL_SECONDS", 7 * 24 * 3600))
+PARSE_PROFILE_MAX_BYTES = int(os.getenv("PARSE_PROFILE_MAX_BYTES", 64 * 2**20))
+_SWEEP_INTERVAL_SECONDS = 300
+_sweep_lock = threading.Lock()
+_last_sweep = 0.0
+
+_active_profiler: ContextVar["ParseProfiler | None"] = ContextVar(
+    "parse_profiler", default=None
+)
+
+
+class ParseProfiler:
+    """
+    Opt-in per-page/per-stage timings for one parse, optionally with cProfile.
+
+    Activated with `with profiler:`; the parsers report their stages through
+    `profile_stage`, which is a no-op when no profiler is active.
+    """
+
+    def __init__(self, enabled: bool = True, use_cprofile: bool = False):
+        self.enabled = enabled
+        self.profile_id = uuid.uuid4().hex if enabled else None
+        self.records = []
+        self._cprofile = cProfile.Profile() if enabled and use_cprofile else None
+        self._token = None
+        self._dumped = False
+
+    @classmethod
+    def from_debug_header(cls, value: str | None):
+        # X-Debug-Profile: 1 -> stage-idők, X-Debug-Profile: cprofile -> + pstats
+        if not value or os.getenv("PARSE_PROFILING_ENABLED") != "1":
+            return cls(enabled=False)
+        return cls(use_cprofile=value.strip().lower() == "cprofile")
+
+    def __enter__(self):
+        if self.enabled:
+            self._token = _active_profiler.set(self)
+            if self._cprofile:
+                self._cprofile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.enabled:
+            if self._cprofile:
+                self._cprofile.disable()
+            _active_profiler.reset(self._token)
+            self.dump()
+            self._dumped = True
+        return False
+
+    def run(self, fn, *args):
+        """`fn(*args)` under this profiler, for `run_in_threadpool`: cProfile
+        only sees the thread it was enabled in."""
+        with self:
+            return fn(*args)
+
+    @contextmanager
+    def stage(self, name: str, page: int | None = None):
+        record = {"stage": name, "page": page, "seconds": 0.0, "chars": None}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            self.records.append(record)
+
+    def summary(self):
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(
+                record["stage"], {"seconds": 0.0, "calls": 0, "chars": 0}
+            )
+            total["seconds"] += record["seconds"]
+            total["calls"] += 1
+            total["chars"] += record["chars"] or 0
+        return totals
+
+    def dump(self, directory: str = None):
+        directory = directory or PARSE_PROFILE_DIR
+        sweep_parse_profiles(directory)
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, self.profile_id)
+
+        with open(f"{base}.json", "w", encoding="utf-8") as f:
+            json.dump({"summary": self.summary(), "records": self.records}, f)
+
+        # flamegraph.pl / speedscope kompatibilis "collapsed stack" formátum
+        with open(f"{base}.folded", "w", encoding="utf-8") as f:
+            for record in self.records:
+                page = (
+                    "document" if record["page"] is None else f"page_{record['page']}"
+                )
+                micros = int(record["seconds"] * 1_000_000)
+                f.write(f"parse;{page};{record['stage']} {micros}\n")
+
+        if self._cprofile:
+            self._cprofile.dump_stats(f"{base}.pstats")
+
+    def response_headers(self) -> dict:
+        # Cache találatnál nem futott feldolgozás: nincs profil, amire mutatni
+        if not self._dumped:
+            return {}
+        server_timing = ", ".join(
+            f"{stage};dur={total['seconds'] * 1000:.1f}"
+            for stage, total in self.summary().items()
+        )
+        return {"X-Parse-Profile-Id": self.profile_id, "Server-Timing": server_timing}
+
+
+def sweep_parse_profiles(directory: str = None, force: bool = False):
+    """
+    Deletes profile files older than PARSE_PROFILE_TTL_SECONDS, then the
+    oldest ones beyond PARSE_PROFILE_MAX_BYTES. Runs at most every few
+    minutes per process, from `dump`.
+    """
+    global _last_sweep
+    directory = directory or PARSE_PROFILE_DIR
+    now = time.time()
+    with _sweep_lock:
+        if not force and now - _last_sweep < _SWEEP_INTERVAL_SECONDS:
+            return
+        _last_sweep = now
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return
+
+    entries = []
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        if stat.st_mtime + PARSE_PROFILE_TTL_SECONDS < now:
+            _remove(path)
+        else:
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= PARSE_PROFILE_MAX_BYTES:
+            break
+        _remove(path)
+        total -= size
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+@contextmanager
+def profile_stage(name: str, page: int | None = None):
+    profiler = _active_profiler.get()
+    if profiler is None:
+        yield {}
+        return
+    with profiler.stage(name, page) as record:
+        yield record
+
+
+def profile_iter(name: str, iterable, page: int | None = None):
+    """`iterable`, timing the loop that consumes it as one stage."""
+    with profile_stage(name, page):
+        yield from iterable
 
 
 def process_multialarm(pdf_bytes: bytes):
+    import pdfplumber
 
     full_text = ""
-    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-        for page in pdf.pages:
-            page_text = page.extract_text()
+    with span("pdf_parse"), pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+        for page_index, page in enumerate(pdf.pages):
+            with profile_stage("extract_text", page_index) as record:
+                page_text = text_or_ocr(
+                    page.extract_text(),
+                    pdf_bytes,
+                    page_index,
+                    "multialarm",
+                    bool(page.images),
+                )
+                record["chars"] = len(page_text)
             if page_text:
                 full_text += "\n" + page_text
 
+    with profile_stage("line_regex") as record:
+        record["chars"] = len(full_text)
+        return _multialarm_rows(full_text)
+
+
+def _multialarm_rows(full_text: str):
     invoice_number = re.search(r"Számla száma:\s*(\d+)", full_text)
     invoice_date = re.search(r"Számla kelte:\s*([\d\.]+)", full_text)
     performance_date = re.search(r"Teljesítési dátum:\s*([\d\.]+)", full_text)
@@ -67,40 +267,100 @@ def process_multialarm(pdf_bytes: bytes):
     return data
 
 
+def extract_page_tables(page):
+    """
+    `[table.extract() for table in page.find_tables()]` with the same
+    char-in-cell rule (midpoint, half-open bbox), but the page's chars are
+    sorted by vertical midpoint once and each row only looks at its own slice,
+    instead of every row rescanning every char on the page.
+    """
+    from pdfplumber.table import TableSettings
+    from pdfplumber.utils import extract_text
+
+    settings = TableSettings.resolve(None)
+    text_settings = settings.text_settings or {}
+    tables = page.find_tables(settings)
+    if not tables:
+        return []
+
+    chars = sorted(
+        ((char["top"] + char["bottom"]) / 2, index, char)
+        for index, char in enumerate(page.chars)
+    )
+    midpoints = [midpoint for midpoint, _, _ in chars]
+
+    extracted = []
+    for table in tables:
+        table_rows = []
+        for row in table.rows:
+            _, top, _, bottom = row.bbox
+            # Eredeti sorrendben, ahogy a pdfplumber is kapja
+            row_chars = sorted(
+                chars[bisect_left(midpoints, top) : bisect_left(midpoints, bottom)],
+                key=lambda item: item[1],
+            )
+            cells = []
+            for cell in row.cells:
+                if cell is None:
+                    cells.append(None)
+                    continue
+                x0, cell_top, x1, cell_bottom = cell
+                cell_chars = [
+                    char
+                    for midpoint, _, char in row_chars
+                    if cell_top <= midpoint < cell_bottom
+                    and x0 <= (char["x0"] + char["x1"]) / 2 < x1
+                ]
+                cells.append(
+                    extract_text(cell_chars, **text_settings) if cell_chars else ""
+                )
+            table_rows.append(cells)
+        extracted.append(table_rows)
+    return extracted
+
+
 def process_volvo(pdf_bytes: bytes):
+    import pdfplumber
 
     data = []
-    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-
-        first_page_text = pdf.pages[0].extract_text()
-        tables = pdf.pages[0].extract_tables()
-
-        invoice_number = ""
-        if tables and len(tables[0]) >= 2:
-            row = tables[0][1]
-            invoice_number = row[0]
-
-        invoice_date = payment_due = performance_date = ""
-        lines = first_page_text.splitlines()
-        for line in lines:
-            dates = re.findall(r"\d{2}-\d{2}-\d{4}", line)
-            if len(dates) >= 3:
-                invoice_date, payment_due, performance_date = dates[:3]
-                break
+    with span("pdf_parse"), pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
 
-        header_info = {
-            "invoice_number": invoice_number,
-            "invoice_date": invoice_date,
-            "payment_due": payment_due,
-            "performance_date": performance_date,
-        }
+        first_page = pdf.pages[0]
+        with profile_stage("extract_text", 0) as record:
+            first_page_text = first_page.extract_text()
+            record["chars"] = len(first_page_text or "")
+
+        for page_index, page in enumerate(pdf.pages):
+            # Egyetlen táblakeresés oldalanként, a 0. oldalon a fejléchez is
+            with profile_stage("extract_tables", page_index):
+                tables = extract_page_tables(page)
+            page.close()
+
+            if page_index == 0:
+                invoice_number = ""
+                if tables and len(tables[0]) >= 2:
+                    row = tables[0][1]
+                    invoice_number = row[0]
+
+                invoice_date = payment_due = performance_date = ""
+                lines = first_page_text.splitlines()
+                for line in lines:
+                    dates = re.findall(r"\d{2}-\d{2}-\d{4}", line)
+                    if len(dates) >= 3:
+                        invoice_date, payment_due, performance_date = dates[:3]
+                        break
+
+                header_info = {
+                    "invoice_number": invoice_number,
+                    "invoice_date": invoice_date,
+                    "payment_due": payment_due,
+                    "performance_date": performance_date,
+                }
 
-        for page in pdf.pages:
-            tables = page.extract_tables()
             if len(tables) >= 2:
                 table = tables[1]
 
-                for row in table:
+                for row in profile_iter("line_regex", table, page_index):
                     flat_row = " ".join(row).replace("\n", " ")
                     row_with_breaks = " ".join(row).split("\n")
 
@@ -137,106 +397,265 @@ def process_volvo(pdf_bytes: bytes):
     return data
 
 
-def process_vodafone(pdf_bytes: bytes):
+_TESZOR_RE = re.compile(r"\b\d{2}\.\d{2}\.\d{1,2}\b")
+_PHONE_NUMBER_RE = re.compile(r"Telefonszám:\s*(36\d{9})")
+_AMOUNT_RE = re.compile(r"^-?\d+(\.\d+)?$")
+
+
+def parse_vodafone_amount(value):
+    """'1.234,56' -> 1234.56; floats pass through, anything else is None."""
+    if value is None or isinstance(value, float):
+        return value
+    cleaned = value.replace(".", "").replace(",", ".").strip()
+    return float(cleaned) if _AMOUNT_RE.match(cleaned) else None
+
+
+class _SlottedRow:
+    __slots__ = ()
+    amount_fields = ()
+
+    @classmethod
+    def from_list(cls, values):
+        row = cls(*values)
+        for field in cls.amount_fields:
+            setattr(row, field, parse_vodafone_amount(getattr(row, field)))
+        return row
+
+    def __iter__(self):
+        return (getattr(self, field) for field in self.__slots__)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(map(repr, self))})"
+
+
+class VodafoneSummaryRow(_SlottedRow):
+    """One line of the "Számlaösszesítő" block; amounts are parsed floats."""
+
+    __slots__ = (
+        "description",
+        "quantity",
+        "unit",
+        "unit_price",
+        "teszor",
+        "vat_rate",
+        "net_amount",
+        "vat_amount",
+        "gross_amount",
+    )
+    amount_fields = ("unit_price", "net_amount", "vat_amount", "gross_amount")
+
+    def __init__(
+        self,
+        description,
+        quantity,
+        unit,
+        unit_price,
+        teszor,
+        vat_rate,
+        net_amount,
+        vat_amount,
+        gross_amount,
+    ):
+        self.description = description
+        self.quantity = quantity
+        self.unit = unit
+        self.unit_price = unit_price
+        self.teszor = teszor
+        self.vat_rate = vat_rate
+        self.net_amount = net_amount
+        self.vat_amount = vat_amount
+        self.gross_amount = gross_amount
+
+    @classmethod
+    def from_parts(cls, parts):
+        description, quantity, unit, unit_price, teszor, vat_rate, *amounts = parts
+        net_amount, vat_amount, gross_amount = amounts
+        return cls(
+            description,
+            quantity,
+            sys.intern(unit),
+            parse_vodafone_amount(unit_price),
+            sys.intern(teszor),
+            sys.intern(vat_rate),
+            parse_vodafone_amount(net_amount),
+            parse_vodafone_amount(vat_amount),
+            parse_vodafone_amount(gross_amount),
+        )
 
-    invoice_summary_rows = []
-    service_charge_rows = []
-    invoice_number = ""
 
-    def process_invoice_page(text: str):
-        start = text.find("Számlaösszesítő")
-        end = text.find("Egyenlegközlő információ")
-        if start == -1 or end == -1:
-            return
-        for line in text[start:end].split("\n"):
-            if any(
-                k in line
-                for k in ["összeg", "Megnevezés", "Összesen", "Számlaösszesítő"]
-            ):
-                continue
+class VodafoneServiceChargeRow(_SlottedRow):
+    """
+    One billed item of a subscriber. Phone numbers, descriptions, TESZOR codes
+    and VAT rates repeat across tens of thousands of lines, so they are
+    interned; amounts are parsed once here instead of in every exporter.
+    """
+
+    __slots__ = (
+        "phone_number",
+        "description",
+        "teszor",
+        "total_amount",
+        "vat_amount",
+        "vat_rate",
+        "net_amount",
+    )
+    amount_fields = ("total_amount", "vat_amount", "net_amount")
+
+    def __init__(
+        self,
+        phone_number,
+        description,
+        teszor,
+        total_amount,
+        vat_amount,
+        vat_rate,
+        net_amount,
+    ):
+        self.phone_number = phone_number
+        self.description = description
+        self.teszor = teszor
+        self.total_amount = total_amount
+        self.vat_amount = vat_amount
+        self.vat_rate = vat_rate
+        self.net_amount = net_amount
+
+
+def vodafone_result_to_json(result) -> dict:
+    return {
+        "invoice_number": result["invoice_number"],
+        "invoice_summary": [list(row) for row in result["invoice_summary"]],
+        "service_charges": [list(row) for row in result["service_charges"]],
+    }
 
-            teszor_match = re.search(r"\b\d{2}\.\d{2}\.\d{1,2}\b", line)
-            if teszor_match:
-                parts = line.rsplit(" ", 8)
-                if len(parts) == 9:
-                    invoice_summary_rows.append(parts)
-            else:
-                parts = line.rsplit(" ", 7)
-                if len(parts) == 8:
-                    parts.insert(4, "")  # empty TESZOR field
-                    invoice_summary_rows.append(parts)
-
-    def process_service_charges(lines):
-        phone_number = "N/A"
-        for line in lines:
-            if "Tarifacsomag:" in line:
-                break
-            match = re.search(r"Telefonszám:\s*(36\d{9})", line)
-            if match:
-                phone_number = match.group(1)
-                break
 
-        try:
-            start_index = next(
-                i
-                for i, line in enumerate(lines)
-                if line.strip().startswith("Megnevezés")
-            )
-            end_index = next(
-                i
-                for i, line in enumerate(lines)
-                if line.strip().startswith("Kiszámlázott díjak összesen")
-            )
-        except StopIteration:
-            return
+def vodafone_result_from_json(data) -> dict:
+    return {
+        "invoice_number": data["invoice_number"],
+        "invoice_summary": [
+            VodafoneSummaryRow.from_list(row) for row in data["invoice_summary"]
+        ],
+        "service_charges": [
+            VodafoneServiceChargeRow.from_list(row) for row in data["service_charges"]
+        ],
+    }
 
-        for line in lines[start_index + 1 : end_index]:
-            teszor_match = re.search(r"\b\d{2}\.\d{2}\.\d{1,2}\b", line)
-            if not teszor_match:
-                continue
 
-            teszor = teszor_match.group()
-            parts = line.rsplit(" ", 4)
-            if len(parts) < 5:
-                continue
+def parse_vodafone_invoice_page(text: str):
+    start = text.find("Számlaösszesítő")
+    end = text.find("Egyenlegközlő információ")
+    if start == -1 or end == -1:
+        return
+    for line in text[start:end].split("\n"):
+        if any(
+            k in line for k in ["összeg", "Megnevezés", "Összesen", "Számlaösszesítő"]
+        ):
+            continue
+
+        if _TESZOR_RE.search(line):
+            parts = line.rsplit(" ", 8)
+            if len(parts) == 9:
+                yield VodafoneSummaryRow.from_parts(parts)
+        else:
+            parts = line.rsplit(" ", 7)
+            if len(parts) == 8:
+                parts.insert(4, "")  # empty TESZOR field
+                yield VodafoneSummaryRow.from_parts(parts)
+
+
+def parse_vodafone_service_charges(lines):
+    phone_number = "N/A"
+    for line in lines:
+        if "Tarifacsomag:" in line:
+            break
+        match = _PHONE_NUMBER_RE.search(line)
+        if match:
+            phone_number = match.group(1)
+            break
+    phone_number = sys.intern(phone_number)
+
+    try:
+        start_index = next(
+            i for i, line in enumerate(lines) if line.strip().startswith("Megnevezés")
+        )
+        end_index = next(
+            i
+            for i, line in enumerate(lines)
+            if line.strip().startswith("Kiszámlázott díjak összesen")
+        )
+    except StopIteration:
+        return
+
+    for line in lines[start_index + 1 : end_index]:
+        teszor_match = _TESZOR_RE.search(line)
+        if not teszor_match:
+            continue
+
+        teszor = teszor_match.group()
+        parts = line.rsplit(" ", 4)
+        if len(parts) < 5:
+            continue
+
+        # Sorrend a PDF-ben: nettó, ÁFA kulcs, ÁFA összeg, bruttó
+        net_amount, vat_rate, vat_amount, total_amount = parts[-4:]
+        before_values = parts[0]
+        description = (
+            before_values.split(teszor)[0].strip()
+            if teszor in before_values
+            else before_values.strip()
+        )
 
-            total_amount, vat_amount, vat_rate, net_amount = parts[-4:]
-            before_values = parts[0]
-            description = (
-                before_values.split(teszor)[0].strip()
-                if teszor in before_values
-                else before_values.strip()
-            )
+        yield VodafoneServiceChargeRow(
+            phone_number,
+            sys.intern(description),
+            sys.intern(teszor),
+            parse_vodafone_amount(total_amount),
+            parse_vodafone_amount(vat_amount),
+            sys.intern(vat_rate),
+            parse_vodafone_amount(net_amount),
+        )
 
-            service_charge_rows.append(
-                [
-                    phone_number,
-                    description,
-                    teszor,
-                    net_amount,
-                    vat_rate,
-                    vat_amount,
-                    total_amount,
-                ]
-            )
 
-    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+def iter_vodafone(pdf_bytes: bytes):
+    """
+    Parses a Vodafone bill page by page and yields `(section, value)` pairs as
+    soon as they are known: `("invoice_number", str)`, then
+    `("invoice_summary", VodafoneSummaryRow)` and
+    `("service_charges", VodafoneServiceChargeRow)` whenever a section closes.
+
+    Only the lines of the currently open service section are kept, and every
+    page is closed right after its text is extracted, so memory does not grow
+    with the number of pages.
+    """
+    import pdfplumber
+
+    invoice_number = ""
+
+    with span("pdf_parse"), pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
 
         is_service_section = False
         service_lines_accumulator = []
 
         for i, page in enumerate(pdf.pages):
-            text = page.extract_text() or ""
+            with profile_stage("extract_text", i) as record:
+                try:
+                    text = text_or_ocr(
+                        page.extract_text(), pdf_bytes, i, "vodafone", bool(page.images)
+                    )
+                finally:
+                    # A pdfminer objektumok és a textmap cache felszabadítása
+                    page.close()
+                record["chars"] = len(text)
             if not text:
                 continue
             lines = text.split("\n")
             header = lines[0].strip().upper()
 
-            if i == 1 and invoice_number is "":
+            if i == 1 and not invoice_number:
                 for line in lines:
                     m = re.search(r"Számlaszám[:\s]+(\d+)", line)
                     if m:
                         invoice_number = m.group(1)
+                        yield "invoice_number", invoice_number
                         break
 
             if header in ["KISZÁMLÁZOTT DÍJAK", "ÜGYFÉLSZINTŰ DÍJAK"]:
@@ -249,26 +668,59 @@ def process_vodafone(pdf_bytes: bytes):
             if is_service_section and any(
                 "Kiszámlázott díjak összesen" in line for line in lines
             ):
-                process_service_charges(service_lines_accumulator)
+                with profile_stage("service_charges", i) as record:
+                    record["chars"] = sum(map(len, service_lines_accumulator))
+                    rows = list(
+                        parse_vodafone_service_charges(service_lines_accumulator)
+                    )
                 is_service_section = False
                 service_lines_accumulator = []
+                for row in rows:
+                    yield "service_charges", row
 
             if header == "SZÁMLA":
-                process_invoice_page(text)
+                with profile_stage("invoice_page", i) as record:
+                    record["chars"] = len(text)
+                    rows = list(parse_vodafone_invoice_page(text))
+                for row in rows:
+                    yield "invoice_summary", row
+
+
+def collect_vodafone(events, result: dict):
+    """Passes `iter_vodafone` events through, gathering them into `result`."""
+    result.setdefault("invoice_number", "")
+    for section, value in events:
+        if section == "invoice_number":
+            result["invoice_number"] = value
+        else:
+            result.setdefault(section, []).append(value)
+        yield section, value
 
-    return {
-        "invoice_number": invoice_number,
-        "invoice_summary": invoice_summary_rows,
-        "service_charges": service_charge_rows,
-    }
+
+def process_vodafone(pdf_bytes: bytes):
+    result = {"invoice_number": "", "invoice_summary": [], "service_charges": []}
+    for _ in collect_vodafone(iter_vodafone(pdf_bytes), result):
+        pass
+    return result
 
 
 def extract_tax_ids_from_pdf(file_bytes: bytes, own_tax_id: str):
-    with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
+    import pdfplumber
+
+    with span("pdf_parse"), pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
         if not pdf.pages:
             raise ValueError("Üres vagy hibás PDF.")
         first_page = pdf.pages[0]
-        text = first_page.extract_text() or ""
+        with profile_stage("extract_text", 0) as record:
+            # Szkennelt számlánál OCR, különben a partner az "incomplete" listán marad
+            text = text_or_ocr(
+                first_page.extract_text(),
+                file_bytes,
+                0,
+                "tax_ids",
+                bool(first_page.images),
+            )
+            record["chars"] = len(text)
         tax_ids = re.findall(r"\d{8}-\d{1}-\d{2}", text)
         own_found = None
         partner_found = None
@@ -279,3 +731,93 @@ def extract_tax_ids_from_pdf(file_bytes: bytes, own_tax_id: str):
                 partner_found = tid
                 break
     return own_found, partner_found
+
+
+_TAX_ID_RE = re.compile(r"\d{8}-\d-\d{2}")
+
+INVOICE_PARSERS = {}
+
+
+def _configured_tax_ids() -> dict:
+    # pl. INVOICE_VENDOR_TAX_IDS="vodafone=12345678-2-44,volvo=87654321-2-13"
+    tax_ids = {}
+    for item in os.getenv("INVOICE_VENDOR_TAX_IDS", "").split(","):
+        vendor, _, tax_id = item.partition("=")
+        if vendor.strip() and tax_id.strip():
+            tax_ids.setdefault(vendor.strip(), set()).add(tax_id.strip())
+    return tax_ids
+
+
+def _normalize_marker(marker: str) -> str:
+    return " ".join(marker.lower().split())
+
+
+def register_invoice_parser(
+    vendor: str, parser, tax_ids=(), markers=(), weak_markers=()
+):
+    """
+    Makes `parser(pdf_bytes)` available to `detect_vendor`. A PDF belongs to
+    the vendor if one of `tax_ids` is on its first page, or failing that, by
+    the header texts found there (case-insensitive): each of `markers` scores
+    2, each of `weak_markers` (a bare brand name that other vendors' line
+    items may also mention, e.g. a vehicle make) scores 1.
+    """
+    INVOICE_PARSERS[vendor] = {
+        "parser": parser,
+        "tax_ids": set(tax_ids) | _configured_tax_ids().get(vendor, set()),
+        "markers": tuple(_normalize_marker(marker) for marker in markers),
+        "weak_markers": tuple(_normalize_marker(marker) for marker in weak_markers),
+    }
+
+
+def first_page_text(pdf_bytes: bytes) -> str:
+    # A pdfium szövegrétege layout-elemzés nélkül, a pdfplumber töredékéért
+    import pypdfium2 as pdfium
+
+    with pdfium_lock:
+        pdf = pdfium.PdfDocument(pdf_bytes)
+        try:
+            if len(pdf) == 0:
+                return ""
+            page = pdf[0]
+            textpage = page.get_textpage()
+            try:
+                return textpage.get_text_range()
+            finally:
+                textpage.close()
+                page.close()
+        finally:
+            pdf.close()
+
+
+def detect_vendor(pdf_bytes: bytes) -> str | None:
+    """Vendor of a PDF from its first page text, or None if nothing matches."""
+    with span("pdf_fingerprint"), profile_stage("fingerprint", 0) as record:
+        text = text_or_ocr(first_page_text(pdf_bytes), pdf_bytes, 0, "fingerprint")
+        record["chars"] = len(text)
+
+    tax_ids = set(_TAX_ID_RE.findall(text))
+    for vendor, entry in INVOICE_PARSERS.items():
+        if tax_ids & entry["tax_ids"]:
+            return vendor
+
+    # Pontozás a regisztrációs sorrend helyett; holtversenynél nincs találat
+    normalized = " ".join(text.lower().split())
+    scores = {
+        vendor: 2 * sum(marker in normalized for marker in entry["markers"])
+        + sum(marker in normalized for marker in entry["weak_markers"])
+        for vendor, entry in INVOICE_PARSERS.items()
+    }
+    best = max(scores.values(), default=0)
+    winners = [vendor for vendor, score in scores.items() if score == best]
+    return winners[0] if best and len(winners) == 1 else None
+
+
+# A "Volvo" egy Multialarm flottaszámla tételeiben is szerepelhet
+register_invoice_parser("volvo", process_volvo, weak_markers=("Volvo",))
+register_invoice_parser(
+    "multialarm",
+    process_multialarm,
+    markers=("Multi Alarm", "MultiAlarm", "Menetlevél + útdíj alapszolgáltatás"),
+)
+register_invoice_parser("vodafone", process_vodafone, markers=("Vodafone",))
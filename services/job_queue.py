@@ -0,0 +1,237 @@
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import uuid
+
+JOB_STORE_DIR = os.getenv(
+    "JOB_STORE_DIR", os.path.join(tempfile.gettempdir(), "invoice_jobs")
+)
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", os.path.join(JOB_STORE_DIR, "queue.db"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 600))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", 24 * 3600))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker_id TEXT,
+    lease_until REAL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_status_created ON jobs (status, created_at);
+"""
+
+
+class JobQueue:
+    """
+    Parse/export jobs in a local SQLite file, inputs and results on disk.
+
+    Web workers `submit()` and poll; worker processes (`python worker.py`)
+    `claim()` a job with a lease, which the worker `renew()`s while it runs,
+    so a job whose worker died is picked up again after `JOB_LEASE_SECONDS`,
+    at most `JOB_MAX_ATTEMPTS` times. Every
+    process opens its own short-lived connections; WAL mode lets the web
+    side read while a worker writes.
+    """
+
+    def __init__(self, path: str = JOB_QUEUE_PATH, store_dir: str = JOB_STORE_DIR):
+        self.path = path
+        self.store_dir = store_dir
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            os.makedirs(self.store_dir, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            try:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.executescript(_SCHEMA)
+            finally:
+                connection.close()
+            self._initialized = True
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def job_dir(self, job_id: str) -> str:
+        if not job_id or not all(c.isalnum() for c in job_id):
+            raise KeyError(job_id)
+        return os.path.join(self.store_dir, job_id)
+
+    def source_path(self, job_id: str) -> str:
+        return os.path.join(self.job_dir(job_id), "source")
+
+    def result_path(self, job_id: str) -> str:
+        return os.path.join(self.job_dir(job_id), "result")
+
+    def _write(self, path: str, data: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _to_dict(row) -> dict | None:
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def submit(self, kind: str, params: dict, source: bytes) -> str:
+        job_id = uuid.uuid4().hex
+        connection = self._connect()
+        try:
+            os.makedirs(self.job_dir(job_id), exist_ok=True)
+            self._write(self.source_path(job_id), source)
+            now = time.time()
+            connection.execute(
+                "INSERT INTO jobs (id, kind, params, status, created_at, updated_at)"
+                " VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, json.dumps(params), now, now),
+            )
+        finally:
+            connection.close()
+        return job_id
+
+    def get(self, job_id: str) -> dict | None:
+        connection = self._connect()
+        try:
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        finally:
+            connection.close()
+        return self._to_dict(row)
+
+    def position(self, job_id: str) -> int:
+        """Number of queued jobs ahead of this one."""
+        connection = self._connect()
+        try:
+            return connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at <"
+                " (SELECT created_at FROM jobs WHERE id = ?)",
+                (job_id,),
+            ).fetchone()[0]
+        finally:
+            connection.close()
+
+    def claim(self, worker_id: str) -> dict | None:
+        """Takes the oldest queued (or lease-expired) job, or returns None."""
+        connection = self._connect()
+        try:
+            now = time.time()
+            # BEGIN IMMEDIATE: egyszerre csak egy worker választhat jobot
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute(
+                    "UPDATE jobs SET status = 'failed', updated_at = ?,"
+                    " error = 'A feldolgozás többször megszakadt.'"
+                    " WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                    (now, now, JOB_MAX_ATTEMPTS),
+                )
+                row = connection.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued'"
+                    " OR (status = 'running' AND lease_until < ?)"
+                    " ORDER BY created_at LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    connection.execute("COMMIT")
+                    return None
+                connection.execute(
+                    "UPDATE jobs SET status = 'running', worker_id = ?,"
+                    " lease_until = ?, attempts = attempts + 1, updated_at = ?"
+                    " WHERE id = ?",
+                    (worker_id, now + JOB_LEASE_SECONDS, now, row["id"]),
+                )
+                job = connection.execute(
+                    "SELECT * FROM jobs WHERE id = ?", (row["id"],)
+                ).fetchone()
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        finally:
+            connection.close()
+        return self._to_dict(job)
+
+    def renew(self, job_id: str, worker_id: str) -> bool:
+        """Extends the lease of a running job; False once the worker lost it."""
+        connection = self._connect()
+        try:
+            now = time.time()
+            return (
+                connection.execute(
+                    "UPDATE jobs SET lease_until = ?, updated_at = ?"
+                    " WHERE id = ? AND worker_id = ? AND status = 'running'",
+                    (now + JOB_LEASE_SECONDS, now, job_id, worker_id),
+                ).rowcount
+                == 1
+            )
+        finally:
+            connection.close()
+
+    def _finish(self, job_id: str, worker_id: str, status: str, result, error):
+        connection = self._connect()
+        try:
+            # Csak a lease tulajdonosa zárhatja le (egy lejárt lease-ű worker nem)
+            connection.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, lease_until = NULL,"
+                " updated_at = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (
+                    status,
+                    json.dumps(result) if result is not None else None,
+                    error,
+                    time.time(),
+                    job_id,
+                    worker_id,
+                ),
+            )
+        finally:
+            connection.close()
+
+    def complete(self, job_id: str, worker_id: str, content: bytes, **result):
+        self._write(self.result_path(job_id), content)
+        self._finish(job_id, worker_id, "done", result, None)
+
+    def fail(self, job_id: str, worker_id: str, error: str, **result):
+        self._finish(job_id, worker_id, "failed", result or None, error)
+
+    def sweep(self):
+        """
+        Deletes finished jobs, and queued jobs no worker claimed, (with their
+        files) older than JOB_TTL_SECONDS.
+        """
+        cutoff = time.time() - JOB_TTL_SECONDS
+        connection = self._connect()
+        try:
+            expired = [
+                row["id"]
+                for row in connection.execute(
+                    "SELECT id FROM jobs WHERE status IN ('done', 'failed', 'queued')"
+                    " AND updated_at < ?",
+                    (cutoff,),
+                )
+            ]
+            for job_id in expired:
+                shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+                connection.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        finally:
+            connection.close()
+        return len(expired)
+
+
+job_queue = JobQueue()
@@ -0,0 +1,96 @@
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from services.invoice_convert import InvoiceConversionError, convert_invoice
+from services.job_queue import JOB_LEASE_SECONDS, job_queue
+from services.ocr_service import use_inline_ocr
+
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", 1))
+_SWEEP_INTERVAL_SECONDS = 600
+# A lease-t a lejárta előtt többször is megújítja, egy kihagyott ütem nem gond
+_HEARTBEAT_INTERVAL_SECONDS = JOB_LEASE_SECONDS / 4
+
+_stopping = False
+
+
+def _run_convert(job, source: bytes):
+    params = job["params"]
+    vendor, filename, media_type, content = convert_invoice(
+        source, params.get("vendor"), params["format"]
+    )
+    return content, {"vendor": vendor, "filename": filename, "media_type": media_type}
+
+
+JOB_HANDLERS = {"convert": _run_convert}
+
+
+@contextmanager
+def _lease_heartbeat(job_id: str, worker_id: str, interval: float):
+    """Renews the job's lease in the background while the body runs."""
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(interval):
+            try:
+                if not job_queue.renew(job_id, worker_id):
+                    return
+            except Exception as e:
+                # Pl. zárolt SQLite: a következő ütem újra próbálja
+                print(f"Lease megújítási hiba ({job_id}): {e}")
+
+    thread = threading.Thread(target=beat, name=f"lease-{job_id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(
+    job: dict, worker_id: str, heartbeat_interval: float = _HEARTBEAT_INTERVAL_SECONDS
+):
+    with open(job_queue.source_path(job["id"]), "rb") as f:
+        source = f.read()
+    try:
+        with _lease_heartbeat(job["id"], worker_id, heartbeat_interval):
+            content, result = JOB_HANDLERS[job["kind"]](job, source)
+    except InvoiceConversionError as e:
+        job_queue.fail(job["id"], worker_id, e.detail, status_code=e.status_code)
+    except Exception as e:
+        job_queue.fail(
+            job["id"], worker_id, f"Váratlan hiba történt: {e}", status_code=500
+        )
+    else:
+        job_queue.complete(job["id"], worker_id, content, **result)
+
+
+def _request_stop(signum, frame):
+    global _stopping
+    _stopping = True
+
+
+def serve(poll_interval: float = JOB_POLL_INTERVAL_SECONDS):
+    """One worker process: claims and runs jobs until SIGTERM/SIGINT."""
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+    # A worker processzek száma maga a korlát, nem indítanak külön OCR poolt
+    use_inline_ocr()
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    last_sweep = 0.0
+
+    while not _stopping:
+        if time.monotonic() - last_sweep > _SWEEP_INTERVAL_SECONDS:
+            job_queue.sweep()
+            last_sweep = time.monotonic()
+        job = job_queue.claim(worker_id)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        # A futó jobot leállításkor is befejezi
+        run_job(job, worker_id)
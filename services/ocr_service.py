@@ -0,0 +1,233 @@
+import hashlib
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from services.registry import service_registry
+from utils.metrics import registry, span
+
+OCR_ENABLED = os.getenv("OCR_ENABLED", "1") == "1"
+TESSERACT_CMD = os.getenv("TESSERACT_CMD", "tesseract")
+OCR_LANGUAGES = os.getenv("OCR_LANGUAGES", "hun+eng")
+OCR_DPI = int(os.getenv("OCR_DPI", 300))
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", 1))
+OCR_MAX_PENDING = int(os.getenv("OCR_MAX_PENDING", 8))
+OCR_TIMEOUT_SECONDS = int(os.getenv("OCR_TIMEOUT_SECONDS", 120))
+OCR_MIN_TEXT_CHARS = int(os.getenv("OCR_MIN_TEXT_CHARS", 1))
+OCR_CACHE_DIR = os.getenv(
+    "OCR_CACHE_DIR", os.path.join(tempfile.gettempdir(), "ocr_cache")
+)
+OCR_CACHE_TTL_SECONDS = int(os.getenv("OCR_CACHE_TTL_SECONDS", 30 * 24 * 3600))
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", 256 * 2**20))
+_SWEEP_INTERVAL_SECONDS = 300
+
+ocr_fallback_pages = registry.counter(
+    "app_ocr_fallback_pages_total",
+    "Pages without a usable text layer sent to OCR, by caller and outcome "
+    "(ocr, cache_hit, busy, unavailable, failed).",
+    ["source", "outcome"],
+)
+
+# Egyszerre legfeljebb ennyi oldal vár/fut az OCR poolban
+_pending = threading.BoundedSemaphore(OCR_MAX_PENDING)
+_inline = False
+# A pdfium nem szálbiztos: processzenként egyszerre egy hívás (renderelés,
+# szövegréteg olvasása)
+pdfium_lock = threading.Lock()
+_sweep_lock = threading.Lock()
+_last_sweep = 0.0
+
+
+def _build_ocr_pool():
+    return ProcessPoolExecutor(max_workers=OCR_WORKERS)
+
+
+service_registry.register(
+    "ocr_pool",
+    _build_ocr_pool,
+    close=lambda pool: pool.shutdown(wait=False, cancel_futures=True),
+)
+
+
+def use_inline_ocr():
+    """
+    Pool initializer for worker processes that are already bounded (the batch
+    parse pool): OCR runs in the worker itself instead of spawning a nested
+    OCR pool per worker.
+    """
+    global _inline
+    _inline = True
+
+
+def _cache_path(key: str) -> str:
+    return os.path.join(OCR_CACHE_DIR, f"{key}.txt")
+
+
+def _cache_get(key: str) -> str | None:
+    path = _cache_path(key)
+    try:
+        if os.path.getmtime(path) + OCR_CACHE_TTL_SECONDS < time.time():
+            return None
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        # A találat frissíti a korát: a söprés a legrégebben használtat viszi
+        os.utime(path)
+        return text
+    except FileNotFoundError:
+        return None
+
+
+def _cache_put(key: str, text: str):
+    sweep_ocr_cache()
+    os.makedirs(OCR_CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=OCR_CACHE_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, _cache_path(key))
+
+
+def sweep_ocr_cache(force: bool = False):
+    """
+    Deletes cached pages unused for OCR_CACHE_TTL_SECONDS, then the least
+    recently used ones beyond OCR_CACHE_MAX_BYTES. Runs at most every few
+    minutes per process, from the cache writes.
+    """
+    global _last_sweep
+    now = time.time()
+    with _sweep_lock:
+        if not force and now - _last_sweep < _SWEEP_INTERVAL_SECONDS:
+            return
+        _last_sweep = now
+    try:
+        names = os.listdir(OCR_CACHE_DIR)
+    except FileNotFoundError:
+        return
+
+    entries = []
+    for name in names:
+        path = os.path.join(OCR_CACHE_DIR, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        # Félbehagyott írás (.tmp) csak a kora alapján, a többi méret szerint is
+        max_age = OCR_CACHE_TTL_SECONDS if name.endswith(".txt") else 3600
+        if stat.st_mtime + max_age < now:
+            _remove(path)
+        elif name.endswith(".txt"):
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= OCR_CACHE_MAX_BYTES:
+            break
+        _remove(path)
+        total -= size
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _render_page(pdf_bytes: bytes, page_index: int, dpi: int):
+    import pypdfium2 as pdfium
+
+    with pdfium_lock:
+        pdf = pdfium.PdfDocument(pdf_bytes)
+        try:
+            page = pdf[page_index]
+            try:
+                return page.render(scale=dpi / 72, grayscale=True).to_pil()
+            finally:
+                page.close()
+        finally:
+            pdf.close()
+
+
+def _page_key(image, languages: str, dpi: int) -> str:
+    # A kulcs a renderelt oldal, így ugyanaz a szkennelt oldal más PDF-ben is talál
+    digest = hashlib.sha256(f"{languages}:{dpi}:{image.size}:".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def _tesseract(png: bytes, languages: str, dpi: int) -> str:
+    """OCRs one rendered page image. Runs in the pool; only the PNG is sent."""
+    completed = subprocess.run(
+        [TESSERACT_CMD, "stdin", "stdout", "-l", languages, "--dpi", str(dpi)],
+        input=png,
+        capture_output=True,
+        timeout=OCR_TIMEOUT_SECONDS,
+        check=True,
+        # Egy oldal = egy mag; a párhuzamosságot a pool mérete adja
+        env={**os.environ, "OMP_THREAD_LIMIT": "1"},
+    )
+    return completed.stdout.decode("utf-8", errors="replace")
+
+
+def ocr_page_text(pdf_bytes: bytes, page_index: int, source: str) -> str:
+    """
+    OCR text of one page through the bounded OCR pool, or "" when OCR is
+    disabled, Tesseract is missing, the pool is saturated or OCR fails. The
+    caller then behaves as it did without OCR.
+    """
+    if not OCR_ENABLED or shutil.which(TESSERACT_CMD) is None:
+        ocr_fallback_pages.inc(source=source, outcome="unavailable")
+        return ""
+
+    try:
+        with span("ocr"):
+            # Renderelés és cache itt; a poolba csak az oldal képe megy, nem a PDF
+            image = _render_page(pdf_bytes, page_index, OCR_DPI)
+            key = _page_key(image, OCR_LANGUAGES, OCR_DPI)
+            text = _cache_get(key)
+            cache_hit = text is not None
+            if not cache_hit:
+                png = io.BytesIO()
+                image.save(png, format="PNG")
+                if _inline:
+                    text = _tesseract(png.getvalue(), OCR_LANGUAGES, OCR_DPI)
+                else:
+                    if not _pending.acquire(timeout=OCR_TIMEOUT_SECONDS):
+                        ocr_fallback_pages.inc(source=source, outcome="busy")
+                        return ""
+                    try:
+                        future = service_registry.get("ocr_pool").submit(
+                            _tesseract, png.getvalue(), OCR_LANGUAGES, OCR_DPI
+                        )
+                        text = future.result(timeout=OCR_TIMEOUT_SECONDS)
+                    finally:
+                        _pending.release()
+                _cache_put(key, text)
+    except Exception as e:
+        # CalledProcessError, TimeoutExpired, a pool időtúllépése, hibás PDF
+        print(f"OCR hiba ({source}, {page_index}. oldal): {e}")
+        ocr_fallback_pages.inc(source=source, outcome="failed")
+        return ""
+
+    ocr_fallback_pages.inc(source=source, outcome="cache_hit" if cache_hit else "ocr")
+    return text
+
+
+def text_or_ocr(
+    text: str | None,
+    pdf_bytes: bytes,
+    page_index: int,
+    source: str,
+    has_images: bool = True,
+) -> str:
+    """
+    `text` if the page has a usable text layer, otherwise its OCR text. Pages
+    without images are genuinely empty, not scanned, and are never OCR'd.
+    """
+    if (text and len(text.strip()) >= OCR_MIN_TEXT_CHARS) or not has_images:
+        return text or ""
+    return ocr_page_text(pdf_bytes, page_index, source) or text or ""
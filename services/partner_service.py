@@ -1,7 +1,32 @@
+from sqlalchemy import update
 from sqlmodel import Session, select
-from database.models import Partner
+from database.models import Partner, PartnerEmail, PartnerEmailLink, UploadedInvoice
+
 
 def get_partner_by_tax_number(session: Session, tax_number: str):
     statement = select(Partner).where(Partner.tax_number == tax_number)
     result = session.exec(statement)
-    return result.first()
\ No newline at end of file
+    return result.first()
+
+
+def link_orphan_invoices(session: Session, partner: Partner):
+    statement = (
+        update(UploadedInvoice)
+        .where(
+            UploadedInvoice.partner_id == None,
+            UploadedInvoice.partner_tax_id == partner.tax_number,
+        )
+        .values(partner_id=partner.id)
+        .execution_options(synchronize_session=False)
+    )
+    return session.exec(statement).rowcount
+
+
+def partners_with_to_email():
+    return (
+        select(PartnerEmailLink.partner_id)
+        .join(PartnerEmail, PartnerEmailLink.email_id == PartnerEmail.id)
+        .where(PartnerEmail.type == "to")
+        .distinct()
+        .subquery()
+    )
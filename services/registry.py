@@ -0,0 +1,59 @@
+import threading
+
+
+class ServiceRegistry:
+    """
+    Lazily built, process-wide service clients (DB engine, blob, email).
+
+    Modules register a factory at import time, which is cheap; the client is
+    only created on the first `get()` or when `warm_up()` runs in lifespan.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._closers = {}
+        self._instances = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory, close=None):
+        self._factories[name] = factory
+        if close is not None:
+            self._closers[name] = close
+
+    def get(self, name: str):
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                if name not in self._factories:
+                    raise KeyError(f"Nincs regisztrálva ilyen szolgáltatás: {name}")
+                instance = self._instances[name] = self._factories[name]()
+            return instance
+
+    def is_initialized(self, name: str) -> bool:
+        return name in self._instances
+
+    def warm_up(self, *names: str):
+        for name in names:
+            self.get(name)
+
+    def close_all(self):
+        with self._lock:
+            instances = list(self._instances.items())
+            self._instances.clear()
+        for name, instance in instances:
+            close = self._closers.get(name)
+            if close is not None:
+                close(instance)
+
+    def reset(self, name: str = None):
+        with self._lock:
+            if name is None:
+                self._instances.clear()
+            else:
+                self._instances.pop(name, None)
+
+
+service_registry = ServiceRegistry()
@@ -0,0 +1,259 @@
+import json
+import os
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, delete, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, func, select
+
+from database.models import (
+    InvoiceDeleteOutbox,
+    SendPartnerState,
+    SendRun,
+    SendRunPartner,
+    SendRunStatus,
+    UploadedInvoice,
+)
+from services.blob_service import delete_blobs_from_urls
+from services.partner_service import partners_with_to_email
+from utils.sql_helpers import chunked
+
+# Ennyi idő után egy elakadt (pl. összeomlott) worker partnerét más átveheti
+SEND_CLAIM_TTL_SECONDS = int(os.getenv("SEND_CLAIM_TTL_SECONDS", 900))
+
+_OPERATION_NAMESPACE = uuid.UUID("5b0f3c1e-8a57-4d3b-9a49-6f0d2d1c7e10")
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _delivered_invoice_ids():
+    # Bármelyik futás kézbesítette: a törlése még folyamatban lehet
+    return select(InvoiceDeleteOutbox.invoice_id)
+
+
+def get_or_create_run(
+    session: Session, idempotency_key: str, subject: str, message: str
+) -> tuple[SendRun, bool]:
+    """
+    Returns the run for `idempotency_key`, creating it with a snapshot of the
+    invoices to send per partner. Invoices uploaded later belong to a new run.
+    """
+    statement = select(SendRun).where(SendRun.idempotency_key == idempotency_key)
+    run = session.exec(statement).first()
+    if run is not None:
+        return run, False
+
+    run = SendRun(idempotency_key=idempotency_key, subject=subject, message=message)
+    session.add(run)
+    try:
+        session.flush()
+    except IntegrityError:
+        # Egy párhuzamos kérés ugyanezzel a kulccsal megelőzött
+        session.rollback()
+        return session.exec(statement).one(), False
+
+    to_partners = partners_with_to_email()
+    rows = session.exec(
+        select(UploadedInvoice.partner_id, UploadedInvoice.id)
+        .join(to_partners, UploadedInvoice.partner_id == to_partners.c.partner_id)
+        .where(UploadedInvoice.id.not_in(_delivered_invoice_ids()))
+        .order_by(UploadedInvoice.partner_id, UploadedInvoice.id)
+    ).all()
+    invoice_ids = defaultdict(list)
+    for partner_id, invoice_id in rows:
+        invoice_ids[partner_id].append(invoice_id)
+
+    session.add_all(
+        SendRunPartner(
+            run_id=run.id, partner_id=partner_id, invoice_ids=json.dumps(ids)
+        )
+        for partner_id, ids in invoice_ids.items()
+    )
+    session.commit()
+    session.refresh(run)
+    return run, True
+
+
+def _claimable(run_id: int, stale_before: datetime):
+    return and_(
+        SendRunPartner.run_id == run_id,
+        or_(
+            SendRunPartner.state.in_(
+                [SendPartnerState.pending, SendPartnerState.failed]
+            ),
+            and_(
+                SendRunPartner.state == SendPartnerState.claimed,
+                SendRunPartner.claimed_at < stale_before,
+            ),
+        ),
+    )
+
+
+def claim_partners(
+    session: Session, run: SendRun, worker_id: str, limit: int | None = None
+) -> list[SendRunPartner]:
+    """
+    Claims unsent partners of the run for `worker_id`. Every row is taken with
+    a conditional UPDATE, so concurrent workers never get the same partner.
+    """
+    now = _now()
+    stale_before = now - timedelta(seconds=SEND_CLAIM_TTL_SECONDS)
+    candidates = session.exec(
+        select(SendRunPartner.id)
+        .where(_claimable(run.id, stale_before))
+        .order_by(SendRunPartner.id)
+        .limit(limit)
+    ).all()
+
+    claimed_ids = []
+    for claim_id in candidates:
+        result = session.exec(
+            update(SendRunPartner)
+            .where(SendRunPartner.id == claim_id, _claimable(run.id, stale_before))
+            .values(
+                state=SendPartnerState.claimed,
+                claimed_by=worker_id,
+                claimed_at=now,
+                attempts=SendRunPartner.attempts + 1,
+                updated_at=now,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            claimed_ids.append(claim_id)
+    session.commit()
+
+    return [
+        claim
+        for ids in chunked(claimed_ids)
+        for claim in session.exec(
+            select(SendRunPartner).where(SendRunPartner.id.in_(ids))
+        ).all()
+    ]
+
+
+def unsent_invoices(session: Session, claim: SendRunPartner):
+    """
+    Invoices of the claim that are neither delivered (in any run's outbox)
+    nor deleted yet.
+    """
+    # A pillanatkép id-listája növekvő, így a darabok sorrendje is az
+    return [
+        invoice
+        for ids in chunked(json.loads(claim.invoice_ids))
+        for invoice in session.exec(
+            select(
+                UploadedInvoice.id, UploadedInvoice.filename, UploadedInvoice.blob_url
+            )
+            .where(
+                UploadedInvoice.id.in_(ids),
+                UploadedInvoice.id.not_in(_delivered_invoice_ids()),
+            )
+            .order_by(UploadedInvoice.id)
+        ).all()
+    ]
+
+
+def operation_id_for(run: SendRun, partner_id: int, invoice_ids) -> str:
+    # Ugyanaz a köteg újraküldéskor ugyanazt az ACS Operation-Id-t kapja
+    batch = ",".join(str(invoice_id) for invoice_id in invoice_ids)
+    return str(
+        uuid.uuid5(_OPERATION_NAMESPACE, f"{run.idempotency_key}:{partner_id}:{batch}")
+    )
+
+
+def record_delivered(session: Session, run: SendRun, invoices):
+    """Queues the delivered invoices for blob + row deletion (outbox)."""
+    session.add_all(
+        InvoiceDeleteOutbox(
+            run_id=run.id, invoice_id=invoice.id, blob_url=invoice.blob_url
+        )
+        for invoice in invoices
+    )
+    session.commit()
+
+
+def finish_partner(
+    session: Session, claim_id: int, worker_id: str, error: str | None = None
+):
+    session.exec(
+        update(SendRunPartner)
+        .where(SendRunPartner.id == claim_id, SendRunPartner.claimed_by == worker_id)
+        .values(
+            state=SendPartnerState.failed if error else SendPartnerState.sent,
+            error=error,
+            updated_at=_now(),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    session.commit()
+
+
+def drain_outbox(session: Session, run_id: int | None = None, limit: int = 1000):
+    """
+    Deletes the blobs of delivered invoices, then their rows, in one pass.
+    Safe to run from several workers: a missing blob or row counts as deleted.
+    """
+    statement = select(InvoiceDeleteOutbox).order_by(InvoiceDeleteOutbox.id)
+    if run_id is not None:
+        statement = statement.where(InvoiceDeleteOutbox.run_id == run_id)
+    entries = session.exec(statement.limit(limit)).all()
+    if not entries:
+        return 0, 0
+
+    failures = dict(delete_blobs_from_urls([entry.blob_url for entry in entries]))
+    done = [entry for entry in entries if entry.blob_url not in failures]
+    for entry in entries:
+        if entry.blob_url in failures:
+            entry.attempts += 1
+            entry.error = failures[entry.blob_url]
+            session.add(entry)
+
+    if done:
+        session.exec(
+            delete(UploadedInvoice).where(
+                UploadedInvoice.id.in_([entry.invoice_id for entry in done])
+            )
+        )
+        session.exec(
+            delete(InvoiceDeleteOutbox).where(
+                InvoiceDeleteOutbox.id.in_([entry.id for entry in done])
+            )
+        )
+    session.commit()
+    return len(done), len(entries) - len(done)
+
+
+def refresh_run_status(session: Session, run: SendRun) -> dict:
+    unsent = session.exec(
+        select(func.count(SendRunPartner.id)).where(
+            SendRunPartner.run_id == run.id,
+            SendRunPartner.state != SendPartnerState.sent,
+        )
+    ).one()
+    undeleted = session.exec(
+        select(func.count(InvoiceDeleteOutbox.id)).where(
+            InvoiceDeleteOutbox.run_id == run.id
+        )
+    ).one()
+
+    status = (
+        SendRunStatus.completed
+        if not unsent and not undeleted
+        else SendRunStatus.running
+    )
+    if run.status != status:
+        run.status = status
+        run.updated_at = _now()
+        session.add(run)
+        session.commit()
+    return {
+        "idempotency_key": run.idempotency_key,
+        "status": status,
+        "unsent_partners": unsent,
+        "pending_deletes": undeleted,
+    }
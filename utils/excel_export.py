@@ -1,12 +1,75 @@
-import re
-import pandas as pd
 from io import BytesIO
 
+# A munkafüzet-cache kulcsának része: minden olyan változtatásnál növelni kell,
+# ami a generált XLSX tartalmát módosítja
+EXCEL_EXPORT_VERSION = 1
 
-def export_volvo_to_excel_bytes(data):
-    if not data:
-        return None
-    df = pd.DataFrame(data)
+VODAFONE_SUMMARY_COLUMNS = [
+    "Megnevezés",
+    "Mennyiség",
+    "Mennyiségi egység",
+    "Egységár (Ft)",
+    "TESZOR szám",
+    "ÁFA kulcs",
+    "Nettó összeg (Ft)",
+    "ÁFA összeg (Ft)",
+    "Bruttó összeg (Ft)",
+]
+VODAFONE_SERVICE_CHARGE_COLUMNS = [
+    "PhoneNumber",
+    "Description",
+    "TESZOR",
+    "TotalAmount",
+    "VATAmount",
+    "VATRate",
+    "NetAmount",
+]
+VODAFONE_PIVOT_INDEX = [
+    "PhoneNumber",
+    "Employee",
+    "Cost Center",
+    "Axapta Name",
+    "Monogram",
+    "VATRate",
+    "Title",
+    "VatCode",
+    "LedgerAccount",
+]
+VODAFONE_PIVOT_VALUES = ["NetAmount", "VATAmount"]
+VODAFONE_CATEGORICAL_COLUMNS = ("PhoneNumber", "Description", "TESZOR", "VATRate")
+# Számlánként/járművenként ismétlődő szövegek: kódolt (categorical) oszlopként
+INVOICE_CATEGORICAL_COLUMNS = (
+    "invoice_number",
+    "invoice_date",
+    "payment_due",
+    "performance_date",
+    "period_start",
+    "period_end",
+    "license_plate",
+)
+
+
+def _records_to_dataframe(data, categorical=()):
+    """`pd.DataFrame(data)`, with the `categorical` columns built as categoricals."""
+    import pandas as pd
+
+    columns = dict.fromkeys(key for row in data for key in row)
+    return pd.DataFrame(
+        {
+            column: (
+                pd.Categorical([row.get(column) for row in data])
+                if column in categorical
+                else [row.get(column) for row in data]
+            )
+            for column in columns
+        }
+    )
+
+
+def volvo_to_dataframe(data):
+    import pandas as pd
+
+    df = _records_to_dataframe(data, INVOICE_CATEGORICAL_COLUMNS)
     for col in [
         "period_start",
         "period_end",
@@ -26,18 +89,13 @@ def export_volvo_to_excel_bytes(data):
         .astype(float)
     )
     df["vat"] = (df["net"] * 0.27).round(0)
-    output = BytesIO()
-    df.to_excel(output, index=False)
-    output.seek(0)
-
-    return output
+    return df
 
 
-def export_multialarm_to_excel_bytes(data):
-    if not data:
-        return None
+def multialarm_to_dataframe(data):
+    import pandas as pd
 
-    df = pd.DataFrame(data)
+    df = _records_to_dataframe(data, INVOICE_CATEGORICAL_COLUMNS)
     for col in [
         "period_start",
         "period_end",
@@ -49,138 +107,216 @@ def export_multialarm_to_excel_bytes(data):
             df[col] = pd.to_datetime(df[col], format="%Y.%m.%d")
         except Exception:
             df[col] = df[col]
+    return df
 
+
+def export_volvo_to_excel_bytes(data):
+    if not data:
+        return None
     output = BytesIO()
-    df.to_excel(output, index=False)
+    volvo_to_dataframe(data).to_excel(output, index=False)
     output.seek(0)
 
     return output
 
 
-def export_vodafone_to_excel_bytes(
-    result, phone_user_map, teszor_category_map, mapping_lookup
+def export_multialarm_to_excel_bytes(data):
+    if not data:
+        return None
+
+    output = BytesIO()
+    multialarm_to_dataframe(data).to_excel(output, index=False)
+    output.seek(0)
+
+    return output
+
+
+def export_sheets_to_excel_bytes(sheets):
+    """Writes [(sheet_name, DataFrame), ...] into one workbook."""
+    import pandas as pd
+
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        for sheet_name, df in sheets:
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+    output.seek(0)
+
+    return output
+
+
+def _rows_to_dataframe(rows, columns, categorical=()):
+    import pandas as pd
+
+    if not rows:
+        return pd.DataFrame(columns=columns)
+    # Oszloponként épül a slotolt sorokból, soronkénti lista/tuple másolat nélkül
+    fields = type(rows[0]).__slots__
+    data = {}
+    for column, field in zip(columns, fields):
+        values = [getattr(row, field) for row in rows]
+        data[column] = pd.Categorical(values) if column in categorical else values
+    return pd.DataFrame(data)
+
+
+def _first_positions(codes):
+    """Row of the first occurrence of every `pd.factorize` code (codes are
+    numbered in order of appearance, so that is where the running max grows)."""
+    import numpy as np
+
+    previous_max = np.maximum.accumulate(np.concatenate(([-1], codes[:-1])))
+    return np.flatnonzero(codes > previous_max)
+
+
+def _combination_codes(columns):
+    """`pd.factorize` codes of the value combinations across `columns` (NaN included)."""
+    import numpy as np
+    import pandas as pd
+
+    combo = np.zeros(len(columns[0]), dtype=np.int64)
+    for column in columns:
+        codes, uniques = pd.factorize(column, use_na_sentinel=False)
+        combo = combo * len(uniques) + codes
+    return pd.factorize(combo)[0]
+
+
+def _map_categories(columns, mapper):
+    """
+    `mapper(*values)` called once per distinct combination of `columns`
+    instead of once per row; the result is a categorical column.
+    """
+    import pandas as pd
+
+    codes = _combination_codes(columns)
+    first = _first_positions(codes)
+    mapped = pd.Categorical(
+        [
+            mapper(*values)
+            for values in zip(*(column.to_numpy()[first] for column in columns))
+        ]
+    )
+    return pd.Categorical.from_codes(mapped.codes[codes], dtype=mapped.dtype)
+
+
+def vodafone_pivot(df):
+    """
+    The "Pivot" sheet: NetAmount/VATAmount summed per VODAFONE_PIVOT_INDEX,
+    identical to `pd.pivot_table(..., aggfunc="sum", fill_value=0)`.
+
+    In a `vodafone_charges_dataframe` frame every pivot key is derived from
+    (PhoneNumber, TESZOR, VATRate), so rows are hashed on that triple once,
+    the keys (with the "Központi" rewrites) are built per distinct triple, and
+    the sums come from one groupby on an integer group id, in row order like
+    pivot_table's.
+    """
+    import numpy as np
+    import pandas as pd
+
+    combo_codes = _combination_codes([df["PhoneNumber"], df["TESZOR"], df["VATRate"]])
+    keys = df[VODAFONE_PIVOT_INDEX].iloc[_first_positions(combo_codes)]
+    keys = keys.reset_index(drop=True)
+    # A kis kulcstáblán sima szöveg: az átírt értékek nem kategóriák, és a
+    # rendezés az értékek szerint menjen, ne a kategóriasorrend szerint
+    for column in VODAFONE_PIVOT_INDEX:
+        if isinstance(keys[column].dtype, pd.CategoricalDtype):
+            keys[column] = keys[column].astype(keys[column].cat.categories.dtype)
+
+    central = keys["Employee"] == "Központi"
+    phone = keys["PhoneNumber"]
+    keys.loc[
+        central & (phone.isna() | (phone == "") | (phone == "N/A")), "PhoneNumber"
+    ] = "Központi"
+    keys.loc[central, "Axapta Name"] = "N/A"
+
+    # Rendezett csoportsorszám, a hiányzó kulcsú kombinációk kimaradnak (-1)
+    group_ids = keys.groupby(VODAFONE_PIVOT_INDEX, sort=True).ngroup()
+    group_ids = group_ids.fillna(-1).to_numpy(dtype=np.intp)
+    row_groups = group_ids[combo_codes]
+    kept = row_groups >= 0
+
+    sums = df.loc[kept, VODAFONE_PIVOT_VALUES].groupby(row_groups[kept]).sum()
+    valid = np.flatnonzero(group_ids >= 0)
+    _, group_first = np.unique(group_ids[valid], return_index=True)
+
+    pivot = keys.iloc[valid[group_first]].reset_index(drop=True)
+    for column in VODAFONE_PIVOT_VALUES:
+        pivot[column] = sums[column].to_numpy()
+    return pivot
+
+
+_UNKNOWN_LEDGER_MAPPING = {
+    "Title": "Ismeretlen",
+    "VatCode": "Ismeretlen",
+    "LedgerAccount": "Ismeretlen",
+}
+
+
+def _or_na(value):
+    import pandas as pd
+
+    return "N/A" if value is None or pd.isna(value) else value
+
+
+def vodafone_charges_dataframe(
+    service_charges, phone_user_map, teszor_category_map, mapping_lookup
 ):
-    def extract_mapping_info(row):
-        key = (row["TESZOR"], row["VATRate"])
-        return pd.Series(
-            mapping_lookup.get(
-                key,
-                {
-                    "Title": "Ismeretlen",
-                    "VatCode": "Ismeretlen",
-                    "LedgerAccount": "Ismeretlen",
-                },
-            )
+    """The "ServiceCharges" sheet: the parsed rows enriched with user and ledger data."""
+    df_charges = _rows_to_dataframe(
+        service_charges, VODAFONE_SERVICE_CHARGE_COLUMNS, VODAFONE_CATEGORICAL_COLUMNS
+    )
+    # Előfizetőnként/TESZOR-onként egyszer, nem soronként
+    phone_numbers = [df_charges["PhoneNumber"]]
+    for column, field in (
+        ("Employee", "name"),
+        ("Cost Center", "cost_center"),
+        ("Monogram", "monogram"),
+        ("Axapta Name", "axapta_name"),
+    ):
+        df_charges[column] = _map_categories(
+            phone_numbers,
+            lambda pn, field=field: phone_user_map.get(pn, {}).get(field, "N/A"),
         )
 
-    def _clean_float(value):
-        try:
-            cleaned = value.replace(".", "").replace(",", ".").strip()
-            return float(cleaned) if re.match(r"^-?\d+(\.\d+)?$", cleaned) else None
-        except Exception:
-            return None
+    df_charges["LedgerTitle"] = _map_categories(
+        [df_charges["TESZOR"]], lambda teszor: _or_na(teszor_category_map.get(teszor))
+    )
+
+    ledger_keys = [df_charges["TESZOR"], df_charges["VATRate"]]
+    for column in ("Title", "VatCode", "LedgerAccount"):
+        df_charges[column] = _map_categories(
+            ledger_keys,
+            lambda teszor, vat_rate, column=column: mapping_lookup.get(
+                (teszor, vat_rate), _UNKNOWN_LEDGER_MAPPING
+            )[column],
+        )
+    return df_charges
+
+
+def export_vodafone_to_excel_bytes(
+    result, phone_user_map, teszor_category_map, mapping_lookup
+):
+    import pandas as pd
 
     excel_buffer = BytesIO()
 
     with pd.ExcelWriter(excel_buffer, engine="openpyxl") as writer:
         if result["invoice_summary"]:
-            df_summary = pd.DataFrame(
-                result["invoice_summary"],
-                columns=[
-                    "Megnevezés",
-                    "Mennyiség",
-                    "Mennyiségi egység",
-                    "Egységár (Ft)",
-                    "TESZOR szám",
-                    "ÁFA kulcs",
-                    "Nettó összeg (Ft)",
-                    "ÁFA összeg (Ft)",
-                    "Bruttó összeg (Ft)",
-                ],
+            # Az összegek már a feldolgozáskor float-tá alakultak
+            df_summary = _rows_to_dataframe(
+                result["invoice_summary"], VODAFONE_SUMMARY_COLUMNS
             )
-
-            for col in [
-                "Egységár (Ft)",
-                "Nettó összeg (Ft)",
-                "ÁFA összeg (Ft)",
-                "Bruttó összeg (Ft)",
-            ]:
-                df_summary[col] = (
-                    df_summary[col]
-                    .astype(str)
-                    .str.replace(".", "", regex=False)
-                    .str.replace(",", ".", regex=False)
-                    .astype(float)
-                )
-
             df_summary.to_excel(writer, sheet_name="InvoiceSummary", index=False)
 
         if result["service_charges"]:
-            df_charges = pd.DataFrame(
+            df = vodafone_charges_dataframe(
                 result["service_charges"],
-                columns=[
-                    "PhoneNumber",
-                    "Description",
-                    "TESZOR",
-                    "TotalAmount",
-                    "VATAmount",
-                    "VATRate",
-                    "NetAmount",
-                ],
+                phone_user_map,
+                teszor_category_map,
+                mapping_lookup,
             )
-            df_charges["Employee"] = df_charges["PhoneNumber"].map(
-                lambda pn: phone_user_map.get(pn, {}).get("name", "N/A")
-            )
-            df_charges["Cost Center"] = df_charges["PhoneNumber"].map(
-                lambda pn: phone_user_map.get(pn, {}).get("cost_center", "N/A")
-            )
-            df_charges["Monogram"] = df_charges["PhoneNumber"].map(
-                lambda pn: phone_user_map.get(pn, {}).get("monogram", "N/A")
-            )
-            df_charges["Axapta Name"] = df_charges["PhoneNumber"].map(
-                lambda pn: phone_user_map.get(pn, {}).get("axapta_name", "N/A")
-            )
-
-            df_charges["LedgerTitle"] = (
-                df_charges["TESZOR"].map(teszor_category_map).fillna("N/A")
-            )
-
-            title_df = df_charges.apply(extract_mapping_info, axis=1)
-            df = pd.concat([df_charges, title_df], axis=1)
-
-            for col in ["NetAmount", "VATAmount", "TotalAmount"]:
-                df[col] = df_charges[col].apply(_clean_float)
-
             df.to_excel(writer, sheet_name="ServiceCharges", index=False)
 
-            # df.loc[df["Employee"] == "Központi", "PhoneNumber"] = "N/A"
-            mask = (df["Employee"] == "Központi") & (
-                df["PhoneNumber"].isna()
-                | (df["PhoneNumber"] == "")
-                | (df["PhoneNumber"] == "N/A")
-            )
-            df.loc[mask, "PhoneNumber"] = "Központi"
-            df.loc[df["Employee"] == "Központi", "Axapta Name"] = "N/A"
-
             if not df.empty:
-                pivot_df = pd.pivot_table(
-                    df,
-                    index=[
-                        "PhoneNumber",
-                        "Employee",
-                        "Cost Center",
-                        "Axapta Name",
-                        "Monogram",
-                        "VATRate",
-                        "Title",
-                        "VatCode",
-                        "LedgerAccount",
-                    ],
-                    values=["NetAmount", "VATAmount"],
-                    aggfunc="sum",
-                    fill_value=0,
-                ).reset_index()
-                pivot_df.to_excel(writer, sheet_name="Pivot", index=False)
+                vodafone_pivot(df).to_excel(writer, sheet_name="Pivot", index=False)
 
     excel_buffer.seek(0)
     return excel_buffer
@@ -0,0 +1,68 @@
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, at most `capacity`
+    stored. `pause()` empties the bucket and holds every caller back, which is
+    how a server-side Retry-After is shared between concurrent senders.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def try_acquire(self) -> float:
+        """Takes a token and returns 0, or returns how long to wait for one."""
+        with self._lock:
+            now = self._clock()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, sleep=time.sleep):
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            sleep(wait)
+
+    def pause(self, seconds: float):
+        with self._lock:
+            now = self._clock()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = 0
+            self._updated = max(self._updated, self._paused_until)
+
+
+def parse_retry_after(value, default: float = 1.0) -> float:
+    """Seconds from a Retry-After header (delta-seconds or HTTP date)."""
+    if value is None:
+        return default
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
@@ -0,0 +1,241 @@
+import json
+import re
+from datetime import datetime
+from io import BytesIO
+
+from fastapi import HTTPException, status
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+from middleware.response_cache import etag_matches
+from utils.excel_export import (
+    VODAFONE_SERVICE_CHARGE_COLUMNS,
+    VODAFONE_SUMMARY_COLUMNS,
+)
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+FORMATS = {
+    "xlsx": XLSX_MEDIA_TYPE,
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+_MEDIA_TYPE_FORMATS = {
+    XLSX_MEDIA_TYPE: "xlsx",
+    "application/json": "json",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/vnd.apache.parquet": "parquet",
+    "application/x-parquet": "parquet",
+    "application/parquet": "parquet",
+}
+
+
+def negotiate_format(accept: str | None, requested: str | None = None) -> str:
+    """
+    Picks the output format from `?format=` or the Accept header.
+
+    XLSX stays the default: an Accept header that also allows */* (browsers,
+    axios) is treated as "anything", so only explicit clients get JSON etc.
+    """
+    if requested:
+        if requested not in FORMATS:
+            raise HTTPException(
+                status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                detail=f"Nem támogatott formátum: {requested}",
+            )
+        return requested
+    if not accept:
+        return "xlsx"
+
+    candidates = []
+    for position, item in enumerate(accept.split(",")):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            candidates.append((-quality, position, media_type.lower()))
+
+    media_types = [media_type for _, _, media_type in sorted(candidates)]
+    if not media_types or any(m in ("*/*", "application/*") for m in media_types):
+        return "xlsx"
+    for media_type in media_types:
+        if media_type in _MEDIA_TYPE_FORMATS:
+            return _MEDIA_TYPE_FORMATS[media_type]
+    raise HTTPException(
+        status_code=status.HTTP_406_NOT_ACCEPTABLE,
+        detail=f"Elérhető formátumok: {', '.join(FORMATS.values())}",
+    )
+
+
+def parse_amount(value):
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        cleaned = value.replace(" ", "").replace(".", "").replace(",", ".").strip()
+        return float(cleaned) if re.match(r"^-?\d+(\.\d+)?$", cleaned) else None
+    except Exception:
+        return None
+
+
+def _iso_date(value: str, date_format: str):
+    try:
+        return datetime.strptime(value.rstrip("."), date_format).date().isoformat()
+    except (AttributeError, ValueError):
+        return value
+
+
+def _normalize_dates(rows, date_format: str):
+    date_columns = (
+        "period_start",
+        "period_end",
+        "invoice_date",
+        "payment_due",
+        "performance_date",
+    )
+    for row in rows:
+        normalized = dict(row)
+        for column in date_columns:
+            if column in normalized:
+                normalized[column] = _iso_date(normalized[column], date_format)
+        yield normalized
+
+
+def volvo_records(data):
+    # Ugyanazok a mezők, mint az XLSX exportban (net számként, vat = net * 27%)
+    for row in _normalize_dates(data, "%d-%m-%Y"):
+        row["net"] = parse_amount(row["net"])
+        row["vat"] = round(row["net"] * 0.27) if row["net"] is not None else None
+        yield row
+
+
+def multialarm_records(data):
+    yield from _normalize_dates(data, "%Y.%m.%d")
+
+
+_VODAFONE_SECTION_COLUMNS = {
+    "invoice_summary": VODAFONE_SUMMARY_COLUMNS,
+    "service_charges": VODAFONE_SERVICE_CHARGE_COLUMNS,
+}
+
+
+def _vodafone_record(section: str, invoice_number: str, row) -> dict:
+    # A sorok összegei már a feldolgozáskor float-tá alakultak
+    record = {"section": section, "invoice_number": invoice_number}
+    record.update(zip(_VODAFONE_SECTION_COLUMNS[section], row))
+    return record
+
+
+def vodafone_records(result):
+    """Flat records of both Vodafone sections, tagged with a `section` field."""
+    invoice_number = result["invoice_number"]
+    for section in _VODAFONE_SECTION_COLUMNS:
+        for row in result[section]:
+            yield _vodafone_record(section, invoice_number, row)
+
+
+def vodafone_event_records(events):
+    """Same records from `iter_vodafone` events, in page order, while parsing."""
+    invoice_number = ""
+    for section, value in events:
+        if section == "invoice_number":
+            invoice_number = value
+        else:
+            yield _vodafone_record(section, invoice_number, value)
+
+
+def _dumps(record) -> str:
+    return json.dumps(record, ensure_ascii=False, default=str)
+
+
+def _ndjson_lines(records):
+    for record in records:
+        yield (_dumps(record) + "\n").encode("utf-8")
+
+
+def records_to_parquet_bytes(records) -> BytesIO:
+    import pandas as pd
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise HTTPException(
+            status_code=status.HTTP_406_NOT_ACCEPTABLE,
+            detail="A Parquet export nem elérhető (hiányzó pyarrow csomag).",
+        )
+
+    output = BytesIO()
+    pd.DataFrame(list(records)).to_parquet(output, index=False)
+    output.seek(0)
+    return output
+
+
+def _json_array(records) -> str:
+    return "[" + ",".join(_dumps(record) for record in records) + "]"
+
+
+def records_to_bytes(fmt: str, records) -> bytes:
+    """The same bodies as `records_response`, fully rendered (for stored results)."""
+    if fmt == "json":
+        return _json_array(records).encode("utf-8")
+    if fmt == "ndjson":
+        return b"".join(_ndjson_lines(records))
+    if fmt == "parquet":
+        return records_to_parquet_bytes(records).getvalue()
+    raise ValueError(f"Unsupported format: {fmt}")
+
+
+def records_response(fmt: str, records, filename_base: str, headers: dict = None):
+    """Renders parsed rows as JSON, NDJSON or Parquet (everything but XLSX)."""
+    headers = dict(headers or {})
+    if fmt == "json":
+        return Response(
+            _json_array(records), media_type=FORMATS["json"], headers=headers
+        )
+    if fmt == "ndjson":
+        return StreamingResponse(
+            _ndjson_lines(records), media_type=FORMATS["ndjson"], headers=headers
+        )
+    if fmt == "parquet":
+        headers["Content-Disposition"] = (
+            f'attachment; filename="{filename_base}.parquet"'
+        )
+        return StreamingResponse(
+            records_to_parquet_bytes(records),
+            media_type=FORMATS["parquet"],
+            headers=headers,
+        )
+    raise ValueError(f"Unsupported format: {fmt}")
+
+
+def workbook_response(
+    workbook: dict,
+    headers: dict = None,
+    if_none_match: str | None = None,
+    filename: str | None = None,
+):
+    """
+    A workbook cache entry as a download: ETag, Content-Length and byte
+    ranges (If-Range is checked against the ETag), or 304 when
+    `if_none_match` matches. Only pass `if_none_match` for GET requests.
+    """
+    headers = {
+        "ETag": workbook["etag"],
+        "X-Workbook-Id": workbook["key"],
+        **(headers or {}),
+    }
+    if etag_matches(if_none_match, workbook["etag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return FileResponse(
+        workbook["path"],
+        media_type=XLSX_MEDIA_TYPE,
+        filename=filename or workbook["filename"],
+        headers=headers,
+    )
@@ -0,0 +1,9 @@
+# Az MSSQL legfeljebb 2100 paramétert fogad el egy utasításban
+MAX_IN_PARAMS = 1000
+
+
+def chunked(values, size: int = MAX_IN_PARAMS):
+    """`values` in lists of at most `size`, for IN (...) filters."""
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start : start + size]
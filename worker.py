@@ -0,0 +1,50 @@
+"""
+Out-of-process parse/export worker.
+
+    python worker.py [--processes 2]
+
+Consumes the jobs the web workers put on the local SQLite queue
+(services/job_queue.py) and writes results next to them on disk. Scale it
+independently of uvicorn's `--workers`; both sides only need to share
+JOB_STORE_DIR (and JOB_QUEUE_PATH).
+"""
+
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+import argparse
+import multiprocessing
+import os
+import signal
+
+from services.job_worker import serve
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--processes", type=int, default=int(os.getenv("JOB_WORKER_PROCESSES", 2))
+    )
+    args = parser.parse_args()
+
+    processes = [
+        multiprocessing.Process(target=serve, name=f"job-worker-{i}")
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    def stop(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()